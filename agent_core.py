@@ -5,27 +5,71 @@ Implements the AI agent for GoodFoods restaurant chain reservations.
 Uses Model Context Protocol (MCP) for tool calling and llama-3.3-8b via Groq API.
 """
 
+import copy
 import os
 import json
 import requests
 import random
+import sys
+import uuid
+import time
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
 
 # Import MCP server
+from data_paths import data_path
 from mcp_server import create_mcp_server
+from branch_resolver import BranchResolver
+from idempotency import get_idempotency_index
+from slot_parser import annotate, normalize_date, normalize_party_size, normalize_phone, normalize_time
+from metrics import REGISTRY
+from profiling import profile
+from single_flight import SingleFlight, make_key
+from llm_scheduler import PRIORITY_BOOKING, PRIORITY_BROWSING, BusyError, get_scheduler
+from tool_selection import COLLECTING_DETAILS, CONFIRMING, MANAGING, ToolSelector, infer_state
+from tracing import Span, current_span, span, traced
+from waitlist import WaitlistFull, get_waitlist
+
+CHAT_TURN_SECONDS = REGISTRY.histogram("goodfoods_chat_turn_seconds", "End-to-end latency of Agent.chat", ["outcome"])
+LLM_REQUEST_SECONDS = REGISTRY.histogram("goodfoods_llm_request_seconds", "Latency of chat completion requests", ["model", "status"])
+LLM_TOKENS = REGISTRY.counter("goodfoods_llm_tokens_total", "Tokens reported in LLM usage blocks", ["model", "kind"])
+TOOL_SCHEMA_TOKENS = REGISTRY.counter("goodfoods_tool_schema_tokens_total", "Estimated tool schema tokens sent and saved by tool selection", ["kind"])
+PROMPT_CACHE_REQUESTS = REGISTRY.counter("goodfoods_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
 
 # --- GOODFOODS BRANCH DATA LOADER ---
 
+BRANCHES_FILE = data_path('goodfoods_branches.json')
+
+# Compiled catalog produced by catalog_compiler.py; used when present and
+# at least as new as the JSON file
+COMPILED_CATALOG_FILE = os.environ.get("GOODFOODS_CATALOG", data_path('goodfoods_branches.gfcat'))
+
 def load_branches() -> List[Dict[str, Any]]:
     """
-    Load GoodFoods branch data from JSON file
+    Load GoodFoods branch data
+    
+    Prefers the memory-mapped compiled catalog (shared between worker
+    processes, no JSON parsing) and falls back to the JSON file.
     
     Returns:
-        List of branch dictionaries with all location data
+        List of branch dictionaries (or a CompiledCatalog sequence) with all location data
     """
+    if os.path.exists(COMPILED_CATALOG_FILE) and (
+        not os.path.exists(BRANCHES_FILE) or
+        os.path.getmtime(COMPILED_CATALOG_FILE) >= os.path.getmtime(BRANCHES_FILE)
+    ):
+        try:
+            from catalog_compiler import open_catalog
+            branches = open_catalog(COMPILED_CATALOG_FILE)
+            print(f"✅ Loaded {len(branches)} GoodFoods branches (compiled catalog)")
+            return branches
+        except Exception as e:
+            print(f"⚠️ Could not open compiled catalog, falling back to JSON: {e}")
+    
     try:
-        with open('d:/assign/goodfoods_branches.json', 'r', encoding='utf-8') as f:
+        with open(BRANCHES_FILE, 'r', encoding='utf-8') as f:
             branches = json.load(f)
         print(f"✅ Loaded {len(branches)} GoodFoods branches")
         return branches
@@ -39,8 +83,58 @@ def load_branches() -> List[Dict[str, Any]]:
 # Global branches data
 BRANCHES = load_branches()
 
+# Name/ID index over BRANCHES, built once at load time
+BRANCH_RESOLVER = BranchResolver(BRANCHES)
+
+def set_branches(branches: List[Dict[str, Any]]):
+    """
+    Replace the branch catalog used by the tools and rebuild its indexes
+    
+    Args:
+        branches: List of branch dictionaries (same shape as goodfoods_branches.json)
+    """
+    global BRANCHES, BRANCH_RESOLVER
+    BRANCHES = branches
+    BRANCH_RESOLVER = BranchResolver(branches)
+
 # --- RESERVATION TOOLS ---
 
+def _branch_matches(
+    branch: Dict[str, Any],
+    city: Optional[str],
+    locality: Optional[str],
+    features: Optional[List[str]],
+    min_rating: Optional[float],
+    min_capacity: Optional[int]
+) -> bool:
+    """Check a branch against the search_branches filters"""
+    # City filter
+    if city and city.lower() not in branch['city'].lower():
+        return False
+    
+    # Locality filter
+    if locality and locality.lower() not in branch['locality'].lower():
+        return False
+    
+    # Features filter (all requested features must be present)
+    if features:
+        branch_features_lower = [f.lower() for f in branch['features']]
+        for required_feature in features:
+            if required_feature.lower() not in branch_features_lower:
+                return False
+    
+    # Rating filter
+    if min_rating and branch['rating'] < min_rating:
+        return False
+    
+    # Capacity filter
+    if min_capacity and branch['capacity'] < min_capacity:
+        return False
+    
+    return True
+
+
+@traced("tool.search_branches")
 def search_branches(
     city: Optional[str] = None,
     locality: Optional[str] = None,
@@ -61,37 +155,14 @@ def search_branches(
     Returns:
         Formatted string with matching branches
     """
-    results = []
-    
-    for branch in BRANCHES:
-        match = True
-        
-        # City filter
-        if city and city.lower() not in branch['city'].lower():
-            match = False
-        
-        # Locality filter
-        if locality and locality.lower() not in branch['locality'].lower():
-            match = False
-        
-        # Features filter (all requested features must be present)
-        if features:
-            branch_features_lower = [f.lower() for f in branch['features']]
-            for required_feature in features:
-                if required_feature.lower() not in branch_features_lower:
-                    match = False
-                    break
-        
-        # Rating filter
-        if min_rating and branch['rating'] < min_rating:
-            match = False
-        
-        # Capacity filter
-        if min_capacity and branch['capacity'] < min_capacity:
-            match = False
-        
-        if match:
-            results.append(branch)
+    # Compiled catalogs filter on their columns and only materialize matches
+    if hasattr(BRANCHES, "search"):
+        results = BRANCHES.search(city, locality, features, min_rating, min_capacity, limit=5)
+    else:
+        results = [
+            branch for branch in BRANCHES
+            if _branch_matches(branch, city, locality, features, min_rating, min_capacity)
+        ]
     
     # Return results
     if not results:
@@ -111,6 +182,7 @@ def search_branches(
     return output
 
 
+@traced("tool.get_recommendations")
 def get_recommendations(preferences: str) -> str:
     """
     Get intelligent branch recommendations based on user preferences
@@ -124,6 +196,27 @@ def get_recommendations(preferences: str) -> str:
     # Tokenize preferences
     keywords = preferences.lower().split()
     
+    if hasattr(BRANCHES, "recommend"):
+        # Compiled catalog: score on the columns, materialize only the top 3
+        top_branches = BRANCHES.recommend(keywords, limit=3)
+    else:
+        top_branches = _score_branches(keywords)[:3]
+    
+    if not top_branches:
+        return "I couldn't find specific recommendations based on those preferences. Try searching for branches in your preferred city instead!"
+    
+    output = "Based on your preferences, I recommend these GoodFoods branches:\n\n"
+    for rank, branch in enumerate(top_branches, 1):
+        output += f"{rank}. **{branch['branch_name']}**\n"
+        output += f"   📍 {branch['full_address']}\n"
+        output += f"   ⭐ {branch['rating']} rating | 💺 {branch['capacity']} seats\n"
+        output += f"   ✨ Highlights: {', '.join(branch['features'][:3])}\n\n"
+    
+    return output
+
+
+def _score_branches(keywords: List[str]) -> List[Dict[str, Any]]:
+    """Branches with a positive recommendation score, best first"""
     scored_branches = []
     
     for branch in BRANCHES:
@@ -154,23 +247,65 @@ def get_recommendations(preferences: str) -> str:
     
     # Sort by score
     scored_branches.sort(key=lambda x: x[0], reverse=True)
+    return [branch for score, branch in scored_branches]
+
+
+# Session whose tool calls are running (set by Agent.chat; part of the booking idempotency key)
+CURRENT_SESSION: ContextVar[str] = ContextVar("goodfoods_session", default="")
+
+# Identical make_reservation calls running at the same moment share one booking
+BOOKING_FLIGHT = SingleFlight("bookings")
+
+
+def _table_count(branch: Dict[str, Any]) -> int:
+    """Tables per time slot at a branch"""
+    return max(1, min(20, branch['capacity'] // 4))
+
+
+def _check_slot(branch: Dict[str, Any], date: str, time: str, party_size: Any) -> Optional[str]:
+    """
+    Validate a requested date, time and party size against a branch
     
-    if not scored_branches:
-        return "I couldn't find specific recommendations based on those preferences. Try searching for branches in your preferred city instead!"
+    Returns:
+        Error message for the guest, or None if the request is valid
+    """
+    # Validate date format
+    try:
+        reservation_date = datetime.strptime(date, "%Y-%m-%d")
+        day_name = reservation_date.strftime("%A")
+    except (TypeError, ValueError):
+        return f"❌ Invalid date format. Please use YYYY-MM-DD (e.g., 2025-12-25)"
     
-    # Top 3 recommendations
-    top_branches = scored_branches[:3]
+    # Check if date is in the past
+    today = datetime.now().date()
+    if reservation_date.date() < today:
+        return f"❌ Cannot make reservations for past dates. Please choose a future date."
     
-    output = "Based on your preferences, I recommend these GoodFoods branches:\n\n"
-    for rank, (score, branch) in enumerate(top_branches, 1):
-        output += f"{rank}. **{branch['branch_name']}**\n"
-        output += f"   📍 {branch['full_address']}\n"
-        output += f"   ⭐ {branch['rating']} rating | 💺 {branch['capacity']} seats\n"
-        output += f"   ✨ Highlights: {', '.join(branch['features'][:3])}\n\n"
+    # Check availability (using weekly schedule)
+    schedule = branch.get('weekly_schedule', {})
+    available_slots = schedule.get(day_name, [])
     
-    return output
+    if not available_slots:
+        return f"❌ {branch['branch_name']} is closed on {day_name}s."
+    
+    if time not in available_slots:
+        sample_slots = ', '.join(available_slots[::4][:5])  # Show every 4th slot (2-hour intervals)
+        return f"❌ {branch['branch_name']} is not available at {time} on {day_name}s.\n   Available times: {sample_slots} (and more)"
+    
+    # Check capacity
+    if not isinstance(party_size, int):
+        return f"❌ Invalid party size '{party_size}'. Please give the number of guests."
+    
+    if party_size > branch['capacity']:
+        return f"❌ Party size ({party_size}) exceeds branch capacity ({branch['capacity']} seats). Please contact us directly for large party arrangements."
+    
+    if party_size < 1:
+        return f"❌ Invalid party size. Must be at least 1 person."
+    
+    return None
 
 
+@traced("tool.make_reservation")
 def make_reservation(
     date: str,
     time: str,
@@ -180,11 +315,16 @@ def make_reservation(
     city: Optional[str] = None,
     customer_name: Optional[str] = None,
     customer_phone: Optional[str] = None,
-    occasion: Optional[str] = None
+    occasion: Optional[str] = None,
+    idempotency_key: Optional[str] = None
 ) -> str:
     """
     Make a reservation at a GoodFoods branch
     
+    Repeating a successful call (same session, branch, date, time and
+    phone, or the same `idempotency_key`) returns the original
+    confirmation without booking again.
+    
     Args:
         date: Reservation date (YYYY-MM-DD)
         time: Reservation time (HH:MM)
@@ -195,10 +335,56 @@ def make_reservation(
         customer_name: Customer's full name
         customer_phone: Customer's phone number
         occasion: Occasion for booking (birthday, anniversary, etc.)
+        idempotency_key: Client-supplied key identifying this booking request
         
     Returns:
         Confirmation message or error message
     """
+    # Accept "tomorrow", "7:30pm", "four" etc. instead of bouncing them back to the LLM
+    date = normalize_date(date)
+    time = normalize_time(time)
+    party_size = normalize_party_size(party_size)
+    
+    branch, error = _resolve_branch(branch_id, branch_name, city)
+    if error:
+        return error
+    
+    error = _check_slot(branch, date, time, party_size)
+    if error:
+        return error
+    
+    # Request customer details if not provided
+    if not customer_name or not customer_phone:
+        return f"📝 To complete your reservation, please provide:\n  1. Your full name\n  2. Contact phone number\n  3. Occasion (optional: birthday, anniversary, date night, etc.)\n\nExample: 'John Doe, 9876543210, birthday celebration'"
+    
+    # A retried call replays the original confirmation instead of booking again
+    key = idempotency_key or make_key(
+        "make_reservation", CURRENT_SESSION.get(), branch['id'], date, time,
+        normalize_phone(customer_phone) or customer_phone
+    )
+    index = get_idempotency_index()
+    replay = index.get(key)
+    if replay is not None:
+        return _replayed_confirmation(replay, party_size)
+    
+    def book() -> Dict[str, Any]:
+        result = _book_table(branch, date, time, party_size, customer_name, customer_phone, occasion)
+        if result["reservation_id"]:
+            index.put(key, result, tag=result["reservation_id"])
+        return result
+    
+    # Identical calls arriving at the same moment share one booking
+    result, _ = BOOKING_FLIGHT.do(key, book)
+    return result["message"]
+
+
+def _resolve_branch(branch_id: Any, branch_name: Optional[str], city: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Find a branch by ID or (fuzzy) name
+    
+    Returns:
+        (branch, None) or (None, message asking the guest to clarify)
+    """
     branch = None
     
     # Convert empty string or 0 to None for branch_id
@@ -207,71 +393,43 @@ def make_reservation(
     
     # Find branch by ID
     if branch_id:
-        branch = next((b for b in BRANCHES if b['id'] == int(branch_id)), None)
+        branch = BRANCH_RESOLVER.get_branch(int(branch_id))
     
-    # Find branch by name
+    # Find branch by name (tolerates misspellings and aliases)
     if not branch and branch_name:
-        matches = []
-        for b in BRANCHES:
-            name_match = branch_name.lower() in b['branch_name'].lower()
-            locality_match = branch_name.lower() in b['locality'].lower()
-            
-            if name_match or locality_match:
-                # If city specified, must match
-                if city and city.lower() in b['city'].lower():
-                    matches.append(b)
-                elif not city:
-                    matches.append(b)
-        
-        if len(matches) == 1:
-            branch = matches[0]
-        elif len(matches) > 1:
-            branch_list = '\n'.join([f"  - {m['branch_name']} (ID: {m['id']})" for m in matches[:5]])
-            return f"Multiple branches found matching '{branch_name}':\n{branch_list}\n\nPlease specify the exact branch or use the ID."
+        resolution = BRANCH_RESOLVER.resolve(branch_name, city=city)
+        
+        if resolution.best:
+            branch = resolution.best
+        elif resolution.is_ambiguous:
+            branch_list = '\n'.join([f"  - {m['branch_name']}, {m['city']} (ID: {m['id']})" for _, m in resolution.candidates])
+            return None, f"Multiple branches found matching '{branch_name}':\n{branch_list}\n\nPlease specify the exact branch or use the ID."
     
     if not branch:
-        return f"❌ Branch not found. Please provide a valid branch ID or exact branch name. Use search_branches to find available locations."
+        return None, f"❌ Branch not found. Please provide a valid branch ID or exact branch name. Use search_branches to find available locations."
     
-    # Validate date format
-    try:
-        reservation_date = datetime.strptime(date, "%Y-%m-%d")
-        day_name = reservation_date.strftime("%A")
-    except ValueError:
-        return f"❌ Invalid date format. Please use YYYY-MM-DD (e.g., 2025-12-25)"
-    
-    # Check if date is in the past
-    today = datetime.now().date()
-    if reservation_date.date() < today:
-        return f"❌ Cannot make reservations for past dates. Please choose a future date."
-    
-    # Check availability (using weekly schedule)
-    schedule = branch.get('weekly_schedule', {})
-    available_slots = schedule.get(day_name, [])
-    
-    if not available_slots:
-        return f"❌ {branch['branch_name']} is closed on {day_name}s."
-    
-    if time not in available_slots:
-        sample_slots = ', '.join(available_slots[::4][:5])  # Show every 4th slot (2-hour intervals)
-        return f"❌ {branch['branch_name']} is not available at {time} on {day_name}s.\n   Available times: {sample_slots} (and more)"
-    
-    # Check capacity
-    if party_size > branch['capacity']:
-        return f"❌ Party size ({party_size}) exceeds branch capacity ({branch['capacity']} seats). Please contact us directly for large party arrangements."
-    
-    if party_size < 1:
-        return f"❌ Invalid party size. Must be at least 1 person."
-    
-    # Request customer details if not provided
-    if not customer_name or not customer_phone:
-        return f"📝 To complete your reservation, please provide:\n  1. Your full name\n  2. Contact phone number\n  3. Occasion (optional: birthday, anniversary, date night, etc.)\n\nExample: 'John Doe, 9876543210, birthday celebration'"
-    
-    # Generate reservation ID and table number
-    reservation_id = f"GF-{random.randint(10000, 99999)}"
-    table_number = random.randint(1, min(20, branch['capacity'] // 4))
+    return branch, None
+
+
+def _new_reservation_id() -> str:
+    """Next GF- ID from the store's sequence (never reused, even after archiving)"""
+    from reservations_db import new_reservation_id
     
-    # Create reservation record
-    reservation_data = {
+    return new_reservation_id()
+
+
+def _reservation_record(
+    reservation_id: str,
+    branch: Dict[str, Any],
+    date: str,
+    time: str,
+    party_size: int,
+    customer_name: str,
+    customer_phone: str,
+    occasion: Optional[str]
+) -> Dict[str, Any]:
+    """New confirmed reservation record (the store assigns a free table)"""
+    return {
         "reservation_id": reservation_id,
         "customer_name": customer_name,
         "customer_phone": customer_phone,
@@ -279,21 +437,59 @@ def make_reservation(
         "branch_id": branch['id'],
         "branch_name": branch['branch_name'],
         "branch_location": branch['full_address'],
+        "city": branch['city'],
         "date": date,
-        "day_of_week": day_name,
+        "day_of_week": datetime.strptime(date, "%Y-%m-%d").strftime("%A"),
         "time": time,
         "party_size": party_size,
-        "table_number": table_number,
+        "table_number": None,
         "created_at": datetime.now().isoformat(),
         "status": "confirmed"
     }
+
+
+def _replayed_confirmation(replay: Dict[str, Any], party_size: Any) -> str:
+    """Original confirmation for a repeated booking request."""
+    if party_size != replay["party_size"]:
+        return (f"ℹ️ You already have reservation {replay['reservation_id']} at this time for {replay['party_size']} people. "
+                f"Use modify_reservation to change the party size.\n\n{replay['message']}")
+    return replay["message"]
+
+
+def _book_table(
+    branch: Dict[str, Any],
+    date: str,
+    time: str,
+    party_size: int,
+    customer_name: str,
+    customer_phone: str,
+    occasion: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Save a validated reservation and build its confirmation
+    
+    Returns:
+        {"message": confirmation or error, "reservation_id": ID or None, "party_size": party_size}
+    """
+    reservation_date = datetime.strptime(date, "%Y-%m-%d")
+    day_name = reservation_date.strftime("%A")
+    
+    from reservations_db import SlotUnavailable, book_reservation
+    
+    reservation_id = _new_reservation_id()
+    reservation_data = _reservation_record(reservation_id, branch, date, time, party_size, customer_name, customer_phone, occasion)
     
-    # Save to database
+    # Save to database, taking seats and a table in the slot atomically
     try:
-        from reservations_db import save_reservation
-        save_reservation(reservation_data)
+        saved = book_reservation(reservation_data, capacity=branch['capacity'], tables=_table_count(branch))
+    except SlotUnavailable as e:
+        message = f"❌ {branch['branch_name']} is fully booked at {time} on {day_name}, {reservation_date.strftime('%B %d')} ({e}). Please choose another time or a nearby branch, or join the waitlist for this time."
+        return {"message": message, "reservation_id": None, "party_size": party_size}
     except Exception as e:
         print(f"Warning: Could not save to database: {e}")
+        message = f"❌ Could not save your reservation right now. Please try again in a moment."
+        return {"message": message, "reservation_id": None, "party_size": party_size}
+    table_number = saved['table_number']
     
     # Generate confirmation message
     confirmation = f"✅ **RESERVATION SUCCESSFULLY CONFIRMED!**\n\n"
@@ -313,53 +509,575 @@ def make_reservation(
     confirmation += f"💡 **Please Note:**\n"
     confirmation += f"  • Arrive 10-15 minutes early\n"
     confirmation += f"  • Quote reservation ID: {reservation_id}\n"
-    confirmation += f"  • Call us for modifications or cancellations\n\n"
+    confirmation += f"  • To change or cancel, just ask here with your reservation ID and phone number\n\n"
     confirmation += f"Looking forward to serving you at GoodFoods! 🌟"
     
-    return confirmation
+    return {"message": confirmation, "reservation_id": reservation_id, "party_size": party_size}
 
 
-# --- AI AGENT ---
+MAX_BULK_BOOKINGS = 100
 
-class Agent:
+
+@traced("tool.make_bulk_reservations")
+def make_bulk_reservations(
+    bookings: List[Dict[str, Any]],
+    customer_name: Optional[str] = None,
+    customer_phone: Optional[str] = None,
+    occasion: Optional[str] = None,
+    idempotency_key: Optional[str] = None
+) -> str:
     """
-    GoodFoods AI Reservation Agent
+    Book several tables at once (group or corporate booking), all-or-nothing
     
-    Uses llama-3.3-8b via Groq API with MCP protocol for tool calling
+    Either every booking is confirmed or none is: if any slot is full, the
+    whole group is rejected and nothing is saved. Bookings share a group ID.
+    Repeating a successful call returns the original confirmation.
+    
+    Args:
+        bookings: One dict per table with date, time, party_size and
+            branch_id or branch_name (plus optional city)
+        customer_name: Organizer's full name
+        customer_phone: Organizer's phone number
+        occasion: Occasion for the group (conference, wedding, etc.)
+        idempotency_key: Client-supplied key identifying this booking request
+        
+    Returns:
+        Group confirmation or error message
     """
+    if not isinstance(bookings, list) or not bookings:
+        return "❌ Please list the bookings to make (branch, date, time and party size for each)."
+    if len(bookings) > MAX_BULK_BOOKINGS:
+        return f"❌ A group booking can include at most {MAX_BULK_BOOKINGS} tables. Please split the request."
     
-    def __init__(
-        self,
-        api_key: str,
-        model: str = "llama-3.1-8b-instant",
-        base_url: str = "https://api.groq.com/openai/v1"
-    ):
-        """
-        Initialize the agent
+    # Validate every booking first so the guest sees all problems at once
+    resolved = []
+    errors = []
+    for number, item in enumerate(bookings, 1):
+        if not isinstance(item, dict):
+            errors.append(f"  {number}. Not a booking (expected branch, date, time and party size)")
+            continue
+        date = normalize_date(item.get("date"))
+        time = normalize_time(item.get("time"))
+        party_size = normalize_party_size(item.get("party_size"))
+        branch, error = _resolve_branch(item.get("branch_id"), item.get("branch_name"), item.get("city"))
+        if not error:
+            error = _check_slot(branch, date, time, party_size)
+        if error:
+            errors.append(f"  {number}. {error.splitlines()[0].removeprefix('❌ ')}")
+        else:
+            resolved.append((branch, date, time, party_size))
+    if errors:
+        return "❌ Group booking not made — please fix these bookings:\n" + "\n".join(errors)
+    
+    if not customer_name or not customer_phone:
+        return f"📝 To complete your group booking of {len(resolved)} tables, please provide:\n  1. Organizer's full name\n  2. Contact phone number\n  3. Occasion (optional: conference, wedding, team dinner, etc.)"
+    
+    key = idempotency_key or make_key(
+        "make_bulk_reservations", CURRENT_SESSION.get(),
+        [(branch['id'], date, time, party_size) for branch, date, time, party_size in resolved],
+        normalize_phone(customer_phone) or customer_phone
+    )
+    index = get_idempotency_index()
+    replay = index.get(key)
+    if replay is not None:
+        return replay["message"]
+    
+    def book() -> Dict[str, Any]:
+        result = _book_group(resolved, customer_name, customer_phone, occasion)
+        if result["group_id"]:
+            index.put(key, result, tag=result["group_id"])
+        return result
+    
+    result, _ = BOOKING_FLIGHT.do(key, book)
+    return result["message"]
+
+
+def _book_group(
+    resolved: List[Tuple[Dict[str, Any], str, str, int]],
+    customer_name: str,
+    customer_phone: str,
+    occasion: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Save a validated group of bookings in one transaction
+    
+    Returns:
+        {"message": confirmation or error, "group_id": ID or None}
+    """
+    from reservations_db import SlotUnavailable, book_reservations
+    
+    group_id = f"GRP-{random.randint(100000, 999999)}"
+    entries = []
+    for branch, date, time, party_size in resolved:
+        reservation_id = _new_reservation_id()
+        record = _reservation_record(reservation_id, branch, date, time, party_size, customer_name, customer_phone, occasion)
+        record["group_id"] = group_id
+        entries.append((record, branch['capacity'], _table_count(branch)))
+    
+    try:
+        saved = book_reservations(entries)
+    except SlotUnavailable as e:
+        message = f"❌ Group booking not made — nothing was booked. Not enough room at {e}. Please choose another time or branch for that table."
+        return {"message": message, "group_id": None}
+    except Exception as e:
+        return {"message": f"❌ Error saving group booking: {str(e)}", "group_id": None}
+    
+    guests = sum(r['party_size'] for r in saved)
+    confirmation = f"✅ **GROUP BOOKING CONFIRMED!**\n\n"
+    confirmation += f"🧾 **Group ID:** {group_id}\n"
+    confirmation += f"👤 **Organizer:** {customer_name} ({customer_phone})\n"
+    if occasion:
+        confirmation += f"🎉 **Occasion:** {occasion.title()}\n"
+    confirmation += f"👥 **{len(saved)} tables, {guests} guests:**\n"
+    for r in saved:
+        confirmation += f"  - {r['reservation_id']} · {r['branch_name']}, {r['city']} · {r['date']} {r['time']} · {r['party_size']} guests · Table {r['table_number']}\n"
+    confirmation += f"\nEach reservation can be changed or cancelled on its own with its ID."
+    return {"message": confirmation, "group_id": group_id}
+
+
+def _find_guest_reservation(reservation_id: str, customer_phone: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Look up a reservation and check it belongs to the caller
+    
+    Returns:
+        (reservation, None) or (None, error message for the guest)
+    """
+    from reservations_db import get_reservation
+    
+    reservation_id = str(reservation_id or "").strip().upper()
+    if reservation_id.isdigit():
+        reservation_id = f"GF-{reservation_id}"
+    
+    reservation = get_reservation(reservation_id) if reservation_id else None
+    if reservation is None:
+        return None, f"❌ Reservation {reservation_id or '(no ID)'} not found. Please check the ID on your confirmation (e.g., GF-12345)."
+    
+    if not customer_phone:
+        return None, f"📝 Please provide the phone number used for reservation {reservation_id} to verify it's yours."
+    phone = normalize_phone(customer_phone)
+    if phone is None or phone != normalize_phone(reservation.get('customer_phone')):
+        return None, f"❌ The phone number doesn't match reservation {reservation_id}. Please use the number given when booking."
+    
+    return reservation, None
+
+
+def _is_past(reservation: Dict[str, Any]) -> bool:
+    try:
+        return datetime.strptime(reservation['date'], "%Y-%m-%d").date() < datetime.now().date()
+    except (KeyError, ValueError):
+        return False
+
+
+@traced("tool.cancel_reservation")
+def cancel_reservation(reservation_id: str, customer_phone: Optional[str] = None, reason: Optional[str] = None) -> str:
+    """
+    Cancel a GoodFoods reservation and release its seats
+    
+    Args:
+        reservation_id: Reservation ID (e.g., GF-12345)
+        customer_phone: Phone number used for the booking (verification)
+        reason: Optional reason for cancelling
         
-        Args:
-            api_key: Groq API key
-            model: Model name (default: llama-3.3-8b-instant)
-            base_url: API base URL
-        """
-        self.api_key = api_key
-        self.model = model
-        self.base_url = base_url
+    Returns:
+        Cancellation confirmation or error message
+    """
+    reservation, error = _find_guest_reservation(reservation_id, customer_phone)
+    if error:
+        return error
+    
+    reservation_id = reservation['reservation_id']
+    if reservation.get('status', 'confirmed') == 'cancelled':
+        return f"ℹ️ Reservation {reservation_id} is already cancelled."
+    if _is_past(reservation):
+        return f"❌ Reservation {reservation_id} was for {reservation['date']} and can no longer be cancelled."
+    
+    from reservations_db import update_reservation
+    
+    changes = {"status": "cancelled"}
+    if reason:
+        changes["cancellation_reason"] = reason
+    try:
+        update_reservation(reservation_id, changes, note=reason or "Cancelled by guest")
+    except Exception as e:
+        print(f"Warning: Could not cancel reservation: {e}")
+        return f"❌ Could not cancel reservation {reservation_id} right now. Please try again in a moment."
+    # A later identical make_reservation should book again, not replay this booking
+    get_idempotency_index().discard_tag(reservation_id)
+    if reservation.get("group_id"):
+        get_idempotency_index().discard_tag(reservation["group_id"])
+    _promote_waitlist(reservation['branch_id'], reservation['date'], reservation['time'])
+    
+    result = f"✅ **RESERVATION CANCELLED**\n\n"
+    result += f"🎫 **Reservation ID:** {reservation_id}\n"
+    result += f"🍽️ **Restaurant:** {reservation['branch_name']}\n"
+    result += f"📅 **Date:** {reservation['date']} at {reservation['time']}\n"
+    result += f"👥 **Party Size:** {reservation['party_size']} people\n\n"
+    result += f"Your table has been released. We hope to see you another time! 🌟"
+    return result
+
+
+@traced("tool.modify_reservation")
+def modify_reservation(
+    reservation_id: str,
+    customer_phone: Optional[str] = None,
+    date: Optional[str] = None,
+    time: Optional[str] = None,
+    party_size: Optional[int] = None,
+    occasion: Optional[str] = None
+) -> str:
+    """
+    Change the date, time, party size or occasion of a reservation
+    
+    The new slot is checked and taken before the old one is released, in
+    one store update; if it is full, the original booking is kept.
+    
+    Args:
+        reservation_id: Reservation ID (e.g., GF-12345)
+        customer_phone: Phone number used for the booking (verification)
+        date: New date (YYYY-MM-DD)
+        time: New time (HH:MM)
+        party_size: New number of people
+        occasion: New occasion
         
-        # Initialize MCP server
-        import sys
-        self.mcp_server = create_mcp_server(sys.modules[__name__])
+    Returns:
+        Updated confirmation or error message
+    """
+    reservation, error = _find_guest_reservation(reservation_id, customer_phone)
+    if error:
+        return error
+    
+    reservation_id = reservation['reservation_id']
+    if reservation.get('status', 'confirmed') != 'confirmed':
+        return f"❌ Reservation {reservation_id} is {reservation.get('status')} and can't be changed. Please make a new reservation."
+    if _is_past(reservation):
+        return f"❌ Reservation {reservation_id} was for {reservation['date']} and can no longer be changed."
+    
+    changes = {}
+    if date:
+        changes['date'] = normalize_date(date)
+    if time:
+        changes['time'] = normalize_time(time)
+    if party_size is not None:
+        changes['party_size'] = normalize_party_size(party_size)
+    if occasion:
+        changes['occasion'] = occasion
+    changes = {k: v for k, v in changes.items() if v != reservation.get(k)}
+    if not changes:
+        return f"ℹ️ Nothing to change for reservation {reservation_id}. Tell me the new date, time, party size or occasion."
+    
+    branch = BRANCH_RESOLVER.get_branch(int(reservation['branch_id']))
+    if not branch:
+        return f"❌ The branch for reservation {reservation_id} is no longer available. Please cancel and book another branch."
+    
+    new_date = changes.get('date', reservation['date'])
+    new_time = changes.get('time', reservation['time'])
+    new_party = changes.get('party_size', reservation['party_size'])
+    error = _check_slot(branch, new_date, new_time, new_party)
+    if error:
+        return f"{error}\n   Your original reservation is unchanged."
+    if 'date' in changes:
+        changes['day_of_week'] = datetime.strptime(new_date, "%Y-%m-%d").strftime("%A")
+    
+    from reservations_db import SlotUnavailable, update_reservation
+    
+    note = "Changed by guest: " + ", ".join(f"{k} {reservation.get(k)} → {v}" for k, v in changes.items() if k != 'day_of_week')
+    try:
+        updated = update_reservation(reservation_id, changes, capacity=branch['capacity'], tables=_table_count(branch), note=note)
+    except SlotUnavailable as e:
+        return f"❌ {branch['branch_name']} is fully booked at {new_time} on {new_date} ({e}). Your original reservation is unchanged; you can also join the waitlist for that time."
+    except Exception as e:
+        print(f"Warning: Could not modify reservation: {e}")
+        return f"❌ Could not change reservation {reservation_id} right now. Please try again in a moment."
+    if updated is None:
+        return f"❌ Reservation {reservation_id} not found."
+    get_idempotency_index().discard_tag(reservation_id)
+    if reservation.get("group_id"):
+        get_idempotency_index().discard_tag(reservation["group_id"])
+    # Seats given up in the original slot go to the waitlist
+    _promote_waitlist(reservation['branch_id'], reservation['date'], reservation['time'])
+    
+    result = f"✅ **RESERVATION UPDATED**\n\n"
+    result += f"🎫 **Reservation ID:** {reservation_id}\n"
+    result += f"🍽️ **Restaurant:** {branch['branch_name']}\n"
+    result += f"📅 **Date:** {datetime.strptime(new_date, '%Y-%m-%d').strftime('%A, %B %d, %Y')}\n"
+    result += f"🕐 **Time:** {new_time}\n"
+    result += f"👥 **Party Size:** {new_party} people\n"
+    result += f"🪑 **Table Number:** {updated['table_number']}\n"
+    if updated.get('occasion') and updated['occasion'] != "Not specified":
+        result += f"🎉 **Occasion:** {updated['occasion']}\n"
+    result += f"\nEverything else stays the same. See you soon! 🌟"
+    return result
+
+
+def _promote_waitlist(branch_id: int, date: str, time: str) -> List[Dict[str, Any]]:
+    """
+    Book waiting parties into seats freed in a slot
+    
+    Returns:
+        The promoted waitlist entries (with their reservation IDs)
+    """
+    waitlist = get_waitlist()
+    if not waitlist.waiting(int(branch_id), date, time):
+        return []
+    branch = BRANCH_RESOLVER.get_branch(int(branch_id))
+    if not branch:
+        return []
+    
+    from reservations_db import SlotUnavailable, book_reservation, seats_booked
+    
+    def book(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        record = _reservation_record(
+            _new_reservation_id(), branch, date, time, entry['party_size'],
+            entry['customer_name'], entry['customer_phone'], entry['occasion']
+        )
+        record['waitlist_id'] = entry['waitlist_id']
+        try:
+            return book_reservation(record, capacity=branch['capacity'], tables=_table_count(branch))
+        except SlotUnavailable:
+            return None
+    
+    # A failed promotion must not fail the cancellation or change that freed the seats
+    try:
+        seats_left = branch['capacity'] - seats_booked(branch['id'], date, time)
+        promoted = waitlist.promote(branch['id'], date, time, seats_left, book)
+    except Exception as e:
+        print(f"Warning: Could not promote waitlist: {e}")
+        return []
+    for entry in promoted:
+        print(f"📣 Waitlist {entry['waitlist_id']} booked as {entry['reservation_id']} ({branch['branch_name']}, {date} {time})")
+    return promoted
+
+
+@traced("tool.join_waitlist")
+def join_waitlist(
+    date: str,
+    time: str,
+    party_size: int,
+    branch_id: Optional[int] = None,
+    branch_name: Optional[str] = None,
+    city: Optional[str] = None,
+    customer_name: Optional[str] = None,
+    customer_phone: Optional[str] = None,
+    occasion: Optional[str] = None
+) -> str:
+    """
+    Join the waitlist for a fully booked time slot
+    
+    The party is booked automatically, in queue order, when seats free up.
+    If the slot has room already, the table is booked right away.
+    
+    Args:
+        date: Reservation date (YYYY-MM-DD)
+        time: Reservation time (HH:MM)
+        party_size: Number of people
+        branch_id: Branch ID (optional if branch_name provided)
+        branch_name: Branch name (optional if branch_id provided)
+        city: City name (helps disambiguate branch_name)
+        customer_name: Customer's full name
+        customer_phone: Customer's phone number
+        occasion: Occasion for booking
         
-        # Get tools in OpenAI format (Groq uses OpenAI-compatible API)
-        self.tools = self.mcp_server.to_openai_format()
+    Returns:
+        Waitlist position, booking confirmation or error message
+    """
+    date = normalize_date(date)
+    time = normalize_time(time)
+    party_size = normalize_party_size(party_size)
+    
+    branch, error = _resolve_branch(branch_id, branch_name, city)
+    if error:
+        return error
+    error = _check_slot(branch, date, time, party_size)
+    if error:
+        return error
+    
+    if not customer_name or not customer_phone:
+        return f"📝 To join the waitlist, please provide:\n  1. Your full name\n  2. Contact phone number"
+    phone = normalize_phone(customer_phone)
+    if phone is None:
+        return f"❌ '{customer_phone}' doesn't look like a phone number. Please check it."
+    
+    waitlist = get_waitlist()
+    try:
+        entry = waitlist.join(branch['id'], date, time, party_size, customer_name, phone, occasion=occasion)
+    except WaitlistFull as e:
+        return f"❌ The waitlist for {branch['branch_name']} at {time} is full ({e}). Please choose another time or a nearby branch."
+    
+    # Seats may already be free (or a table the guest tried for was just released)
+    _promote_waitlist(branch['id'], date, time)
+    entry = waitlist.get(entry['waitlist_id'])
+    if entry['status'] == 'promoted':
+        return _waitlist_booked_message(entry, branch)
+    
+    when = datetime.strptime(date, "%Y-%m-%d").strftime("%A, %B %d")
+    result = f"📋 **ADDED TO WAITLIST**\n\n"
+    result += f"🎫 **Waitlist ID:** {entry['waitlist_id']}\n"
+    result += f"🍽️ **Restaurant:** {branch['branch_name']}\n"
+    result += f"📅 **Date:** {when} at {time}\n"
+    result += f"👥 **Party Size:** {party_size} people\n"
+    result += f"🔢 **Position:** #{entry['position']}\n\n"
+    result += f"If seats free up, your table is booked automatically and you'll get a reservation ID. Ask me for your position anytime."
+    return result
+
+
+def _waitlist_booked_message(entry: Dict[str, Any], branch: Optional[Dict[str, Any]]) -> str:
+    """Confirmation for a waitlist entry that became a reservation."""
+    name = branch['branch_name'] if branch else f"branch {entry['branch_id']}"
+    result = f"✅ **BOOKED FROM THE WAITLIST!**\n\n"
+    result += f"🎫 **Reservation ID:** {entry['reservation_id']}\n"
+    result += f"🍽️ **Restaurant:** {name}\n"
+    result += f"📅 **Date:** {entry['date']} at {entry['time']}\n"
+    result += f"👥 **Party Size:** {entry['party_size']} people\n\n"
+    result += f"Please save your reservation ID for changes or cancellations."
+    return result
+
+
+def _find_guest_waitlist(waitlist_id: str, customer_phone: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Look up a waitlist entry and check it belongs to the caller
+    
+    Returns:
+        (entry, None) or (None, error message for the guest)
+    """
+    waitlist_id = str(waitlist_id or "").strip().upper()
+    if waitlist_id.isdigit():
+        waitlist_id = f"WL-{waitlist_id}"
+    
+    entry = get_waitlist().get(waitlist_id) if waitlist_id else None
+    if entry is None:
+        return None, f"❌ Waitlist entry {waitlist_id or '(no ID)'} not found. Please check the ID (e.g., WL-123456)."
+    
+    if not customer_phone:
+        return None, f"📝 Please provide the phone number used for waitlist entry {waitlist_id} to verify it's yours."
+    if normalize_phone(customer_phone) != entry['customer_phone']:
+        return None, f"❌ The phone number doesn't match waitlist entry {waitlist_id}. Please use the number given when joining."
+    
+    return entry, None
+
+
+@traced("tool.waitlist_position")
+def waitlist_position(waitlist_id: str, customer_phone: Optional[str] = None) -> str:
+    """
+    Check a party's place on the waitlist
+    
+    Args:
+        waitlist_id: Waitlist ID (e.g., WL-123456)
+        customer_phone: Phone number used when joining (verification)
         
-        # Initialize conversation history
-        self.history = [
-            {"role": "system", "content": f"""You are an AI assistant for GoodFoods, a premium casual dining restaurant chain with 50+ branches across India.
+    Returns:
+        Current position, the reservation it became, or error message
+    """
+    entry, error = _find_guest_waitlist(waitlist_id, customer_phone)
+    if error:
+        return error
+    
+    branch = BRANCH_RESOLVER.get_branch(int(entry['branch_id']))
+    if entry['status'] == 'promoted':
+        return _waitlist_booked_message(entry, branch)
+    if entry['status'] != 'waiting':
+        return f"ℹ️ Waitlist entry {entry['waitlist_id']} is no longer active. Use join_waitlist to queue again."
+    
+    name = branch['branch_name'] if branch else f"branch {entry['branch_id']}"
+    return (f"📋 You're #{entry['position']} on the waitlist for {name} on {entry['date']} at {entry['time']} "
+            f"(party of {entry['party_size']}). Your table is booked automatically when seats free up.")
+
+
+@traced("tool.leave_waitlist")
+def leave_waitlist(waitlist_id: str, customer_phone: Optional[str] = None) -> str:
+    """
+    Leave the waitlist for a slot
+    
+    Args:
+        waitlist_id: Waitlist ID (e.g., WL-123456)
+        customer_phone: Phone number used when joining (verification)
+        
+    Returns:
+        Confirmation or error message
+    """
+    entry, error = _find_guest_waitlist(waitlist_id, customer_phone)
+    if error:
+        return error
+    
+    if entry['status'] == 'promoted':
+        return (f"ℹ️ Waitlist entry {entry['waitlist_id']} already became reservation {entry['reservation_id']}. "
+                f"Use cancel_reservation if you no longer need the table.")
+    if get_waitlist().leave(entry['waitlist_id']) is None:
+        return f"ℹ️ Waitlist entry {entry['waitlist_id']} is no longer active."
+    return f"✅ You've left the waitlist for {entry['date']} at {entry['time']} ({entry['waitlist_id']})."
+
+
+@traced("tool.find_my_reservations")
+def find_my_reservations(customer_phone: str, limit: int = 5, page_token: Optional[str] = None) -> str:
+    """
+    List a guest's upcoming reservations by phone number
+    
+    Args:
+        customer_phone: Phone number used for booking
+        limit: Reservations per page (1-20)
+        page_token: Token from the previous page to continue listing
+        
+    Returns:
+        Upcoming reservations in time order, or a message if none
+    """
+    from reservations_db import find_reservations_by_phone
+    
+    phone = normalize_phone(customer_phone)
+    if phone is None:
+        return f"❌ '{customer_phone}' doesn't look like a phone number. Please give the number used when booking."
+    
+    limit = normalize_party_size(limit)
+    limit = max(1, min(20, limit)) if isinstance(limit, int) else 5
+    after = None
+    if page_token:
+        # Token format: <date>T<time>/<reservation_id>
+        moment, _, last_id = page_token.partition("/")
+        date, _, time = moment.partition("T")
+        if not (date and time and last_id):
+            return f"❌ Invalid page token '{page_token}'. Ask without a token to start from the first page."
+        after = (date, time, last_id)
+    
+    # One extra row tells us whether there is another page
+    reservations = find_reservations_by_phone(phone, after=after, limit=limit + 1)
+    more = len(reservations) > limit
+    reservations = reservations[:limit]
+    
+    if not reservations:
+        if page_token:
+            return f"ℹ️ No more upcoming reservations for {phone}."
+        return f"ℹ️ No upcoming reservations found for {phone}. Use make_reservation to book a table."
+    
+    output = f"📋 **Upcoming reservations for {phone}:**\n\n"
+    for r in reservations:
+        when = datetime.strptime(r['date'], "%Y-%m-%d").strftime('%A, %B %d, %Y')
+        output += f"🎫 **{r['reservation_id']}** - {r['branch_name']}, {r.get('city', '')}\n"
+        output += f"   📅 {when} at {r['time']} | 👥 {r['party_size']} people | 🪑 Table {r.get('table_number')}\n"
+        if r.get('occasion') and r['occasion'] != "Not specified":
+            output += f"   🎉 {r['occasion']}\n"
+        output += "\n"
+    if more:
+        last = reservations[-1]
+        output += f"➡️ More reservations: call find_my_reservations again with page_token=\"{last['date']}T{last['time']}/{last['reservation_id']}\""
+    return output.rstrip()
+
+
+# --- AI AGENT ---
+
+# Send only the tools relevant to the conversation state (see tool_selection.py)
+TOOL_SELECTION = os.environ.get("GOODFOODS_TOOL_SELECTION", "1") == "1"
+
+# Append normalized date/time/party size notes to user messages (see slot_parser.py)
+SLOT_ANNOTATION = os.environ.get("GOODFOODS_SLOT_ANNOTATION", "1") == "1"
+
+# Share one completion between sessions sending byte-identical requests (see single_flight.py)
+LLM_SINGLEFLIGHT = os.environ.get("GOODFOODS_SINGLEFLIGHT", "1") == "1"
+LLM_FLIGHT = SingleFlight("llm")
+
+SYSTEM_PROMPT = """You are an AI assistant for GoodFoods, a premium casual dining restaurant chain with 50+ branches across India.
 
 **Your Role:**
 - Help customers find the best GoodFoods branch for their needs
 - Make reservations at their preferred location
+- Cancel or change existing reservations
 - Suggest alternative branches when needed
 
 **GoodFoods Brand:**
@@ -390,9 +1108,7 @@ Step 4: **IMMEDIATELY CALL make_reservation TOOL**
 - DO NOT just talk about making a reservation - ACTUALLY CALL make_reservation
 - Pass ALL parameters:
   • branch_name: The branch name user selected (e.g., "GoodFoods - Bandra")
-  • date: In YYYY-MM-DD format
-  • time: In HH:MM format (use 24-hour, e.g., "14:00" for 2pm)
-  • party_size: Number from original request
+  • date, time, party_size: From the [[parsed: ...]] notes on user messages
   • customer_name: From user input
   • customer_phone: From user input
   • occasion: From user input (or None)
@@ -426,16 +1142,149 @@ You: [IMMEDIATELY call make_reservation with:
 User: "6302532856 birthday party"
 You: "I'd like to make a reservation..." ❌ NO! CALL THE TOOL!
 
-**Current Date:** {datetime.now().strftime("%Y-%m-%d")} ({datetime.now().strftime("%A")})
+**Changes and Cancellations:**
+- To cancel, call cancel_reservation with the reservation ID and the phone number used for booking
+- To change the date, time, party size or occasion, call modify_reservation with the reservation ID, phone number and only the fields that change
+- If the guest hasn't given the reservation ID or phone number, ask for them first
+- To move a booking to another branch, cancel it and make a new reservation
+- For group or corporate bookings needing several tables (different branches or times), call make_bulk_reservations once with every table; it books all or none
+- If the guest asks what they booked or doesn't know their reservation ID, call find_my_reservations with their phone number
 
-**Time Parsing:**
-- "tomorrow at 2pm" = {(datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")} at 14:00
-- "8pm" = 20:00
-- "7:30pm" = 19:30
+**Waitlist:**
+- If a time is fully booked and the guest wants that time anyway, offer the waitlist and call join_waitlist with the same branch, date, time, party size, name and phone
+- Waitlisted parties are booked automatically when seats free up; to check their place call waitlist_position, to drop out call leave_waitlist (both need the WL- ID and phone number)
+
+**Dates and Times:**
+User messages may end with a [[parsed: date=..., time=..., party_size=...]] note with values already converted to YYYY-MM-DD, 24-hour HH:MM and a number. Use them as-is. The current date is in the date context message at the end of the conversation.
+
+Be friendly, helpful, and efficient!"""
+
+
+def cached_prompt_tokens(usage: Dict[str, Any]) -> int:
+    """Prompt tokens served from the provider's prefix cache, per its usage block."""
+    details = usage.get("prompt_tokens_details") or {}
+    return details.get("cached_tokens") or usage.get("prompt_cache_hit_tokens") or 0
+
+
+def date_context(now: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    Build the volatile date message sent after the conversation
 
-Be friendly, helpful, and efficient!"""}
+    Keeping dates out of SYSTEM_PROMPT leaves the request prefix (system
+    prompt, tools, earlier turns) byte-identical across agents, turns and
+    days, so provider-side prefix caching can reuse it.
+
+    Args:
+        now: Current time (defaults to datetime.now())
+
+    Returns:
+        System message with today's date, weekday and tomorrow's date
+    """
+    now = now or datetime.now()
+    tomorrow = now + timedelta(days=1)
+    return {
+        "role": "system",
+        "content": f"Date context: today is {now.strftime('%Y-%m-%d')} ({now.strftime('%A')}); "
+                   f"tomorrow is {tomorrow.strftime('%Y-%m-%d')} ({tomorrow.strftime('%A')})."
+    }
+
+
+@lru_cache(maxsize=1)
+def get_mcp_server():
+    """Process-wide MCP server over this module's tools."""
+    return create_mcp_server(sys.modules[__name__])
+
+
+@lru_cache(maxsize=1)
+def get_tool_selector() -> ToolSelector:
+    """Process-wide tool selector over the shared tool list."""
+    return ToolSelector(get_openai_tools())
+
+
+@lru_cache(maxsize=1)
+def get_openai_tools() -> List[Dict[str, Any]]:
+    """
+    Tool definitions in OpenAI format, built once and shared by all agents (do not mutate)
+
+    Keys are sorted so the serialized tools are byte-stable.
+    """
+    return json.loads(json.dumps(get_mcp_server().to_openai_format(), sort_keys=True))
+
+
+class Agent:
+    """
+    GoodFoods AI Reservation Agent
+    
+    Uses llama-3.3-8b via Groq API with MCP protocol for tool calling
+    """
+    
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "llama-3.1-8b-instant",
+        base_url: str = "https://api.groq.com/openai/v1",
+        session_id: Optional[str] = None
+    ):
+        """
+        Initialize the agent
+        
+        Args:
+            api_key: Groq API key
+            model: Model name (default: llama-3.3-8b-instant)
+            base_url: API base URL
+            session_id: Conversation ID (generated if not given)
+        """
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.session_id = session_id or uuid.uuid4().hex
+        
+        # Shared MCP server and OpenAI-format tool list (built once per process)
+        self.mcp_server = get_mcp_server()
+        self.tools = get_openai_tools()
+        self.last_tool_selection = None
+        self.priority = PRIORITY_BROWSING
+        
+        # Initialize conversation history
+        self.history = [
+            {"role": "system", "content": SYSTEM_PROMPT}
         ]
     
+    def to_state(self) -> Dict[str, Any]:
+        """
+        Export the agent's conversation state
+        
+        The system prompt is rebuilt on load, so only the model settings and
+        the conversation turns are included. The API key is never exported.
+        
+        Returns:
+            JSON-serializable state dictionary
+        """
+        return {
+            "model": self.model,
+            "base_url": self.base_url,
+            "session_id": self.session_id,
+            "history": self.history[1:]
+        }
+    
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], api_key: str, session_id: Optional[str] = None) -> "Agent":
+        """
+        Recreate an agent from state produced by `to_state`
+        
+        Args:
+            state: State dictionary
+            api_key: Groq API key
+            session_id: Session ID to use when the state has none (older states)
+            
+        Returns:
+            Agent with the restored conversation history
+        """
+        agent = cls(api_key=api_key, model=state["model"], base_url=state["base_url"],
+                    session_id=state.get("session_id") or session_id)
+        agent.history.extend(state["history"])
+        return agent
+    
     def chat(self, user_input: str) -> str:
         """
         Process user input and generate response
@@ -446,12 +1295,40 @@ Be friendly, helpful, and efficient!"""}
         Returns:
             Agent's response string
         """
-        # Add user message
-        self.history.append({"role": "user", "content": user_input})
+        start = time.perf_counter()
+        # Tools read the session (booking idempotency keys) from the context
+        session = CURRENT_SESSION.set(self.session_id)
+        try:
+            with span("chat", model=self.model, turn=len(self.history)) as turn:
+                with profile("turn", target="turn"):
+                    reply = self._chat(user_input)
+                outcome = "error" if reply is None or reply.startswith("❌") else "busy" if reply.startswith("⏳") else "ok"
+                if outcome == "error":
+                    turn.set_error(reply[:200])
+        finally:
+            CURRENT_SESSION.reset(session)
+        CHAT_TURN_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+        return reply
+
+    def _chat(self, user_input: str) -> str:
+        """Run one turn: LLM call, tool execution and the follow-up LLM call."""
+        tools = self._select_tools(user_input)
+        
+        # Booking turns are admitted ahead of browsing turns when the LLM is busy
+        state = self.last_tool_selection.state if self.last_tool_selection else infer_state(self.history, user_input)
+        self.priority = PRIORITY_BOOKING if state in (COLLECTING_DETAILS, CONFIRMING, MANAGING) else PRIORITY_BROWSING
+        
+        # Add user message, with locally parsed dates, times and party size
+        content = annotate(user_input) if SLOT_ANNOTATION else user_input
+        self.history.append({"role": "user", "content": content})
         
         # Call LLM
         try:
-            response_data = self._call_llm(tools=self.tools)
+            response_data = self._call_llm(tools=tools)
+        except BusyError as e:
+            # Nothing happened this turn; drop the message so a retry starts clean
+            self.history.pop()
+            return f"⏳ We're handling a lot of requests right now. Please try again in {max(1, round(e.retry_after))} seconds."
         except Exception as e:
             return f"❌ Error communicating with LLM: {str(e)}\n\nPlease check your API key and try again."
         
@@ -491,6 +1368,12 @@ Be friendly, helpful, and efficient!"""}
                 final_message = final_response["choices"][0]["message"]
                 self.history.append(final_message)
                 return final_message["content"]
+            except BusyError:
+                # The tools already ran (a booking may exist): show their output as-is
+                results = [m["content"] for m in self.history[-len(tool_calls):]]
+                final_message = {"role": "assistant", "content": "\n\n".join(results)}
+                self.history.append(final_message)
+                return final_message["content"]
             except Exception as e:
                 return f"❌ Error generating final response: {str(e)}"
         
@@ -499,6 +1382,32 @@ Be friendly, helpful, and efficient!"""}
             self.history.append(message)
             return message["content"]
     
+    def _select_tools(self, user_input: str) -> List[Dict[str, Any]]:
+        """
+        Pick the tools to offer for this turn
+        
+        With GOODFOODS_TOOL_SELECTION enabled (the default), only the subset
+        for the inferred conversation state is sent (see tool_selection.py).
+        
+        Args:
+            user_input: The guest's new message (not yet in history)
+            
+        Returns:
+            Tools in OpenAI format
+        """
+        if not TOOL_SELECTION:
+            self.last_tool_selection = None
+            return self.tools
+        
+        selection = get_tool_selector().select(self.history, user_input)
+        self.last_tool_selection = selection
+        TOOL_SCHEMA_TOKENS.inc(selection.tokens_sent, kind="sent")
+        TOOL_SCHEMA_TOKENS.inc(selection.tokens_saved, kind="saved")
+        turn = current_span()
+        turn.set_attribute("tool_state", selection.state)
+        turn.set_attribute("tool_tokens_saved", selection.tokens_saved)
+        return selection.tools
+    
     def _call_llm(self, tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
         """
         Make API call to Groq LLM
@@ -515,9 +1424,10 @@ Be friendly, helpful, and efficient!"""}
             "Authorization": f"Bearer {self.api_key}"
         }
         
+        # Stable prefix first (system prompt, tools, earlier turns); volatile date last
         payload = {
             "model": self.model,
-            "messages": self.history,
+            "messages": self.history + [date_context()],
             "temperature": 0.7
         }
         
@@ -525,12 +1435,65 @@ Be friendly, helpful, and efficient!"""}
             payload["tools"] = tools
             payload["tool_choice"] = "auto"
         
-        resp = requests.post(url, headers=headers, json=payload, timeout=30)
+        # Canonical serialization keeps the bytes of the prefix identical between requests
+        body = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
         
+        # Requests without tool results (e.g. identical opening messages) can share a completion;
+        # follow-ups after a tool ran are specific to that session's booking
+        coalesce = LLM_SINGLEFLIGHT and not any(m.get("role") == "tool" for m in self.history)
+        
+        with span("llm.request", model=self.model, messages=len(self.history), tools=bool(tools)) as request:
+            if not coalesce:
+                return self._post_completion(url, headers, body, request)
+            data, shared = LLM_FLIGHT.do(
+                make_key(url, self.api_key, body),
+                lambda: self._post_completion(url, headers, body, request)
+            )
+            request.set_attribute("coalesced", shared)
+            # Each session appends the message to its own history
+            return copy.deepcopy(data) if shared else data
+
+    def _post_completion(self, url: str, headers: Dict[str, str], body: bytes, request: Span) -> Dict[str, Any]:
+        """Send one chat completion request through the LLM scheduler."""
+        scheduler = get_scheduler()
+        estimated_tokens = len(body) // 4
+        
+        # Wait for a slot within the provider quota (raises BusyError when saturated)
+        queued = time.perf_counter()
+        with scheduler.slot(priority=self.priority, tokens=estimated_tokens):
+            request.set_attribute("queue_ms", round((time.perf_counter() - queued) * 1000, 1))
+            start = time.perf_counter()
+            try:
+                resp = requests.post(url, headers=headers, data=body, timeout=30)
+            except Exception:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=self.model, status="exception")
+                raise
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=self.model, status=resp.status_code)
+        request.set_attribute("http.status", resp.status_code)
+        
+        if resp.status_code == 429:
+            retry_after = resp.headers.get("retry-after", "")
+            scheduler.backoff(float(retry_after) if retry_after.replace(".", "", 1).isdigit() else 1.0)
         if resp.status_code != 200:
             raise Exception(f"API Error {resp.status_code}: {resp.text}")
         
-        return resp.json()
+        data = resp.json()
+        usage = data.get("usage") or {}
+        scheduler.record_usage(estimated_tokens, usage.get("total_tokens", 0))
+        request.set_attribute("prompt_tokens", usage.get("prompt_tokens", 0))
+        request.set_attribute("completion_tokens", usage.get("completion_tokens", 0))
+        request.set_attribute("cached_tokens", cached_prompt_tokens(usage))
+        self._record_usage(usage)
+        return data
+
+    def _record_usage(self, usage: Dict[str, Any]):
+        """Count prompt, completion and cached prompt tokens from a usage block."""
+        LLM_TOKENS.inc(usage.get("prompt_tokens", 0), model=self.model, kind="prompt")
+        LLM_TOKENS.inc(usage.get("completion_tokens", 0), model=self.model, kind="completion")
+        cached = cached_prompt_tokens(usage)
+        LLM_TOKENS.inc(cached, model=self.model, kind="cached")
+        if usage.get("prompt_tokens"):
+            PROMPT_CACHE_REQUESTS.inc(cache="llm_prompt", result="hit" if cached else "miss")
 
 
 # Module-level function for easy access
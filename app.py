@@ -6,8 +6,11 @@ Uses llama-3.3-8b via Groq API with Model Context Protocol (MCP) for tool callin
 """
 
 import streamlit as st
+import agent_core
 from agent_core import Agent
-import json
+from session_store import create_session_store, new_session_id, start_purger
+from metrics import start_metrics_server
+from slot_parser import strip_annotation
 
 # Page Configuration
 st.set_page_config(
@@ -85,6 +88,43 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_session_store():
+    """Process-wide session store (conversation state lives outside st.session_state); idle sessions are purged hourly"""
+    store = create_session_store()
+    start_purger(store)
+    return store
+
+@st.cache_resource
+def get_metrics_server():
+    """Expose /metrics when GOODFOODS_METRICS_PORT is set"""
+    return start_metrics_server()
+
+@st.cache_resource
+def get_network_stats():
+    """Branch and city counts, computed once per process from the loaded catalog"""
+    branches = agent_core.BRANCHES
+    return {
+        "branches": len(branches),
+        "cities": len({b['city'] for b in branches})
+    }
+
+@st.cache_resource
+def get_branch_table():
+    """Debug table of the catalog (pandas is only imported when this is first needed)"""
+    import pandas as pd
+    display_columns = ['id', 'branch_name', 'city', 'locality', 'rating', 'capacity', 'branch_type']
+    return pd.DataFrame([{col: b.get(col) for col in display_columns} for b in agent_core.BRANCHES])
+
+get_metrics_server()
+
+session_store = get_session_store()
+
+# Only the session ID is kept per browser session, server-side. It never goes
+# into the URL, where it could be shared, logged or bookmarked.
+if "session_id" not in st.session_state:
+    st.session_state.session_id = new_session_id()
+
 # Header
 st.title("🍽️ GoodFoods Reservation Assistant")
 
@@ -146,46 +186,35 @@ with st.sidebar:
     """)
     
     # Stats
-    try:
-        with open('d:/assign/goodfoods_branches.json', 'r', encoding='utf-8') as f:
-            branches_data = json.load(f)
-            total_branches = len(branches_data)
-            total_cities = len(set(b['city'] for b in branches_data))
-        
+    stats = get_network_stats()
+    if stats["branches"]:
         st.markdown("---")
         st.markdown("### 📊 Network Stats")
         col1, col2 = st.columns(2)
         with col1:
-            st.metric("Branches", total_branches)
+            st.metric("Branches", stats["branches"])
         with col2:
-            st.metric("Cities", total_cities)
-    except:
-        pass
+            st.metric("Cities", stats["cities"])
     
     # Reset button
     st.markdown("---")
     if st.button("🔄 Reset Conversation"):
-        st.session_state.messages = []
-        st.session_state.agent = None
+        session_store.delete(st.session_state.session_id)
+        st.session_state.session_id = new_session_id()
         st.rerun()
 
-# Initialize Session State
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-
-if "agent" not in st.session_state and api_key:
-    try:
-        st.session_state.agent = Agent(api_key=api_key, model=model_name)
-    except Exception as e:
-        st.error(f"Failed to initialize agent: {e}")
+stored_state = session_store.get(st.session_state.session_id)
+messages = stored_state["history"] if stored_state else []
 
 # Display Chat History
-for message in st.session_state.messages:
+for message in messages:
     role = message["role"]
     if role == "tool" or role == "system":
         continue  # Skip system and tool messages in UI
     
     content = message.get("content", "")
+    if role == "user":
+        content = strip_annotation(content)
     
     # Show tool calls in assistant messages
     if role == "assistant" and "tool_calls" in message:
@@ -207,26 +236,22 @@ if prompt := st.chat_input("How can I help you dine today? 🍽️"):
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Add to session state
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        
         # Generate assistant response
         with st.chat_message("assistant"):
             with st.spinner("Thinking... 🤔"):
                 try:
-                    # Re-initialize agent if config changed
-                    if (not hasattr(st.session_state, 'agent') or 
-                        st.session_state.agent is None or 
-                        st.session_state.agent.api_key != api_key or 
-                        st.session_state.agent.model != model_name):
-                        st.session_state.agent = Agent(api_key=api_key, model=model_name)
+                    # Load this guest's agent; start over if the model changed
+                    session_id = st.session_state.session_id
+                    agent = session_store.load_agent(session_id, api_key=api_key, model=model_name)
+                    if agent is None:
+                        agent = Agent(api_key=api_key, model=model_name, session_id=session_id)
                     
                     # Get response
-                    response_text = st.session_state.agent.chat(prompt)
+                    response_text = agent.chat(prompt)
                     st.markdown(response_text)
                     
-                    # Sync session state with agent history
-                    st.session_state.messages = st.session_state.agent.history
+                    # Persist the updated conversation for the next turn
+                    session_store.save_agent(session_id, agent)
                     
                 except Exception as e:
                     error_msg = f"❌ An error occurred: {str(e)}"
@@ -235,29 +260,14 @@ if prompt := st.chat_input("How can I help you dine today? 🍽️"):
 
 # Debug Panel (Optional)
 with st.expander("🔍 Debug: View Branch Data"):
-    try:
-        with open('d:/assign/goodfoods_branches.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        st.markdown(f"**Total Branches:** {len(data)}")
-        
-        # Display as searchable dataframe
-        import pandas as pd
-        df = pd.DataFrame(data)
-        
-        # Select columns to display
-        display_columns = ['id', 'branch_name', 'city', 'locality', 'rating', 'capacity', 'branch_type']
-        if all(col in df.columns for col in display_columns):
-            st.dataframe(
-                df[display_columns],
-                use_container_width=True,
-                height=400
-            )
-        else:
-            st.dataframe(df, use_container_width=True, height=400)
-            
-    except Exception as e:
-        st.write(f"No branch data found: {e}")
+    st.markdown(f"**Total Branches:** {get_network_stats()['branches']}")
+    
+    # Expander bodies run on every rerun, so the table is only built on request
+    if st.toggle("Show branch table"):
+        try:
+            st.dataframe(get_branch_table(), use_container_width=True, height=400)
+        except Exception as e:
+            st.write(f"No branch data found: {e}")
 
 # Footer
 st.markdown("---")
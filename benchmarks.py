@@ -0,0 +1,302 @@
+"""
+Microbenchmark Suite for GoodFoods
+
+Times each MCP tool and each reservations_db operation against synthetic
+branch catalogs and reservation histories of increasing size, writes the
+results as JSON and compares them against a stored baseline.
+
+    python benchmarks.py                                # quick tiers
+    python benchmarks.py --full                         # 50/5k/100k branches, 1k..1M reservations
+    python benchmarks.py --save-baseline                # record bench_baseline.json
+    python benchmarks.py --compare bench_baseline.json  # flag regressions (exit code 1)
+
+Each benchmark is named "<operation>@<tier>", e.g. "search_branches.city@5000".
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import agent_core
+import reservations_db
+from data_generator import get_standard_schedule, iter_synthetic_branches, iter_synthetic_reservations, write_jsonl
+from reservation_shards import create_router, shard_path
+
+QUICK_CATALOGS = [50, 5000]
+QUICK_HISTORIES = [1000, 10000]
+FULL_CATALOGS = [50, 5000, 100000]
+FULL_HISTORIES = [1000, 10000, 100000, 1000000]
+
+DEFAULT_BASELINE = "bench_baseline.json"
+DEFAULT_OUTPUT = "bench_results.json"
+
+# A benchmark regresses when its median is this much slower than baseline
+DEFAULT_THRESHOLD = 0.25
+
+
+# --- SYNTHETIC DATA ---
+
+def synthetic_branches(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Build a seeded synthetic catalog of `count` branches."""
+    return list(iter_synthetic_branches(count, seed))
+
+
+def write_synthetic_history(shard_dir: str, count: int, branch_count: int, seed: int = 42):
+    """Stream `count` synthetic reservations straight into a single shard file."""
+    os.makedirs(shard_dir, exist_ok=True)
+    write_jsonl(shard_path(shard_dir, 0), iter_synthetic_reservations(count, branch_count, seed))
+
+
+def fresh_slots(days_ahead: int = 30) -> Iterator[Tuple[str, str, str]]:
+    """
+    Yield (date, time, phone) for a booking no earlier call has made
+
+    Every synthetic branch has the standard schedule, so each (date, time)
+    is open; a new slot and phone per call keeps make_reservation from
+    replaying an earlier booking (see the idempotency key) or filling a slot.
+    """
+    times = get_standard_schedule()["Monday"]
+    day = datetime.now() + timedelta(days=days_ahead)
+    n = 0
+    while True:
+        date = day.strftime("%Y-%m-%d")
+        for time_slot in times:
+            yield date, time_slot, f"98{n:08d}"
+            n += 1
+        day += timedelta(days=1)
+
+
+# --- TIMING ---
+
+def measure(func: Callable[[], Any], min_time: float = 0.2, max_iterations: int = 10000, min_iterations: int = 3) -> Dict[str, Any]:
+    """
+    Time `func` repeatedly
+
+    Runs at least `min_iterations` and keeps going until `min_time` seconds
+    have elapsed or `max_iterations` is reached.
+
+    Returns:
+        Dictionary with median/p95/mean in microseconds and the iteration count
+    """
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_iterations and (len(samples) < min_iterations or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "median_us": round(statistics.median(samples), 2),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        "mean_us": round(statistics.fmean(samples), 2),
+        "iterations": len(samples)
+    }
+
+
+# --- BENCHMARKS ---
+
+def bench_tools(catalog_size: int, results: Dict[str, Any], min_time: float):
+    """Benchmark the MCP tools against a synthetic catalog."""
+    branches = synthetic_branches(catalog_size)
+    original = agent_core.BRANCHES
+    agent_core.set_branches(branches)
+    target = branches[len(branches) // 2]
+    date = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    tier = f"@{catalog_size}"
+
+    with tempfile.TemporaryDirectory() as shard_dir:
+        router = create_router(shard_dir)
+        previous = reservations_db.set_router(router)
+        try:
+            results["search_branches.city" + tier] = measure(
+                lambda: agent_core.search_branches(city="Bangalore"), min_time)
+            results["search_branches.features" + tier] = measure(
+                lambda: agent_core.search_branches(features=["Rooftop Seating", "Live Music"], min_rating=4.2), min_time)
+            results["get_recommendations" + tier] = measure(
+                lambda: agent_core.get_recommendations("romantic dinner with outdoor seating and live music"), min_time)
+            # Each call books a new slot; repeats are timed separately as make_reservation.replay
+            slots = fresh_slots()
+
+            def book_by_id():
+                day, time_slot, phone = next(slots)
+                return agent_core.make_reservation(day, time_slot, 2, branch_id=target["id"],
+                                                   customer_name="Bench Guest", customer_phone=phone)
+
+            def book_by_name():
+                day, time_slot, phone = next(slots)
+                return agent_core.make_reservation(day, time_slot, 2, branch_name=target["locality"][:-1],
+                                                   city=target["city"], customer_name="Bench Guest",
+                                                   customer_phone=phone)
+
+            results["make_reservation.by_id" + tier] = measure(book_by_id, min_time)
+            results["make_reservation.by_name" + tier] = measure(book_by_name, min_time)
+
+            def replay():
+                return agent_core.make_reservation(date, "19:00", 2, branch_id=target["id"],
+                                                   customer_name="Replay Guest", customer_phone="9876543210")
+
+            replay()
+            results["make_reservation.replay" + tier] = measure(replay, min_time)
+            results["branch_resolver.build" + tier] = measure(
+                lambda: agent_core.BranchResolver(branches), min_time, max_iterations=20)
+        finally:
+            reservations_db.set_router(previous)
+            router.close()
+            agent_core.set_branches(original)
+
+
+def bench_store(history_size: int, results: Dict[str, Any], min_time: float):
+    """Benchmark reservations_db operations against a synthetic history."""
+    tier = f"@{history_size}"
+
+    with tempfile.TemporaryDirectory() as shard_dir:
+        write_synthetic_history(shard_dir, history_size, branch_count=50)
+        # First open splits the history into months and archives the past ones
+        create_router(shard_dir).close()
+
+        # Cold open: a fresh router reads only the current and future months
+        def cold_load():
+            router = create_router(shard_dir)
+            router.count()
+            router.close()
+
+        results["store.cold_load" + tier] = measure(cold_load, min_time, max_iterations=5, min_iterations=1)
+
+        router = create_router(shard_dir)
+        previous = reservations_db.set_router(router)
+        counter = iter(range(10 ** 9))
+        upcoming = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+        template = dict(next(iter_synthetic_reservations(1, 50, seed=7)), date=upcoming)
+        # 31+ days back is always in a month that has ended, i.e. archived
+        week_start = (datetime.now() - timedelta(days=37)).strftime("%Y-%m-%d")
+        week_end = (datetime.now() - timedelta(days=31)).strftime("%Y-%m-%d")
+        try:
+            def save():
+                record = dict(template, reservation_id=f"GF-N{next(counter):08d}", created_at=datetime.now().isoformat())
+                reservations_db.save_reservation(record)
+
+            results["store.save_reservation" + tier] = measure(save, min_time)
+            results["store.get_reservation" + tier] = measure(lambda: reservations_db.get_reservation("GF-N00000000"), min_time)
+            results["store.get_all_reservations" + tier] = measure(
+                reservations_db.get_all_reservations, min_time, max_iterations=50, min_iterations=1)
+            results["store.load_active_reservations" + tier] = measure(
+                reservations_db.load_active_reservations, min_time, max_iterations=50, min_iterations=1)
+            results["store.scan_archived_week" + tier] = measure(
+                lambda: reservations_db.find_reservations_in_range(week_start, week_end), min_time, max_iterations=50, min_iterations=1)
+        finally:
+            reservations_db.set_router(previous)
+            router.close()
+
+
+def run_benchmarks(catalogs: List[int], histories: List[int], min_time: float = 0.2, only: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run the suite and return a results document
+
+    Args:
+        catalogs: Branch catalog sizes to benchmark tools against
+        histories: Reservation history sizes to benchmark the store against
+        min_time: Minimum seconds spent per benchmark
+        only: Run only benchmarks whose group ('tools' or 'store') matches
+
+    Returns:
+        Dictionary with 'meta' and 'results' keys
+    """
+    results: Dict[str, Any] = {}
+    if only in (None, "tools"):
+        for size in catalogs:
+            print(f"⏱️  tools @ {size} branches...", file=sys.stderr)
+            bench_tools(size, results, min_time)
+    if only in (None, "store"):
+        for size in histories:
+            print(f"⏱️  store @ {size} reservations...", file=sys.stderr)
+            bench_store(size, results, min_time)
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "catalogs": catalogs,
+            "histories": histories
+        },
+        "results": results
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Compare medians against a baseline document
+
+    Returns:
+        One row per benchmark present in both documents, with the ratio
+        current/baseline and a 'regression' flag
+    """
+    rows = []
+    for name, result in sorted(current["results"].items()):
+        base = baseline.get("results", {}).get(name)
+        if not base or not base["median_us"]:
+            continue
+        ratio = result["median_us"] / base["median_us"]
+        rows.append({
+            "name": name,
+            "baseline_us": base["median_us"],
+            "current_us": result["median_us"],
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1 + threshold
+        })
+    return rows
+
+
+def print_results(document: Dict[str, Any], comparison: Optional[List[Dict[str, Any]]] = None):
+    rows = {row["name"]: row for row in comparison or []}
+    print(f"{'benchmark':<46} {'median':>12} {'p95':>12}  vs baseline")
+    for name, result in sorted(document["results"].items()):
+        line = f"{name:<46} {result['median_us']:>10.1f}us {result['p95_us']:>10.1f}us"
+        row = rows.get(name)
+        if row:
+            flag = "❌ REGRESSION" if row["regression"] else ("✅" if row["ratio"] < 1 else "")
+            line += f"  x{row['ratio']:<6} {flag}"
+        print(line)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="GoodFoods microbenchmarks")
+    parser.add_argument("--full", action="store_true", help="Run the full size tiers (slow)")
+    parser.add_argument("--catalogs", type=int, nargs="+", help="Override catalog sizes")
+    parser.add_argument("--histories", type=int, nargs="+", help="Override history sizes")
+    parser.add_argument("--only", choices=["tools", "store"])
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per benchmark")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--save-baseline", action="store_true", help=f"Also write results to {DEFAULT_BASELINE}")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare against a baseline file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown ratio")
+    args = parser.parse_args()
+
+    catalogs = args.catalogs or (FULL_CATALOGS if args.full else QUICK_CATALOGS)
+    histories = args.histories or (FULL_HISTORIES if args.full else QUICK_HISTORIES)
+
+    document = run_benchmarks(catalogs, histories, args.min_time, args.only)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+
+    comparison = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            comparison = compare(document, json.load(f), args.threshold)
+
+    print_results(document, comparison)
+    print(f"\n📁 Saved to: {args.output}")
+
+    if comparison and any(row["regression"] for row in comparison):
+        sys.exit(1)
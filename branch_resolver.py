@@ -0,0 +1,272 @@
+"""
+Branch Name Resolver for GoodFoods
+
+Resolves free-text branch references ("Koramangla", "Bandra West",
+"CP Delhi") to catalog entries. The index is built once when the catalog
+is loaded so that each lookup only touches the posting lists of the
+character n-grams in the query, independent of how many branches exist.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+BRAND_PREFIX = "goodfoods"
+
+# Common alternate spellings and abbreviations guests use.
+# Keys and values are compared after normalization.
+CITY_ALIASES = {
+    "bengaluru": "bangalore",
+    "bombay": "mumbai",
+    "madras": "chennai",
+    "new delhi": "delhi",
+    "ncr": "delhi",
+    "vizag": "visakhapatnam",
+    "cochin": "kochi",
+    "mysuru": "mysore",
+    "baroda": "vadodara",
+    "amdavad": "ahmedabad",
+}
+
+LOCALITY_ALIASES = {
+    "cp": "connaught place",
+    "hsr": "hsr layout",
+    "bkc": "bandra",
+    "old madras road": "indiranagar",
+    "hitec city": "hitech city",
+    "cyber city": "hitech city",
+    "kp": "koregaon park",
+    "jubilee": "jubilee hills",
+    "banjara": "banjara hills",
+    "indira nagar": "indiranagar",
+    "mahatma gandhi road": "mg road",
+}
+
+# Minimum similarity for a candidate to be considered at all
+MIN_SCORE = 0.4
+
+# A winner must beat the runner-up by this margin to be auto-selected
+AMBIGUITY_MARGIN = 0.08
+
+# N-grams shared by more than this fraction of keys carry almost no signal
+# and are skipped so lookups stay cheap on very large catalogs
+MAX_GRAM_DF = 0.05
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize a branch reference for indexing and lookup
+
+    Lowercases, strips the brand prefix and punctuation, and collapses
+    whitespace ("GoodFoods - HSR Layout!" -> "hsr layout").
+    """
+    text = re.sub(r"[^a-z0-9]+", " ", text.lower())
+    tokens = [t for t in text.split() if t != BRAND_PREFIX]
+    return " ".join(tokens)
+
+
+def char_ngrams(text: str, n: int = 3) -> set:
+    """Return the set of padded character n-grams of a normalized string."""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def _name_fields(branches) -> Iterator[Tuple[int, str, str, str]]:
+    """Yield (id, city, locality, branch_name) for a list or compiled catalog."""
+    if hasattr(branches, "name_fields"):
+        return branches.name_fields()
+    return ((b['id'], b['city'], b['locality'], b['branch_name']) for b in branches)
+
+
+@dataclass
+class Resolution:
+    """Result of resolving a branch reference"""
+    query: str
+    best: Optional[Dict[str, Any]] = None
+    candidates: List[Tuple[float, Dict[str, Any]]] = field(default_factory=list)
+
+    @property
+    def is_ambiguous(self) -> bool:
+        return self.best is None and len(self.candidates) > 1
+
+
+class BranchResolver:
+    """
+    Character n-gram index over branch names and localities
+
+    Each branch contributes a few search keys (locality, branch name and
+    "locality city"). A query is scored against every key that shares at
+    least one informative n-gram using the Dice coefficient, then the best
+    key per branch wins.
+    """
+
+    def __init__(
+        self,
+        branches: List[Dict[str, Any]],
+        city_aliases: Optional[Dict[str, str]] = None,
+        locality_aliases: Optional[Dict[str, str]] = None,
+        n: int = 3
+    ):
+        """
+        Build the index
+
+        Args:
+            branches: Branch catalog (list of dicts or a CompiledCatalog)
+            city_aliases: Override for the city alias table
+            locality_aliases: Override for the locality alias table
+            n: N-gram size
+        """
+        self.n = n
+        self.branches = branches
+        self.city_aliases = CITY_ALIASES if city_aliases is None else city_aliases
+        self.locality_aliases = LOCALITY_ALIASES if locality_aliases is None else locality_aliases
+
+        self.id_index: Dict[int, int] = {}
+        self.branch_city: List[str] = []
+        self.city_branches: Dict[str, List[int]] = {}
+
+        # Search keys: key text -> index, key index -> owning branch index
+        self.exact_keys: Dict[str, List[int]] = {}
+        self.key_branch: List[int] = []
+        self.key_gram_count: List[int] = []
+        self.postings: Dict[str, List[int]] = {}
+
+        for idx, (branch_id, city, locality, branch_name) in enumerate(_name_fields(branches)):
+            self.id_index[branch_id] = idx
+            city = normalize(city)
+            self.branch_city.append(city)
+            self.city_branches.setdefault(city, []).append(idx)
+
+            locality = normalize(locality)
+            keys = {locality, normalize(branch_name), f"{locality} {city}"}
+            for key in keys:
+                if key:
+                    self._add_key(key, idx)
+
+        # Drop n-grams that are too common to discriminate
+        max_df = max(50, int(len(self.key_branch) * MAX_GRAM_DF))
+        self.stop_grams = {g for g, p in self.postings.items() if len(p) > max_df}
+
+    def get_branch(self, branch_id: int) -> Optional[Dict[str, Any]]:
+        """Look up a branch by its ID."""
+        idx = self.id_index.get(branch_id)
+        return self.branches[idx] if idx is not None else None
+
+    def _add_key(self, key: str, branch_idx: int):
+        key_idx = len(self.key_branch)
+        self.key_branch.append(branch_idx)
+        grams = char_ngrams(key, self.n)
+        self.key_gram_count.append(len(grams))
+        self.exact_keys.setdefault(key, []).append(key_idx)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(key_idx)
+
+    def _canonical_city(self, city: Optional[str]) -> Optional[str]:
+        if not city:
+            return None
+        city = normalize(city)
+        return self.city_aliases.get(city, city)
+
+    def _expand_aliases(self, query: str) -> str:
+        if query in self.locality_aliases:
+            return self.locality_aliases[query]
+        tokens = query.split()
+        return " ".join(self.locality_aliases.get(t, t) for t in tokens)
+
+    def _city_filter(self, city: Optional[str]) -> Optional[set]:
+        """Return the set of normalized city names allowed, or None for no filter."""
+        city = self._canonical_city(city)
+        if not city:
+            return None
+        if city in self.city_branches:
+            return {city}
+        # Fall back to substring match ("delhi ncr" -> "delhi")
+        return {name for name in self.city_branches if name in city or city in name}
+
+    def score(self, query: str, city: Optional[str] = None) -> List[Tuple[float, int]]:
+        """
+        Score branches against a query
+
+        Args:
+            query: Free-text branch reference
+            city: Optional city to restrict results to
+
+        Returns:
+            List of (score, branch_index) sorted best first
+        """
+        query = self._expand_aliases(normalize(query))
+        if not query:
+            return []
+
+        # A city name inside the query acts as a filter as well
+        if not city:
+            tokens = query.split()
+            for width in (2, 1):
+                if len(tokens) <= width:
+                    continue
+                tail = " ".join(tokens[-width:])
+                tail = self.city_aliases.get(tail, tail)
+                if tail in self.city_branches:
+                    city = tail
+                    query = " ".join(tokens[:-width])
+                    break
+        allowed = self._city_filter(city)
+
+        best: Dict[int, float] = {}
+
+        # Exact key hit needs no similarity scoring
+        for key_idx in self.exact_keys.get(query, []):
+            branch_idx = self.key_branch[key_idx]
+            if allowed is None or self.branch_city[branch_idx] in allowed:
+                best[branch_idx] = 1.0
+        if best:
+            return sorted(((s, b) for b, s in best.items()), key=lambda x: (-x[0], x[1]))
+
+        grams = char_ngrams(query, self.n)
+        informative = [g for g in grams if g in self.postings and g not in self.stop_grams]
+        if not informative:
+            informative = sorted(
+                (g for g in grams if g in self.postings),
+                key=lambda g: len(self.postings[g])
+            )[:3]
+
+        overlap: Dict[int, int] = {}
+        for gram in informative:
+            for key_idx in self.postings[gram]:
+                overlap[key_idx] = overlap.get(key_idx, 0) + 1
+
+        q_len = len(grams)
+        for key_idx, common in overlap.items():
+            branch_idx = self.key_branch[key_idx]
+            if allowed is not None and self.branch_city[branch_idx] not in allowed:
+                continue
+            dice = 2.0 * common / (q_len + self.key_gram_count[key_idx])
+            if dice >= MIN_SCORE and dice > best.get(branch_idx, 0.0):
+                best[branch_idx] = dice
+
+        return sorted(((s, b) for b, s in best.items()), key=lambda x: (-x[0], x[1]))
+
+    def resolve(self, query: str, city: Optional[str] = None, limit: int = 5) -> Resolution:
+        """
+        Resolve a branch reference to a single branch or a ranked shortlist
+
+        Args:
+            query: Free-text branch reference (e.g., 'Koramangla')
+            city: Optional city to disambiguate (aliases such as 'Bengaluru' accepted)
+            limit: Maximum shortlist length
+
+        Returns:
+            Resolution with `best` set when the match is unambiguous
+        """
+        scored = self.score(query, city)[:limit]
+        resolution = Resolution(
+            query=query,
+            candidates=[(round(s, 3), self.branches[b]) for s, b in scored]
+        )
+        if len(scored) == 1:
+            resolution.best = self.branches[scored[0][1]]
+        elif len(scored) > 1 and scored[0][0] - scored[1][0] >= AMBIGUITY_MARGIN:
+            resolution.best = self.branches[scored[0][1]]
+        return resolution
@@ -0,0 +1,418 @@
+"""
+Compiled Branch Catalog for GoodFoods
+
+Compiles goodfoods_branches.json into a columnar binary file that is
+memory-mapped read-only at runtime. Worker processes map the same file,
+so the OS shares its pages between them and startup does not parse JSON.
+
+Layout (all sections 8-byte aligned, native byte order):
+
+- numeric columns: id, rating, capacity
+- interned string tables: cities, localities, branch types, price ranges,
+  feature and cuisine vocabularies, distinct weekly schedules (as JSON)
+- per-branch string heaps: branch names and addresses
+- interned ordered lists: feature lists and cuisine lists
+- feature bitsets: `feature_words` 64-bit words per branch
+
+    python catalog_compiler.py goodfoods_branches.json goodfoods_branches.gfcat
+
+Columns are exposed as zero-copy memoryviews (or NumPy arrays when NumPy
+is installed); `catalog[i]` materializes a branch dictionary on demand.
+"""
+
+import heapq
+import json
+import mmap
+import os
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from data_paths import data_path
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; memoryviews are used instead
+    np = None
+
+MAGIC = b"GFCAT001"
+ALIGN = 8
+
+# --- COMPILER ---
+
+class _Interner:
+    """Assigns stable indices to distinct values"""
+
+    def __init__(self):
+        self.index: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def add(self, value) -> int:
+        idx = self.index.get(value)
+        if idx is None:
+            idx = self.index[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+
+def _string_heap(strings: Iterable[str]) -> Tuple[array, bytes]:
+    offsets = array("I", [0])
+    data = bytearray()
+    for s in strings:
+        data += s.encode("utf-8")
+        offsets.append(len(data))
+    return offsets, bytes(data)
+
+
+def _list_table(lists: List[Tuple[int, ...]]) -> Tuple[array, array]:
+    offsets = array("I", [0])
+    items = array("I")
+    for values in lists:
+        items.extend(values)
+        offsets.append(len(items))
+    return offsets, items
+
+
+def _iter_source(path: str) -> Iterator[Dict[str, Any]]:
+    """Read branches from a JSON array or stream them from JSON-lines."""
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+def compile_catalog(source: str, output: str) -> int:
+    """
+    Compile a branch catalog into the columnar binary format
+
+    Args:
+        source: goodfoods_branches.json (JSON array) or a .jsonl catalog
+        output: Output .gfcat path
+
+    Returns:
+        Number of branches compiled
+    """
+    ids, ratings, capacities = array("i"), array("f"), array("i")
+    city_col, locality_col, type_col, price_col = array("I"), array("I"), array("I"), array("I")
+    feature_list_col, cuisine_list_col, schedule_col = array("I"), array("I"), array("I")
+    names, addresses = [], []
+    cities, localities, types, prices = _Interner(), _Interner(), _Interner(), _Interner()
+    features, cuisines = _Interner(), _Interner()
+    feature_lists, cuisine_lists, schedules = _Interner(), _Interner(), _Interner()
+    branch_feature_ids: List[Tuple[int, ...]] = []
+
+    for branch in _iter_source(source):
+        ids.append(branch["id"])
+        ratings.append(branch["rating"])
+        capacities.append(branch["capacity"])
+        city_col.append(cities.add(branch["city"]))
+        locality_col.append(localities.add(branch["locality"]))
+        type_col.append(types.add(branch.get("branch_type", "")))
+        price_col.append(prices.add(branch.get("price_range", "")))
+        feature_ids = tuple(features.add(f) for f in branch["features"])
+        branch_feature_ids.append(feature_ids)
+        feature_list_col.append(feature_lists.add(feature_ids))
+        cuisine_list_col.append(cuisine_lists.add(tuple(cuisines.add(c) for c in branch["cuisine_specialties"])))
+        schedule_col.append(schedules.add(json.dumps(branch.get("weekly_schedule", {}), sort_keys=False)))
+        names.append(branch["branch_name"])
+        addresses.append(branch["full_address"])
+
+    count = len(ids)
+    words = max(1, (len(features.values) + 63) // 64)
+    bits = array("Q", bytes(8 * words * count))
+    for i, feature_ids in enumerate(branch_feature_ids):
+        for f in feature_ids:
+            bits[i * words + f // 64] |= 1 << (f % 64)
+
+    sections: Dict[str, Any] = {
+        "id": ids, "rating": ratings, "capacity": capacities,
+        "city": city_col, "locality": locality_col, "branch_type": type_col, "price_range": price_col,
+        "feature_list": feature_list_col, "cuisine_list": cuisine_list_col, "schedule": schedule_col,
+        "feature_bits": bits,
+    }
+    for name, values in (
+        ("cities", cities.values), ("localities", localities.values), ("branch_types", types.values),
+        ("price_ranges", prices.values), ("features", features.values), ("cuisines", cuisines.values),
+        ("schedules", schedules.values), ("branch_names", names), ("addresses", addresses),
+    ):
+        offsets, data = _string_heap(values)
+        sections[f"{name}.offsets"] = offsets
+        sections[f"{name}.data"] = data
+    for name, interner in (("feature_lists", feature_lists), ("cuisine_lists", cuisine_lists)):
+        offsets, items = _list_table(interner.values)
+        sections[f"{name}.offsets"] = offsets
+        sections[f"{name}.items"] = items
+
+    _write_sections(output, count, words, sections)
+    return count
+
+
+def _write_sections(output: str, count: int, words: int, sections: Dict[str, Any]):
+    layout = {}
+    position = 0
+    for name, values in sections.items():
+        fmt = values.typecode if isinstance(values, array) else "B"
+        nbytes = len(values) * (values.itemsize if isinstance(values, array) else 1)
+        layout[name] = {"offset": position, "format": fmt, "length": len(values), "nbytes": nbytes}
+        position += nbytes + (-nbytes % ALIGN)
+
+    header = json.dumps({
+        "version": 1, "count": count, "feature_words": words,
+        "byteorder": sys.byteorder, "sections": layout
+    }).encode("utf-8")
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % ALIGN)
+    base = len(MAGIC) + 8 + len(header)
+
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, values in sections.items():
+            assert f.tell() == base + layout[name]["offset"]
+            f.write(values.tobytes() if isinstance(values, array) else values)
+            f.write(b"\0" * (-layout[name]["nbytes"] % ALIGN))
+    # Atomic swap so running workers keep their old mapping intact
+    os.replace(tmp, output)
+
+
+# --- RUNTIME READER ---
+
+class CompiledCatalog(Sequence):
+    """
+    Read-only, memory-mapped view of a compiled catalog
+
+    Behaves like a list of branch dictionaries (`len`, indexing,
+    iteration) while keeping all data in the shared mapping.
+    `search()` filters on the columns and only materializes matches.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compiled GoodFoods catalog")
+        header_len = int.from_bytes(self._mm[len(MAGIC):len(MAGIC) + 8], "little")
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mm[start:start + header_len])
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was compiled on a {self.header['byteorder']}-endian machine")
+        self.count = self.header["count"]
+        self.feature_words = self.header["feature_words"]
+
+        base = start + header_len
+        buffer = memoryview(self._mm)
+        self._views: Dict[str, memoryview] = {}
+        for name, s in self.header["sections"].items():
+            view = buffer[base + s["offset"]:base + s["offset"] + s["nbytes"]]
+            self._views[name] = view.cast(s["format"]) if s["format"] != "B" else view
+
+        # Small interned tables are decoded once
+        self.cities = self._decode_table("cities")
+        self.localities = self._decode_table("localities")
+        self.branch_types = self._decode_table("branch_types")
+        self.price_ranges = self._decode_table("price_ranges")
+        self.features = self._decode_table("features")
+        self.cuisines = self._decode_table("cuisines")
+        self._feature_lookup = {f.lower(): i for i, f in enumerate(self.features)}
+        self._schedules: Dict[int, Dict[str, List[str]]] = {}
+        self._names_lower: Optional[List[str]] = None
+
+    # --- column access ---
+
+    def column(self, name: str):
+        """Zero-copy view of a column (a NumPy array when NumPy is available)."""
+        view = self._views[name]
+        if np is not None:
+            return np.frombuffer(view, dtype=np.dtype(view.format))
+        return view
+
+    def _decode_table(self, name: str) -> List[str]:
+        return [self._string(name, i) for i in range(len(self._views[f"{name}.offsets"]) - 1)]
+
+    def _string(self, heap: str, i: int) -> str:
+        offsets = self._views[f"{heap}.offsets"]
+        return bytes(self._views[f"{heap}.data"][offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    def _list(self, table: str, i: int) -> List[int]:
+        offsets = self._views[f"{table}.offsets"]
+        return self._views[f"{table}.items"][offsets[i]:offsets[i + 1]].tolist()
+
+    def _schedule(self, i: int) -> Dict[str, List[str]]:
+        if i not in self._schedules:
+            self._schedules[i] = json.loads(self._string("schedules", i))
+        return self._schedules[i]
+
+    # --- sequence protocol ---
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.branch(j) for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("branch index out of range")
+        return self.branch(i)
+
+    def branch(self, i: int) -> Dict[str, Any]:
+        """Materialize branch `i` as a dictionary in goodfoods_branches.json format."""
+        v = self._views
+        return {
+            "id": v["id"][i],
+            "branch_name": self._string("branch_names", i),
+            "city": self.cities[v["city"][i]],
+            "locality": self.localities[v["locality"][i]],
+            "full_address": self._string("addresses", i),
+            "cuisine_specialties": [self.cuisines[c] for c in self._list("cuisine_lists", v["cuisine_list"][i])],
+            "price_range": self.price_ranges[v["price_range"][i]],
+            "rating": round(v["rating"][i], 1),
+            "capacity": v["capacity"][i],
+            "features": [self.features[f] for f in self._list("feature_lists", v["feature_list"][i])],
+            "weekly_schedule": self._schedule(v["schedule"][i]),
+            "branch_type": self.branch_types[v["branch_type"][i]],
+        }
+
+    def name_fields(self) -> Iterator[Tuple[int, str, str, str]]:
+        """Yield (id, city, locality, branch_name) without materializing branches."""
+        v = self._views
+        for i in range(self.count):
+            yield v["id"][i], self.cities[v["city"][i]], self.localities[v["locality"][i]], self._string("branch_names", i)
+
+    # --- filtering ---
+
+    def search(
+        self,
+        city: Optional[str] = None,
+        locality: Optional[str] = None,
+        features: Optional[List[str]] = None,
+        min_rating: Optional[float] = None,
+        min_capacity: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Filter branches on the columns (same semantics as search_branches)
+
+        Returns:
+            Matching branch dictionaries in catalog order, at most `limit`
+        """
+        v = self._views
+        city_ok = {i for i, c in enumerate(self.cities) if city.lower() in c.lower()} if city else None
+        locality_ok = {i for i, l in enumerate(self.localities) if locality.lower() in l.lower()} if locality else None
+
+        required = [0] * self.feature_words
+        for feature in features or []:
+            f = self._feature_lookup.get(feature.lower())
+            if f is None:
+                return []
+            required[f // 64] |= 1 << (f % 64)
+        required_words = [(w, mask) for w, mask in enumerate(required) if mask]
+
+        if min_rating:
+            # float32 storage: compare with the same precision the JSON value had
+            min_rating = min_rating - 1e-6
+
+        bits, words = v["feature_bits"], self.feature_words
+        matches = []
+        for i in range(self.count):
+            if city_ok is not None and v["city"][i] not in city_ok:
+                continue
+            if locality_ok is not None and v["locality"][i] not in locality_ok:
+                continue
+            if any(bits[i * words + w] & mask != mask for w, mask in required_words):
+                continue
+            if min_rating and v["rating"][i] < min_rating:
+                continue
+            if min_capacity and v["capacity"][i] < min_capacity:
+                continue
+            matches.append(self.branch(i))
+            if limit and len(matches) >= limit:
+                break
+        return matches
+
+    def recommend(self, keywords: List[str], limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        Score branches on the columns (same scoring as get_recommendations)
+
+        Each keyword found in a branch's name, city, locality, features or
+        cuisines scores 1, plus 0.5 more when it is in a feature; the
+        rating adds rating / 5. Keywords are matched against the interned
+        tables once, so branches are compared by index.
+
+        Returns:
+            The `limit` best-scoring branch dictionaries, ties in catalog order
+        """
+        v = self._views
+        if self._names_lower is None:
+            self._names_lower = [self._string("branch_names", i).lower() for i in range(self.count)]
+        names = self._names_lower
+
+        def hits(table: List[str], keyword: str) -> set:
+            return {i for i, value in enumerate(table) if keyword in value.lower()}
+
+        def list_hits(lists: str, vocabulary: set) -> set:
+            offsets = v[f"{lists}.offsets"]
+            items = v[f"{lists}.items"]
+            return {j for j in range(len(offsets) - 1) if vocabulary.intersection(items[offsets[j]:offsets[j + 1]].tolist())}
+
+        # Per keyword: matching city, locality, feature-list and cuisine-list indices
+        matchers = [
+            (keyword, hits(self.cities, keyword), hits(self.localities, keyword),
+             list_hits("feature_lists", hits(self.features, keyword)),
+             list_hits("cuisine_lists", hits(self.cuisines, keyword)))
+            for keyword in keywords
+        ]
+
+        scores = []
+        for i in range(self.count):
+            city, locality, feature_list, cuisine_list = v["city"][i], v["locality"][i], v["feature_list"][i], v["cuisine_list"][i]
+            matched = in_features = 0
+            for keyword, cities, localities, feature_lists, cuisine_lists in matchers:
+                if feature_list in feature_lists:
+                    matched += 1
+                    in_features += 1
+                elif keyword in names[i] or city in cities or locality in localities or cuisine_list in cuisine_lists:
+                    matched += 1
+            # Added up in the same order as get_recommendations, so equal scores tie the same way
+            score = matched + round(v["rating"][i], 1) / 5.0
+            for _ in range(in_features):
+                score += 0.5
+            if score > 0:
+                scores.append((score, i))
+        return [self.branch(i) for _, i in heapq.nlargest(limit, scores, key=lambda s: s[0])]
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        self._views.clear()
+        self._mm.close()
+        self._file.close()
+
+
+def open_catalog(path: str) -> CompiledCatalog:
+    """Open a compiled catalog for reading."""
+    return CompiledCatalog(path)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Compile a GoodFoods branch catalog")
+    parser.add_argument("source", nargs="?", default=data_path("goodfoods_branches.json"))
+    parser.add_argument("output", nargs="?", default=None)
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.source)[0] + ".gfcat"
+    start = time.perf_counter()
+    count = compile_catalog(args.source, output)
+    print(f"✅ Compiled {count} branches in {time.perf_counter() - start:.2f}s")
+    print(f"📁 Saved to: {output} ({os.path.getsize(output):,} bytes)")
@@ -0,0 +1,285 @@
+"""
+Reservation Change Feed for GoodFoods
+
+An append-only log of reservation changes that consumers tail instead of
+re-reading the whole store. Every booking, change and cancellation the
+store makes is published as one JSON line:
+
+    {"op": "create" | "update" | "cancel", "reservation_id": "GF-12345",
+     "version": 2, "at": "2025-12-01T19:02:11", "record": {...}}
+
+An event's offset is its byte position in the log, so offsets increase
+monotonically across every writing process and a consumer resumes from a
+saved offset with a single seek:
+
+    feed = ChangeFeed("reservation_shards/changes.jsonl")
+    events, offset = feed.read(offset=0)
+    for event in feed.tail(offset):         # blocks for new events
+        view.apply(event)
+
+Consumers in the publishing process are woken as soon as events are
+written; consumers in other processes poll the file. Events carry the
+full record and its version, so applying an event twice is safe when a
+consumer keeps the highest version per reservation. The store publishes
+each change while it still holds the shard lock, so the events of one
+reservation are in the same order as its versions.
+
+Writers and readers hold a file lock (`changes.jsonl.lock`). When the log
+reaches GOODFOODS_CHANGE_FEED_MAX_MB it is renamed to
+`changes.<first offset>.jsonl` and a new one is started; offsets carry on
+across files. Only the newest GOODFOODS_CHANGE_FEED_KEEP rotated files are
+kept, so a consumer that falls further behind resumes at the oldest event
+still kept.
+
+Follow the feed from another process:
+
+    python change_feed.py reservation_shards/changes.jsonl --follow
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from data_paths import data_path
+from file_lock import FileLock
+from metrics import REGISTRY
+
+CHANGE_EVENTS = REGISTRY.counter("goodfoods_change_events_total", "Reservation change events published", ["op"])
+
+# The live log is rotated at this size; this many rotated logs are kept
+DEFAULT_MAX_BYTES = int(float(os.environ.get("GOODFOODS_CHANGE_FEED_MAX_MB", "64")) * 1024 * 1024)
+DEFAULT_KEEP = int(os.environ.get("GOODFOODS_CHANGE_FEED_KEEP", "4"))
+
+def change_event(op: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the event published for a saved reservation version."""
+    if op == "update" and record.get("status") == "cancelled":
+        op = "cancel"
+    return {
+        "op": op,
+        "reservation_id": record["reservation_id"],
+        "version": record.get("version", 1),
+        "at": datetime.now().isoformat(),
+        "record": record
+    }
+
+
+class ChangeFeed:
+    """
+    Append-only JSON-lines change log with byte offsets
+
+    Args:
+        path: Live log file (created on first publish)
+        poll_interval: Seconds between checks for events written by other processes
+        max_bytes: Size at which the live log is rotated
+        keep: Rotated logs kept (at least 1)
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.5, max_bytes: int = DEFAULT_MAX_BYTES, keep: int = DEFAULT_KEEP):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self.keep = max(1, keep)
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock")
+        self._changed = threading.Condition()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def publish(self, events: List[Dict[str, Any]]) -> int:
+        """
+        Append events in one write
+
+        Returns:
+            Offset of the first event
+        """
+        if not events:
+            return self.end_offset
+        data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode("utf-8")
+        with self._lock, self._file_lock:
+            base = self._live_base(self._rotated())
+            with open(self.path, "ab") as f:
+                offset = base + f.seek(0, os.SEEK_END)
+                f.write(data)
+            if offset - base + len(data) >= self.max_bytes:
+                self._rotate(base)
+        for event in events:
+            CHANGE_EVENTS.inc(op=event["op"])
+        self._wake()
+        return offset
+
+    def _rotated(self) -> List[Tuple[int, str]]:
+        """(first offset, path) of each rotated log, oldest first."""
+        directory, name = os.path.split(os.path.abspath(self.path))
+        stem, suffix = os.path.splitext(name)
+        rotated = []
+        for entry in os.listdir(directory):
+            first = entry[len(stem) + 1:-len(suffix)] if entry.startswith(stem + ".") and entry.endswith(suffix) else ""
+            if first.isdigit():
+                rotated.append((int(first), os.path.join(directory, entry)))
+        return sorted(rotated)
+
+    def _live_base(self, rotated: List[Tuple[int, str]]) -> int:
+        """Offset of the first byte of the live log."""
+        if not rotated:
+            return 0
+        first, path = rotated[-1]
+        return first + os.path.getsize(path)
+
+    def _rotate(self, base: int):
+        """Rename the live log and delete the oldest rotated ones (caller holds both locks)."""
+        stem, suffix = os.path.splitext(self.path)
+        os.replace(self.path, f"{stem}.{base:016d}{suffix}")
+        for _, path in self._rotated()[:-self.keep]:
+            os.remove(path)
+
+    @property
+    def end_offset(self) -> int:
+        """Offset the next event will be written at."""
+        with self._lock, self._file_lock:
+            base = self._live_base(self._rotated())
+            try:
+                return base + os.path.getsize(self.path)
+            except OSError:
+                return base
+
+    def read(self, offset: int = 0, limit: int = 1000) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Read events starting at `offset`
+
+        An offset older than the oldest rotated log still kept starts at
+        that log's first event.
+
+        Args:
+            offset: 0, an event's offset, or a `next_offset` returned earlier
+            limit: Maximum number of events
+
+        Returns:
+            (events, next_offset) — each event has its "offset" added
+        """
+        events = []
+        with self._lock, self._file_lock:
+            rotated = self._rotated()
+            logs = rotated + [(self._live_base(rotated), self.path)]
+            offset = max(offset, logs[0][0])
+            for i, (first, path) in enumerate(logs):
+                end = logs[i + 1][0] if i + 1 < len(logs) else None
+                if end is not None and offset >= end:
+                    continue
+                try:
+                    f = open(path, "rb")
+                except FileNotFoundError:
+                    break
+                with f:
+                    f.seek(offset - first)
+                    while len(events) < limit:
+                        line = f.readline()
+                        # Stop at a trailing partial line (a write cut short)
+                        if not line.endswith(b"\n"):
+                            break
+                        if line.strip():
+                            event = json.loads(line)
+                            event["offset"] = offset
+                            events.append(event)
+                        offset += len(line)
+                if len(events) >= limit:
+                    break
+        return events, offset
+
+    def tail(self, offset: Optional[int] = None, stop: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield events from `offset` (default: the end) as they are published
+
+        Blocks between events; returns once `stop` is set.
+        """
+        if offset is None:
+            offset = self.end_offset
+        while stop is None or not stop.is_set():
+            events, offset = self.read(offset)
+            yield from events
+            if not events:
+                self.wait(offset)
+
+    def wait(self, offset: int, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until an event is written at or after `offset`
+
+        Publishers in this process wake waiters immediately; events from
+        other processes are noticed within the poll interval.
+
+        Returns:
+            True if new events are available
+        """
+        with self._changed:
+            if self.end_offset <= offset:
+                self._changed.wait(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+        return self.end_offset > offset
+
+    def _wake(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None], offset: Optional[int] = None) -> "Subscription":
+        """
+        Call `callback` for every event from `offset` (default: the end) in a background thread
+
+        Returns:
+            Subscription; call stop() to end it
+        """
+        return Subscription(self, callback, offset)
+
+
+class Subscription:
+    """
+    Background consumer of a ChangeFeed (see ChangeFeed.subscribe)
+
+    `offset` is where the subscription resumes: the offset after the last
+    event passed to the callback.
+    """
+
+    def __init__(self, feed: ChangeFeed, callback: Callable[[Dict[str, Any]], None], offset: Optional[int] = None):
+        self.feed = feed
+        self.callback = callback
+        self.offset = feed.end_offset if offset is None else offset
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            events, next_offset = self.feed.read(self.offset)
+            for event in events:
+                try:
+                    self.callback(event)
+                except Exception as e:
+                    print(f"Warning: Change feed subscriber failed at offset {event['offset']}: {e}")
+            self.offset = next_offset
+            if not events:
+                self.feed.wait(self.offset)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop consuming and wait for the thread to finish."""
+        self._stop.set()
+        self.feed._wake()
+        self._thread.join(timeout)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print reservation change events")
+    parser.add_argument("path", nargs="?", default=data_path(os.path.join("reservation_shards", "changes.jsonl")))
+    parser.add_argument("--offset", type=int, default=0, help="Offset to start from")
+    parser.add_argument("--follow", action="store_true", help="Keep waiting for new events")
+    args = parser.parse_args()
+
+    feed = ChangeFeed(args.path)
+    if args.follow:
+        events = feed.tail(args.offset)
+    else:
+        events, _ = feed.read(args.offset, limit=10 ** 9)
+    try:
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False))
+    except KeyboardInterrupt:
+        pass
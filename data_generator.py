@@ -4,11 +4,30 @@ GoodFoods Branch Data Generator
 Generates 50-100 branch locations for the GoodFoods restaurant chain
 across multiple cities in India. Each branch represents a location of
 the same brand with consistent cuisine offerings but varying features.
+
+For benchmarks and capacity tests it can also generate seeded synthetic
+catalogs of 10k-1M branches and multi-million-row reservation histories,
+streamed to JSON-lines or SQLite:
+
+    python data_generator.py                                   # the 51 real branches
+    python data_generator.py --branches 100000 --output branches.jsonl
+    python data_generator.py --reservations 5000000 --branches 100000 \
+        --output history.sqlite --workers 4
 """
 
 import json
+import math
+import os
 import random
-from datetime import datetime, timedelta
+import shutil
+import sqlite3
+import tempfile
+from datetime import date as date_type, datetime, timedelta
+from functools import lru_cache
+from multiprocessing import Pool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from data_paths import data_path
 
 # --- GOODFOODS BRAND CONFIGURATION ---
 
@@ -120,24 +139,26 @@ def get_standard_schedule():
     week_days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     return {day: slots for day in week_days}
 
-def generate_capacity(location_type):
+def generate_capacity(location_type, rng=random):
     """Generate seating capacity based on location type"""
     if location_type == "metro":
-        return random.randint(80, 200)  # Larger metro branches
+        return rng.randint(80, 200)  # Larger metro branches
     elif location_type == "tier2":
-        return random.randint(50, 120)  # Medium tier-2 branches
+        return rng.randint(50, 120)  # Medium tier-2 branches
     else:  # tier3
-        return random.randint(30, 80)   # Smaller tier-3 branches
+        return rng.randint(30, 80)   # Smaller tier-3 branches
 
 def add_common_features(specific_features):
     """Add common features that all GoodFoods branches have"""
     common = ["Professional Staff", "Clean & Hygienic", "Card Payment"]
-    return list(set(specific_features + common))
+    # dict.fromkeys de-duplicates while keeping a reproducible order
+    return list(dict.fromkeys(specific_features + common))
 
 # --- MAIN GENERATION FUNCTION ---
 
-def generate_goodfoods_branches():
-    """Generate all GoodFoods branch locations"""
+def generate_goodfoods_branches(seed=None):
+    """Generate all GoodFoods branch locations (reproducible when seeded)"""
+    rng = random.Random(seed)
     branches = []
     branch_id = 1
     
@@ -154,8 +175,8 @@ def generate_goodfoods_branches():
                 "full_address": f"{locality}, {city}",
                 "cuisine_specialties": CUISINE_SPECIALTIES,
                 "price_range": PRICE_RANGE,
-                "rating": round(random.uniform(*BASE_RATING_RANGE), 1),
-                "capacity": generate_capacity("metro"),
+                "rating": round(rng.uniform(*BASE_RATING_RANGE), 1),
+                "capacity": generate_capacity("metro", rng),
                 "features": add_common_features(features),
                 "weekly_schedule": standard_schedule,
                 "branch_type": "Metro"
@@ -173,8 +194,8 @@ def generate_goodfoods_branches():
                 "full_address": f"{locality}, {city}",
                 "cuisine_specialties": CUISINE_SPECIALTIES,
                 "price_range": PRICE_RANGE,
-                "rating": round(random.uniform(*BASE_RATING_RANGE), 1),
-                "capacity": generate_capacity("tier2"),
+                "rating": round(rng.uniform(*BASE_RATING_RANGE), 1),
+                "capacity": generate_capacity("tier2", rng),
                 "features": add_common_features(features),
                 "weekly_schedule": standard_schedule,
                 "branch_type": "Tier-2"
@@ -192,8 +213,8 @@ def generate_goodfoods_branches():
                 "full_address": f"{locality}, {city}",
                 "cuisine_specialties": CUISINE_SPECIALTIES,
                 "price_range": PRICE_RANGE,
-                "rating": round(random.uniform(*BASE_RATING_RANGE), 1),
-                "capacity": generate_capacity("tier3"),
+                "rating": round(rng.uniform(*BASE_RATING_RANGE), 1),
+                "capacity": generate_capacity("tier3", rng),
                 "features": add_common_features(features),
                 "weekly_schedule": standard_schedule,
                 "branch_type": "Tier-3"
@@ -202,16 +223,354 @@ def generate_goodfoods_branches():
     
     return branches
 
+# --- SYNTHETIC DATA AT SCALE ---
+
+# Records are generated in fixed-size chunks, each with its own seeded RNG,
+# so the output is identical regardless of how many workers produce it
+CHUNK_SIZE = 10000
+
+# Relative demand by weekday (Monday first)
+DAY_OF_WEEK_DEMAND = [0.7, 0.7, 0.8, 0.9, 1.3, 1.6, 1.4]
+
+# Lunch and dinner peaks as (center hour, width in hours, weight)
+DEMAND_PEAKS = [(13.0, 1.0, 0.8), (20.0, 1.5, 1.4)]
+
+# Party size distribution
+PARTY_SIZE_WEIGHTS = {1: 4, 2: 35, 3: 12, 4: 25, 5: 7, 6: 8, 8: 5, 10: 3, 12: 1}
+
+# Fraction of historical reservations that were cancelled
+CANCELLED_FRACTION = 0.04
+
+LOCATION_POOL = [
+    (city, locality, features, tier)
+    for tier, table in (("metro", METRO_LOCATIONS), ("tier2", TIER2_LOCATIONS), ("tier3", TIER3_LOCATIONS))
+    for city, locations in table.items()
+    for locality, features in locations
+]
+
+TIER_LABELS = {"metro": "Metro", "tier2": "Tier-2", "tier3": "Tier-3"}
+
+def _chunk_rng(seed: int, kind: str, chunk: int) -> random.Random:
+    return random.Random(f"{seed}:{kind}:{chunk}")
+
+def _slot_weights(slots: List[str]) -> List[float]:
+    """Time-of-day demand curve over schedule slots."""
+    weights = []
+    for slot in slots:
+        hour = int(slot[:2]) + int(slot[3:]) / 60.0
+        demand = 0.05 + sum(w * math.exp(-((hour - c) / width) ** 2) for c, width, w in DEMAND_PEAKS)
+        weights.append(demand)
+    return weights
+
+def iter_synthetic_branches(count: int, seed: int = 42, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield synthetic branches `start`..`stop` of a `count`-branch catalog
+
+    The first branches reuse the real locality table; later ones are
+    numbered variants ("Koramangala 5231"). Branch IDs are 1-based.
+
+    Args:
+        count: Total catalog size
+        seed: Random seed
+        start: First branch index to yield
+        stop: One past the last index (defaults to count)
+
+    Yields:
+        Branch dictionaries in goodfoods_branches.json format
+    """
+    stop = count if stop is None else min(stop, count)
+    schedule = get_standard_schedule()
+    index = start
+    while index < stop:
+        chunk = index // CHUNK_SIZE
+        rng = _chunk_rng(seed, "branch", chunk)
+        chunk_end = min((chunk + 1) * CHUNK_SIZE, count)
+        for i in range(chunk * CHUNK_SIZE, chunk_end):
+            # Draw for every index so a partial chunk matches a full one
+            rating = round(rng.uniform(*BASE_RATING_RANGE), 1)
+            city, locality, features, tier = LOCATION_POOL[i % len(LOCATION_POOL)]
+            capacity = generate_capacity(tier, rng)
+            if i < start or i >= stop:
+                continue
+            if i >= len(LOCATION_POOL):
+                locality = f"{locality} {i}"
+            yield {
+                "id": i + 1,
+                "branch_name": f"{BRAND_NAME} - {locality}",
+                "city": city,
+                "locality": locality,
+                "full_address": f"{locality}, {city}",
+                "cuisine_specialties": CUISINE_SPECIALTIES,
+                "price_range": PRICE_RANGE,
+                "rating": rating,
+                "capacity": capacity,
+                "features": add_common_features(features),
+                "weekly_schedule": schedule,
+                "branch_type": TIER_LABELS[tier]
+            }
+        index = chunk_end
+
+@lru_cache(maxsize=2)
+def _branch_popularity(branch_count: int) -> List[float]:
+    """Cumulative Zipf-like popularity weights, scattered over branch IDs."""
+    cumulative = []
+    total = 0.0
+    for i in range(branch_count):
+        rank = (i * 2654435761) % branch_count + 1
+        total += rank ** -0.7
+        cumulative.append(total)
+    return cumulative
+
+def iter_synthetic_reservations(
+    count: int,
+    branch_count: int,
+    seed: int = 42,
+    start_date: Optional[date_type] = None,
+    days: int = 730,
+    start: int = 0,
+    stop: Optional[int] = None,
+    popularity: Optional[List[float]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield synthetic reservations `start`..`stop` of a `count`-row history
+
+    Dates follow the weekday demand curve, times follow lunch and dinner
+    peaks, and busy branches get more bookings than quiet ones.
+
+    Args:
+        count: Total history size
+        branch_count: Size of the synthetic catalog the bookings refer to
+        seed: Random seed
+        start_date: First reservation date (defaults to `days` before today)
+        days: Number of days covered
+        start: First row index to yield
+        stop: One past the last index (defaults to count)
+        popularity: Precomputed `_branch_popularity(branch_count)`
+
+    Yields:
+        Reservation dictionaries in reservation store format
+    """
+    stop = count if stop is None else min(stop, count)
+    if start_date is None:
+        start_date = date_type.today() - timedelta(days=days)
+    if popularity is None:
+        popularity = _branch_popularity(branch_count)
+
+    slots = get_standard_schedule()["Monday"]
+    slot_cum = list(_accumulate(_slot_weights(slots)))
+    day_cum = list(_accumulate(DAY_OF_WEEK_DEMAND[(start_date + timedelta(days=d)).weekday()] for d in range(days)))
+    sizes = list(PARTY_SIZE_WEIGHTS)
+    size_cum = list(_accumulate(PARTY_SIZE_WEIGHTS.values()))
+    branch_ids = range(1, branch_count + 1)
+
+    index = start
+    while index < stop:
+        chunk = index // CHUNK_SIZE
+        rng = _chunk_rng(seed, "reservation", chunk)
+        chunk_start = chunk * CHUNK_SIZE
+        chunk_end = min(chunk_start + CHUNK_SIZE, count)
+        n = chunk_end - chunk_start
+        picked_branches = rng.choices(branch_ids, cum_weights=popularity, k=n)
+        picked_days = rng.choices(range(days), cum_weights=day_cum, k=n)
+        picked_slots = rng.choices(slots, cum_weights=slot_cum, k=n)
+        picked_sizes = rng.choices(sizes, cum_weights=size_cum, k=n)
+        extras = [(rng.random(), rng.randint(100000000, 999999999), rng.randint(1, 20), rng.randint(0, 30)) for _ in range(n)]
+
+        for j in range(max(index, chunk_start) - chunk_start, min(stop, chunk_end) - chunk_start):
+            i = chunk_start + j
+            roll, phone, table, lead_days = extras[j]
+            day = start_date + timedelta(days=picked_days[j])
+            city, locality, _, _ = LOCATION_POOL[(picked_branches[j] - 1) % len(LOCATION_POOL)]
+            if picked_branches[j] > len(LOCATION_POOL):
+                locality = f"{locality} {picked_branches[j] - 1}"
+            yield {
+                "reservation_id": f"GF-S{i:09d}",
+                "customer_name": f"Guest {i}",
+                "customer_phone": f"9{phone}",
+                "occasion": "Not specified",
+                "branch_id": picked_branches[j],
+                "branch_name": f"{BRAND_NAME} - {locality}",
+                "branch_location": f"{locality}, {city}",
+                "city": city,
+                "date": day.isoformat(),
+                "day_of_week": day.strftime("%A"),
+                "time": picked_slots[j],
+                "party_size": picked_sizes[j],
+                "table_number": table,
+                "created_at": datetime.combine(day - timedelta(days=lead_days), datetime.min.time()).isoformat(),
+                "status": "cancelled" if roll < CANCELLED_FRACTION else "confirmed"
+            }
+        index = chunk_end
+
+def _accumulate(values) -> Iterator[float]:
+    total = 0.0
+    for v in values:
+        total += v
+        yield total
+
+# --- STREAMING WRITERS ---
+
+RESERVATION_COLUMNS = [
+    "reservation_id", "customer_name", "customer_phone", "occasion", "branch_id", "branch_name",
+    "branch_location", "city", "date", "day_of_week", "time", "party_size", "table_number",
+    "created_at", "status"
+]
+
+def write_jsonl(path: str, records: Iterator[Dict[str, Any]]) -> int:
+    """Stream records to a JSON-lines file; return the number written."""
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            written += 1
+    return written
+
+def write_json_array(path: str, records: Iterator[Dict[str, Any]]) -> int:
+    """Stream records to a JSON array file (goodfoods_branches.json format)."""
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for record in records:
+            f.write(",\n" if written else "\n")
+            f.write(json.dumps(record, ensure_ascii=False))
+            written += 1
+        f.write("\n]\n")
+    return written
+
+def write_sqlite(path: str, kind: str, records: Iterator[Dict[str, Any]], batch_size: int = 5000) -> int:
+    """
+    Stream records into a SQLite table ('branches' or 'reservations')
+
+    Branches are stored as one JSON document per row keyed by ID;
+    reservations get one column per field.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    if kind == "branches":
+        conn.execute("CREATE TABLE IF NOT EXISTS branches (id INTEGER PRIMARY KEY, city TEXT, data TEXT)")
+        sql = "INSERT OR REPLACE INTO branches VALUES (?, ?, ?)"
+        to_row = lambda b: (b["id"], b["city"], json.dumps(b, ensure_ascii=False))
+    else:
+        columns = ", ".join(RESERVATION_COLUMNS)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS reservations ({columns}, PRIMARY KEY (reservation_id))")
+        sql = f"INSERT OR REPLACE INTO reservations VALUES ({', '.join('?' * len(RESERVATION_COLUMNS))})"
+        to_row = lambda r: tuple(r[c] for c in RESERVATION_COLUMNS)
+
+    written = 0
+    batch = []
+    for record in records:
+        batch.append(to_row(record))
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            conn.commit()
+            written += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        written += len(batch)
+    conn.commit()
+    if kind == "reservations":
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_reservations_branch_date ON reservations (branch_id, date)")
+    conn.close()
+    return written
+
+# --- PARALLEL GENERATION ---
+
+def _generate_part(task: Tuple[str, str, int, int, int, int, int]) -> str:
+    """Worker: write rows start..stop of a dataset to a temporary JSON-lines part."""
+    kind, part_path, count, branch_count, seed, start, stop = task
+    if kind == "branches":
+        records = iter_synthetic_branches(count, seed, start, stop)
+    else:
+        records = iter_synthetic_reservations(count, branch_count, seed, start=start, stop=stop)
+    write_jsonl(part_path, records)
+    return part_path
+
+def _iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def generate_dataset(
+    kind: str,
+    output: str,
+    count: int,
+    branch_count: int = 0,
+    seed: int = 42,
+    workers: int = 1
+) -> int:
+    """
+    Generate a synthetic dataset and stream it to `output`
+
+    The format follows the file extension: .jsonl (JSON-lines), .json
+    (JSON array) or .sqlite/.db. With more than one worker, row ranges are
+    generated in parallel processes into temporary parts and streamed into
+    the output in order, so memory stays bounded by one chunk per worker.
+
+    Args:
+        kind: 'branches' or 'reservations'
+        output: Output file path
+        count: Number of rows
+        branch_count: Catalog size referenced by reservations
+        seed: Random seed
+        workers: Number of worker processes
+
+    Returns:
+        Number of rows written
+    """
+    ext = os.path.splitext(output)[1].lower()
+
+    if workers <= 1 or count <= CHUNK_SIZE:
+        if kind == "branches":
+            records = iter_synthetic_branches(count, seed)
+        else:
+            records = iter_synthetic_reservations(count, branch_count, seed)
+        parts = None
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="goodfoods-gen-")
+        # Split on chunk boundaries so each part is produced by exactly one RNG stream
+        chunks = math.ceil(count / CHUNK_SIZE)
+        per_part = math.ceil(chunks / (workers * 4)) * CHUNK_SIZE
+        tasks = [
+            (kind, os.path.join(tmp_dir, f"part-{n:05d}.jsonl"), count, branch_count, seed, start, min(start + per_part, count))
+            for n, start in enumerate(range(0, count, per_part))
+        ]
+        pool = Pool(workers)
+        parts = pool.imap(_generate_part, tasks)
+
+        def records_from_parts():
+            for part in parts:
+                yield from _iter_jsonl(part)
+                os.remove(part)
+
+        records = records_from_parts()
+
+    try:
+        if ext in (".sqlite", ".db"):
+            return write_sqlite(output, kind, records)
+        if ext == ".json":
+            return write_json_array(output, records)
+        if parts is not None:
+            # JSON-lines parts can be concatenated without re-parsing
+            with open(output, "wb") as out:
+                for part in parts:
+                    with open(part, "rb") as f:
+                        shutil.copyfileobj(f, out)
+                    os.remove(part)
+            return count
+        return write_jsonl(output, records)
+    finally:
+        if parts is not None:
+            pool.close()
+            pool.join()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
 # --- MAIN EXECUTION ---
 
-if __name__ == "__main__":
-    branches = generate_goodfoods_branches()
-    
-    # Save to JSON
-    with open('d:/assign/goodfoods_branches.json', 'w', encoding='utf-8') as f:
-        json.dump(branches, f, indent=2, ensure_ascii=False)
-    
-    # Print summary statistics
+def print_summary(branches):
+    """Print summary statistics for the generated branches"""
     print(f"✅ Generated {len(branches)} GoodFoods branch locations")
     print(f"\n📊 Distribution:")
     print(f"   Metro cities: {sum(1 for b in branches if b['branch_type'] == 'Metro')} branches")
@@ -224,4 +583,41 @@ if __name__ == "__main__":
     print(f"\n💺 Capacity Range: {min(b['capacity'] for b in branches)} - {max(b['capacity'] for b in branches)} seats")
     print(f"   Average capacity: {sum(b['capacity'] for b in branches) // len(branches)} seats")
     print(f"\n⭐ Rating Range: {min(b['rating'] for b in branches)} - {max(b['rating'] for b in branches)}")
-    print(f"\n📁 Saved to: d:/assign/goodfoods_branches.json")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate GoodFoods branch and reservation data")
+    parser.add_argument("--branches", type=int, default=None,
+                        help="Synthetic catalog size (default: the real branch list)")
+    parser.add_argument("--reservations", type=int, default=None,
+                        help="Generate a reservation history of this many rows instead of branches")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for large datasets")
+    parser.add_argument("--output", default=None,
+                        help="Output file (.json, .jsonl, .sqlite); default goodfoods_branches.json")
+    parser.add_argument("--force", action="store_true",
+                        help="Overwrite the branch catalog if it already exists")
+    args = parser.parse_args()
+
+    if args.reservations:
+        output = args.output or "reservations_history.jsonl"
+        written = generate_dataset("reservations", output, args.reservations,
+                                   branch_count=args.branches or len(LOCATION_POOL),
+                                   seed=args.seed, workers=args.workers)
+        print(f"✅ Generated {written} synthetic reservations")
+    elif args.branches:
+        output = args.output or "goodfoods_branches_synthetic.jsonl"
+        written = generate_dataset("branches", output, args.branches, seed=args.seed, workers=args.workers)
+        print(f"✅ Generated {written} synthetic GoodFoods branches")
+    else:
+        output = args.output or data_path("goodfoods_branches.json")
+        # The shipped catalog is tracked in git and differs from the seeded output
+        if os.path.exists(output) and not args.force:
+            parser.error(f"{output} already exists; pass --force to overwrite it or --output to write elsewhere")
+        branches = generate_goodfoods_branches(seed=args.seed)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(branches, f, indent=2, ensure_ascii=False)
+        print_summary(branches)
+
+    print(f"\n📁 Saved to: {output}")
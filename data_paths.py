@@ -0,0 +1,17 @@
+"""
+Data File Locations for GoodFoods
+
+Every data file (branch catalog, reservations, shards, sessions, traces,
+profiles) lives in one directory, configured from the environment:
+
+    GOODFOODS_DATA_DIR=...      data directory (default: this repository)
+"""
+
+import os
+
+DATA_DIR = os.environ.get("GOODFOODS_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+
+def data_path(name: str) -> str:
+    """Path of a data file or directory inside DATA_DIR."""
+    return os.path.join(DATA_DIR, name)
@@ -0,0 +1,291 @@
+"""
+Fake OpenAI-Compatible LLM Server for GoodFoods
+
+A local stand-in for the Groq `/chat/completions` endpoint used for load
+testing without network access or API quota. Responses are scripted:
+each rule matches the latest user message with a regex and answers with a
+`tool_calls` message whose arguments come from the named groups. After a
+tool result the server replies with a short text summary, like a real
+model finishing the turn. Latency is drawn from a configurable
+distribution to mimic provider behaviour, and usage blocks report
+cached prompt tokens as a prefix-caching provider would.
+
+    python fake_llm_server.py --port 8900 --latency lognormal:-1.2,0.4
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from slot_parser import strip_annotation
+
+# --- LATENCY DISTRIBUTIONS ---
+
+class LatencyModel:
+    """
+    Samples artificial response latency in seconds
+
+    Spec format is "<kind>:<params>":
+        fixed:0.2              always 200 ms
+        uniform:0.1,0.5        uniform between 100 and 500 ms
+        exp:0.3                exponential with a 300 ms mean
+        lognormal:-1.2,0.4     lognormal with mu/sigma of the log (seconds)
+    """
+
+    def __init__(self, spec: str = "fixed:0", seed: Optional[int] = None):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        if kind not in ("fixed", "uniform", "exp", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0] if self.params else 0.0
+            if self.kind == "uniform":
+                return self._random.uniform(self.params[0], self.params[1])
+            if self.kind == "exp":
+                return self._random.expovariate(1.0 / self.params[0])
+            return self._random.lognormvariate(self.params[0], self.params[1])
+
+
+# --- SCRIPTED RESPONSES ---
+
+@dataclass
+class ToolRule:
+    """Regex rule that turns a user message into a tool call"""
+    pattern: str
+    tool: str
+    int_fields: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._regex = re.compile(self.pattern, re.IGNORECASE)
+
+    def match(self, text: str) -> Optional[Dict[str, Any]]:
+        m = self._regex.search(text)
+        if not m:
+            return None
+        args = {k: v.strip() for k, v in m.groupdict().items() if v is not None}
+        for name in self.int_fields:
+            if name in args:
+                args[name] = int(args[name])
+        return args
+
+
+DEFAULT_RULES = [
+    ToolRule(
+        r"book branch (?P<branch_id>\d+) on (?P<date>\d{4}-\d{2}-\d{2}) at (?P<time>\d{2}:\d{2}) "
+        r"for (?P<party_size>\d+) as (?P<customer_name>[^,]+), (?P<customer_phone>\d+)",
+        "make_reservation",
+        int_fields=["branch_id", "party_size"]
+    ),
+    ToolRule(r"recommend (?P<preferences>.+)", "get_recommendations"),
+    ToolRule(r"(?:find|search|show).* in (?P<city>[A-Za-z ]+?)\W*$", "search_branches"),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class PrefixCache:
+    """
+    Simulates provider prompt prefix caching
+
+    A request's prompt is the tools list followed by its messages, in the
+    order and key order they were sent. The cached part of a prompt is
+    its longest prefix, cut at a message boundary, that an earlier request
+    also sent.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup_and_store(self, request: Dict[str, Any]) -> int:
+        """Return the cached token count for `request` and remember its prefixes."""
+        digest = hashlib.sha1(json.dumps(request.get("tools") or []).encode("utf-8"))
+        tokens = estimate_tokens(json.dumps(request.get("tools") or []))
+        prefixes = []
+        for message in request.get("messages", []):
+            digest.update(json.dumps(message).encode("utf-8"))
+            tokens += estimate_tokens(json.dumps(message))
+            prefixes.append((digest.hexdigest(), tokens))
+
+        cached = 0
+        with self._lock:
+            for key, count in prefixes:
+                if key not in self._seen:
+                    break
+                cached = count
+                self._seen.move_to_end(key)
+            for key, _ in prefixes:
+                self._seen[key] = None
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        return cached
+
+
+class ScriptedModel:
+    """Produces chat completion payloads from a list of ToolRules"""
+
+    def __init__(self, rules: Optional[List[ToolRule]] = None, model: str = "fake-llm"):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.model = model
+        self.prefix_cache = PrefixCache()
+
+    def complete(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        messages = request.get("messages", [])
+        # Trailing system messages (e.g. date context) are not part of the dialogue
+        last = next((m for m in reversed(messages) if m.get("role") != "system"), {})
+        offered = {t["function"]["name"] for t in request.get("tools") or []}
+
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+
+        if last.get("role") == "tool":
+            message["content"] = f"Here is what I found:\n\n{last.get('content', '')[:400]}"
+        else:
+            text = strip_annotation(last.get("content") or "")
+            for rule in self.rules:
+                args = rule.match(text)
+                if args is not None and rule.tool in offered:
+                    message["tool_calls"] = [{
+                        "id": f"call_{uuid.uuid4().hex[:12]}",
+                        "type": "function",
+                        "function": {"name": rule.tool, "arguments": json.dumps(args)}
+                    }]
+                    finish_reason = "tool_calls"
+                    break
+            else:
+                message["content"] = "Happy to help! Which city would you like to dine in?"
+
+        prompt_tokens = estimate_tokens(json.dumps(messages)) + estimate_tokens(json.dumps(request.get("tools") or []))
+        completion_tokens = estimate_tokens(json.dumps(message))
+        cached_tokens = min(prompt_tokens, self.prefix_cache.lookup_and_store(request))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", self.model),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}
+            }
+        }
+
+
+# --- HTTP SERVER ---
+
+class FakeLLMServer:
+    """
+    Threaded HTTP server exposing POST /chat/completions
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        latency: LatencyModel spec string
+        error_rate: Fraction of requests answered with HTTP 429
+        rules: Optional custom ToolRules
+        seed: Seed for latency and error sampling
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        rules: Optional[List[ToolRule]] = None,
+        seed: Optional[int] = None
+    ):
+        self.latency = LatencyModel(latency, seed=seed)
+        self.error_rate = error_rate
+        self.model = ScriptedModel(rules)
+        self._random = random.Random(seed)
+        self.requests_served = 0
+        self._count_lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+                time.sleep(server.latency.sample())
+                with server._count_lock:
+                    server.requests_served += 1
+                    rate_limited = server._random.random() < server.error_rate
+                if rate_limited:
+                    return self._send(429, {"error": {"message": "Rate limit exceeded"}})
+                self._send(200, server.model.complete(body))
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="lognormal:-1.2,0.4", help="Latency distribution spec")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency, args.error_rate, seed=args.seed)
+    print(f"🤖 Fake LLM server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,84 @@
+"""
+Cross-Process File Lock for GoodFoods
+
+Every process that writes a shared data file (reservation shards, the ID
+sequence, the change feed) holds an OS lock on a companion lock file:
+
+    lock = FileLock("reservation_shards/changes.jsonl.lock")
+    with thread_lock, lock:
+        ...
+"""
+
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Exclusive OS lock on a file, shared by every process that opens it
+
+    Uses flock() (msvcrt.locking() on Windows). It does not exclude threads
+    of the same process: callers hold a threading.Lock first. Nested
+    acquire() calls by the holder only count.
+
+    Args:
+        path: Lock file (created if missing); None for a lock that does nothing
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._file = None
+        self._depth = 0
+
+    def acquire(self):
+        if self.path is None:
+            return
+        if self._depth:
+            self._depth += 1
+            return
+        # A fresh open per acquire: a descriptor inherited by a forked child would share the lock
+        f = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass  # LK_LOCK gives up after 10 seconds; keep waiting
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+        self._depth = 1
+
+    def release(self):
+        if self.path is None:
+            return
+        self._depth -= 1
+        if self._depth:
+            return
+        f, self._file = self._file, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            f.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
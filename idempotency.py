@@ -0,0 +1,120 @@
+"""
+Idempotency Index for GoodFoods Bookings
+
+Remembers the outcome of successful bookings by idempotency key, so a
+retried `make_reservation` (the model re-asking a turn, a client retrying
+an HTTP call) returns the original confirmation instead of booking again:
+
+    index = IdempotencyIndex(max_entries=100000, ttl_seconds=86400)
+    index.put(key, confirmation, tag="GF-12345")
+    index.get(key)              # -> confirmation until it expires
+    index.discard_tag("GF-12345")   # booking cancelled or changed
+
+The index is bounded (oldest entries are evicted first) and every entry
+expires after `ttl_seconds`. Configured from the environment:
+
+    GOODFOODS_IDEMPOTENCY_TTL=86400     seconds a key is remembered
+    GOODFOODS_IDEMPOTENCY_MAX=100000    maximum remembered keys
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from metrics import REGISTRY
+
+CACHE_REQUESTS = REGISTRY.counter("goodfoods_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+
+
+class IdempotencyIndex:
+    """
+    Bounded TTL map from idempotency key to a stored result
+
+    Args:
+        max_entries: Keys kept before the oldest are evicted
+        ttl_seconds: Lifetime of each key
+    """
+
+    def __init__(self, max_entries: int = 100000, ttl_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, tag); insertion order is expiry order (fixed TTL)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the stored value for `key`, or None if unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                entry = None
+        CACHE_REQUESTS.inc(cache="idempotency", result="hit" if entry is not None else "miss")
+        return entry[0] if entry is not None else None
+
+    def put(self, key: str, value: Any, tag: Optional[str] = None):
+        """
+        Remember `value` under `key`
+
+        Args:
+            key: Idempotency key
+            value: Result to replay
+            tag: Optional group (e.g. reservation ID) for discard_tag()
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            self._evict()
+
+    def discard_tag(self, tag: str) -> int:
+        """Forget every key stored with `tag`; return how many were removed."""
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def _remove(self, key: str):
+        """Drop one key (caller holds the lock)."""
+        _, _, tag = self._entries.pop(key)
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _evict(self):
+        """Drop expired entries and enforce the size bound (caller holds the lock)."""
+        now = time.monotonic()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[1] > now and len(self._entries) <= self.max_entries:
+                break
+            self._remove(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+_index: Optional[IdempotencyIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_idempotency_index() -> IdempotencyIndex:
+    """Return the process-wide index, configuring it from the environment on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = IdempotencyIndex(
+                max_entries=int(os.environ.get("GOODFOODS_IDEMPOTENCY_MAX", "100000")),
+                ttl_seconds=float(os.environ.get("GOODFOODS_IDEMPOTENCY_TTL", "86400"))
+            )
+        return _index
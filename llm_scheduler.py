@@ -0,0 +1,422 @@
+"""
+LLM Request Scheduler for GoodFoods
+
+Sits in front of every chat completion request so that bursts from many
+sessions are smoothed to the provider quota instead of all failing with
+HTTP 429 together:
+
+- token buckets for requests/minute and tokens/minute
+- a cap on requests in flight
+- a priority queue: booking turns are admitted before browsing turns
+- backpressure: when the queue is full, or the estimated wait exceeds
+  the budget, callers get BusyError immediately rather than a timeout
+
+Configured from the environment or with `configure_scheduler()`:
+
+    GOODFOODS_LLM_CONCURRENCY=8     requests in flight (0 = unlimited)
+    GOODFOODS_LLM_RPM=30            requests per minute (0 = unlimited)
+    GOODFOODS_LLM_TPM=6000          prompt+completion tokens per minute (0 = unlimited)
+    GOODFOODS_LLM_QUEUE=64          waiting requests before rejecting
+    GOODFOODS_LLM_MAX_WAIT=10       seconds a request may wait for a slot
+    GOODFOODS_LLM_SCHEDULER_DB=...  share buckets and the in-flight cap
+                                    between processes via SQLite
+
+With a shared database the rate limits and the in-flight cap are
+enforced across processes. Priority ordering applies within each process.
+"""
+
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+from metrics import REGISTRY
+
+PRIORITY_BOOKING = 0
+PRIORITY_BROWSING = 1
+
+# How often waiters re-check shared (cross-process) state
+SHARED_POLL_SECONDS = 0.05
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("goodfoods_llm_queue_wait_seconds", "Time LLM requests waited for admission", ["priority"])
+BUSY_REJECTIONS = REGISTRY.counter("goodfoods_llm_busy_total", "LLM requests rejected by the scheduler", ["reason"])
+
+
+class BusyError(Exception):
+    """The scheduler cannot admit the request soon enough"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# --- RATE LIMITS ---
+
+class TokenBucket:
+    """
+    In-process token bucket
+
+    Args:
+        rate: Tokens added per second
+        capacity: Maximum burst size
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            pause = max(0.0, self._paused_until - now)
+            missing = min(amount, self.capacity) - self._tokens
+            return max(pause, missing / self.rate if missing > 0 else 0.0)
+
+    def debit(self, amount: float):
+        """Remove tokens (may go negative to record overshoot)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+
+    def pause(self, seconds: float):
+        """Admit nothing for `seconds` (e.g. after a provider 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket whose state lives in SQLite, shared by every process using the same file
+
+    Same interface as TokenBucket.
+    """
+
+    def __init__(self, db_path: str, name: str, rate: float, capacity: float):
+        self.db_path = db_path
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, updated, paused_until) VALUES (?, ?, ?, 0)",
+                (name, capacity, time.time())
+            )
+
+    @contextmanager
+    def _transaction(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.db_path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _refilled(self, conn, now: float):
+        tokens, updated, paused_until = conn.execute(
+            "SELECT tokens, updated, paused_until FROM buckets WHERE name = ?", (self.name,)
+        ).fetchone()
+        return min(self.capacity, tokens + (now - updated) * self.rate), paused_until
+
+    def wait_time(self, amount: float) -> float:
+        with self._transaction() as conn:
+            now = time.time()
+            tokens, paused_until = self._refilled(conn, now)
+            conn.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name))
+        missing = min(amount, self.capacity) - tokens
+        return max(paused_until - now, missing / self.rate if missing > 0 else 0.0, 0.0)
+
+    def debit(self, amount: float):
+        with self._transaction() as conn:
+            now = time.time()
+            tokens, _ = self._refilled(conn, now)
+            conn.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens - amount, now, self.name))
+
+    def pause(self, seconds: float):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE buckets SET paused_until = MAX(paused_until, ?) WHERE name = ?",
+                (time.time() + seconds, self.name)
+            )
+
+
+# --- IN-FLIGHT CAP ---
+
+class LocalLimiter:
+    """Caps requests in flight within this process"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> Optional[object]:
+        with self._lock:
+            if self.limit and self.active >= self.limit:
+                return None
+            self.active += 1
+            return True
+
+    def release(self, lease: object):
+        with self._lock:
+            self.active -= 1
+
+
+class SharedLimiter:
+    """
+    Caps requests in flight across processes with expiring leases in SQLite
+
+    A lease left behind by a crashed process expires after `lease_seconds`.
+    """
+
+    def __init__(self, db_path: str, limit: int, lease_seconds: float = 60.0):
+        self.db_path = db_path
+        self.limit = limit
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.db_path)
+        return conn
+
+    def try_acquire(self) -> Optional[object]:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE expires < ?", (now,))
+            active = conn.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+            if self.limit and active >= self.limit:
+                conn.execute("COMMIT")
+                return None
+            lease = uuid.uuid4().hex
+            conn.execute("INSERT INTO leases (id, expires) VALUES (?, ?)", (lease, now + self.lease_seconds))
+            conn.execute("COMMIT")
+            return lease
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, lease: object):
+        self._conn().execute("DELETE FROM leases WHERE id = ?", (lease,))
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL, paused_until REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS leases (id TEXT PRIMARY KEY, expires REAL)")
+    return conn
+
+
+# --- SCHEDULER ---
+
+class LLMScheduler:
+    """
+    Admits LLM requests in priority order within the configured limits
+
+    Args:
+        max_concurrency: Requests in flight (0 = unlimited)
+        rpm: Requests per minute (0 = unlimited)
+        tpm: Tokens per minute (0 = unlimited)
+        max_queue: Waiting requests before new ones are rejected
+        max_wait: Seconds a request may wait before BusyError
+        db_path: SQLite file for cross-process limits (None = this process only)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        rpm: float = 0,
+        tpm: float = 0,
+        max_queue: int = 64,
+        max_wait: float = 10.0,
+        db_path: Optional[str] = None
+    ):
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.shared = db_path is not None
+
+        if self.shared:
+            self.limiter = SharedLimiter(db_path, max_concurrency)
+            self.request_bucket = SharedTokenBucket(db_path, "requests", rpm / 60, rpm) if rpm else None
+            self.token_bucket = SharedTokenBucket(db_path, "tokens", tpm / 60, tpm) if tpm else None
+        else:
+            self.limiter = LocalLimiter(max_concurrency)
+            self.request_bucket = TokenBucket(rpm / 60, rpm) if rpm else None
+            self.token_bucket = TokenBucket(tpm / 60, tpm) if tpm else None
+
+        self._cond = threading.Condition()
+        self._queue: List[tuple] = []  # (priority, sequence)
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+
+    def _rate_wait(self, tokens: int) -> float:
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.wait_time(1))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.wait_time(tokens))
+        return wait
+
+    def _estimated_wait(self, priority: int, tokens: int) -> float:
+        """Lower bound on the wait from the rate limits and the requests queued ahead."""
+        ahead = sum(1 for p, _ in self._queue if p <= priority)
+        wait = self._rate_wait(tokens)
+        if self.request_bucket and ahead:
+            wait += ahead / self.request_bucket.rate
+        return wait
+
+    def _reject(self, reason: str, message: str, retry_after: float):
+        BUSY_REJECTIONS.inc(reason=reason)
+        raise BusyError(message, retry_after=retry_after)
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_BROWSING, tokens: int = 0):
+        """
+        Wait for admission, then hold an in-flight slot for the enclosed request
+
+        Args:
+            priority: PRIORITY_BOOKING or PRIORITY_BROWSING (lower runs first)
+            tokens: Estimated tokens for the request (for the TPM bucket)
+
+        Raises:
+            BusyError: The queue is full or the request would wait longer than max_wait
+        """
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._reject("queue_full", "LLM queue is full", retry_after=self.max_wait)
+            estimate = self._estimated_wait(priority, tokens)
+            if estimate > self.max_wait:
+                self._reject("rate_limited", f"LLM quota exhausted for ~{estimate:.0f}s", retry_after=estimate)
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    lease, wait = None, 0.0
+                    if self._queue[0] == entry:
+                        wait = self._rate_wait(tokens)
+                        if wait == 0:
+                            lease = self.limiter.try_acquire()
+                            if lease is not None:
+                                break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or (self._queue[0] == entry and lease is None and wait > remaining):
+                        self._reject("timeout", "Timed out waiting for an LLM slot", retry_after=max(wait, 1.0))
+                    timeout = min(remaining, wait or remaining)
+                    if self.shared:
+                        timeout = min(timeout, SHARED_POLL_SECONDS)
+                    self._cond.wait(timeout)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+            if self.request_bucket:
+                self.request_bucket.debit(1)
+            if self.token_bucket:
+                self.token_bucket.debit(tokens)
+
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - start, priority=priority)
+        try:
+            yield
+        finally:
+            self.limiter.release(lease)
+            with self._cond:
+                self._cond.notify_all()
+
+    def record_usage(self, estimated: int, actual: int):
+        """Correct the TPM bucket once the real token usage is known."""
+        if self.token_bucket and actual:
+            self.token_bucket.debit(actual - estimated)
+
+    def backoff(self, seconds: float):
+        """Pause admissions after the provider signalled a rate limit."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Shared buckets carry the pause to the other processes
+        for bucket in (self.request_bucket, self.token_bucket):
+            if bucket:
+                bucket.pause(seconds)
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def configure_scheduler(
+    max_concurrency: Optional[int] = None,
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+    max_queue: Optional[int] = None,
+    max_wait: Optional[float] = None,
+    db_path: Optional[str] = None
+) -> LLMScheduler:
+    """
+    Install the process-wide scheduler
+
+    Arguments left as None fall back to the GOODFOODS_LLM_* environment
+    variables.
+
+    Returns:
+        The active LLMScheduler
+    """
+    global _scheduler
+    env = os.environ.get
+    with _scheduler_lock:
+        _scheduler = LLMScheduler(
+            max_concurrency=int(env("GOODFOODS_LLM_CONCURRENCY", "8")) if max_concurrency is None else max_concurrency,
+            rpm=float(env("GOODFOODS_LLM_RPM", "0")) if rpm is None else rpm,
+            tpm=float(env("GOODFOODS_LLM_TPM", "0")) if tpm is None else tpm,
+            max_queue=int(env("GOODFOODS_LLM_QUEUE", "64")) if max_queue is None else max_queue,
+            max_wait=float(env("GOODFOODS_LLM_MAX_WAIT", "10")) if max_wait is None else max_wait,
+            db_path=env("GOODFOODS_LLM_SCHEDULER_DB") if db_path is None else db_path
+        )
+        return _scheduler
+
+
+def set_scheduler(scheduler: Optional[LLMScheduler]) -> Optional[LLMScheduler]:
+    """
+    Swap the active scheduler (load tests use their own limits)
+
+    Returns:
+        The previously active scheduler (may be None)
+    """
+    global _scheduler
+    with _scheduler_lock:
+        previous, _scheduler = _scheduler, scheduler
+        return previous
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the active scheduler, configuring it on first use."""
+    if _scheduler is None:
+        return configure_scheduler()
+    return _scheduler
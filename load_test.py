@@ -0,0 +1,343 @@
+"""
+End-to-End Load Test for GoodFoods
+
+Drives N concurrent scripted conversations through `Agent.chat` against
+a local fake LLM server (see fake_llm_server.py) or any OpenAI-compatible
+endpoint, and reports:
+
+- throughput (turns/sec, bookings/sec)
+- p50/p95/p99 turn latency
+- LLM time vs tool time per turn
+- booking errors and overbooked slots
+
+Bookings go to a temporary reservation store, so the real one is untouched.
+
+    python load_test.py --conversations 200 --concurrency 20 --latency lognormal:-1.2,0.4
+"""
+
+import json
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import agent_core
+import reservations_db
+from agent_core import Agent
+from fake_llm_server import FakeLLMServer
+from llm_scheduler import LLMScheduler, set_scheduler
+from mcp_server import create_mcp_server
+from reservation_shards import create_router
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `values` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class TimedAgent(Agent):
+    """Agent that records LLM and tool time for each turn"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.llm_time = 0.0
+        self.tool_time = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.tool_tokens_saved = 0
+        self.tool_results: List[tuple] = []
+
+        # Patch a private server, not the process-wide one shared by all agents
+        self.mcp_server = create_mcp_server(agent_core)
+        call_tool = self.mcp_server.call_tool
+
+        def timed_call_tool(name, arguments):
+            start = time.perf_counter()
+            try:
+                response = call_tool(name, arguments)
+            finally:
+                self.tool_time += time.perf_counter() - start
+            self.tool_results.append((name, response))
+            return response
+
+        self.mcp_server.call_tool = timed_call_tool
+
+    def _call_llm(self, tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            return super()._call_llm(tools=tools)
+        finally:
+            self.llm_time += time.perf_counter() - start
+
+    def _select_tools(self, user_input: str) -> List[Dict[str, Any]]:
+        tools = super()._select_tools(user_input)
+        if self.last_tool_selection:
+            self.tool_tokens_saved += self.last_tool_selection.tokens_saved
+        return tools
+
+    def _record_usage(self, usage: Dict[str, Any]):
+        super()._record_usage(usage)
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.cached_tokens += agent_core.cached_prompt_tokens(usage)
+
+
+class LoadTestStats:
+    """Thread-safe collection of per-turn measurements"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turn_latencies: List[float] = []
+        self.llm_time = 0.0
+        self.tool_time = 0.0
+        self.turn_errors = 0
+        self.busy_turns = 0
+        self.bookings: List[str] = []
+        self.booking_errors = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.tool_tokens_saved = 0
+
+    def record_turn(self, latency: float, llm_time: float, tool_time: float, failed: bool, busy: bool = False):
+        with self._lock:
+            self.turn_latencies.append(latency)
+            self.llm_time += llm_time
+            self.tool_time += tool_time
+            self.turn_errors += int(failed)
+            self.busy_turns += int(busy)
+
+    def record_tokens(self, prompt_tokens: int, cached_tokens: int, tool_tokens_saved: int):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.tool_tokens_saved += tool_tokens_saved
+
+    def record_booking(self, reservation_id: Optional[str]):
+        with self._lock:
+            if reservation_id:
+                self.bookings.append(reservation_id)
+            else:
+                self.booking_errors += 1
+
+
+def build_scripts(count: int, hot_slots: int = 0, seed: int = 7) -> List[List[str]]:
+    """
+    Build scripted conversations (a city search followed by a booking)
+
+    Args:
+        count: Number of conversations
+        hot_slots: If > 0, concentrate bookings on this many (branch, date, time)
+            slots to provoke overbooking
+        seed: Random seed
+
+    Returns:
+        List of conversations, each a list of user messages
+    """
+    rng = random.Random(seed)
+    branches = agent_core.BRANCHES
+    base_date = datetime.now().date() + timedelta(days=1)
+
+    def random_slot():
+        branch = rng.choice(branches)
+        date = base_date + timedelta(days=rng.randint(0, 13))
+        slots = branch['weekly_schedule'].get(date.strftime("%A"), [])
+        return branch, date.isoformat(), rng.choice(slots) if slots else "19:00"
+
+    hot = [random_slot() for _ in range(hot_slots)]
+    scripts = []
+    for i in range(count):
+        branch, date, slot = rng.choice(hot) if hot else random_slot()
+        party = rng.randint(2, 8)
+        phone = f"9{rng.randint(100000000, 999999999)}"
+        scripts.append([
+            f"Find a branch in {branch['city']}",
+            f"Book branch {branch['id']} on {date} at {slot} for {party} as Load Guest {i}, {phone}",
+        ])
+    return scripts
+
+
+def count_overbooked_slots(reservation_ids: List[str]) -> int:
+    """Count (branch, date, time) slots whose booked seats exceed capacity."""
+    wanted = set(reservation_ids)
+    seats: Dict[tuple, int] = {}
+    for r in reservations_db.get_all_reservations():
+        if r['reservation_id'] in wanted and r.get('status', 'confirmed') == 'confirmed':
+            key = (r['branch_id'], r['date'], r['time'])
+            seats[key] = seats.get(key, 0) + r['party_size']
+    overbooked = 0
+    for (branch_id, _, _), booked in seats.items():
+        branch = agent_core.BRANCH_RESOLVER.get_branch(branch_id)
+        if branch and booked > branch['capacity']:
+            overbooked += 1
+    return overbooked
+
+
+def run_conversation(script: List[str], base_url: str, model: str, api_key: str, stats: LoadTestStats):
+    agent = TimedAgent(api_key=api_key, model=model, base_url=base_url)
+    for message in script:
+        agent.llm_time = agent.tool_time = 0.0
+        agent.tool_results = []
+        start = time.perf_counter()
+        reply = agent.chat(message)
+        latency = time.perf_counter() - start
+        failed = reply is None or reply.startswith("❌ Error")
+        busy = reply is not None and reply.startswith("⏳")
+        stats.record_turn(latency, agent.llm_time, agent.tool_time, failed, busy)
+
+        for name, response in agent.tool_results:
+            if name != "make_reservation":
+                continue
+            text = response.content[0]["text"]
+            if response.isError or not text.startswith("✅"):
+                stats.record_booking(None)
+            else:
+                stats.record_booking(text.split("Reservation ID:** ")[1].split()[0])
+    stats.record_tokens(agent.prompt_tokens, agent.cached_tokens, agent.tool_tokens_saved)
+
+
+def run_load_test(
+    conversations: int = 100,
+    concurrency: int = 10,
+    base_url: Optional[str] = None,
+    latency: str = "fixed:0.05",
+    error_rate: float = 0.0,
+    hot_slots: int = 0,
+    model: str = "llama-3.1-8b-instant",
+    api_key: str = "load-test",
+    seed: int = 7,
+    scheduler: Optional[LLMScheduler] = None
+) -> Dict[str, Any]:
+    """
+    Run a load test and return the report
+
+    Args:
+        conversations: Total scripted conversations
+        concurrency: Conversations in flight at once
+        base_url: LLM endpoint; a local fake server is started when None
+        latency: Fake server latency spec
+        error_rate: Fake server HTTP 429 rate
+        hot_slots: Concentrate bookings on this many slots (0 = spread out)
+        model: Model name sent to the endpoint
+        api_key: API key sent to the endpoint
+        seed: Random seed for scripts and fake latency
+        scheduler: LLM scheduler to use for the run (default: the active one)
+
+    Returns:
+        Report dictionary
+    """
+    server = None
+    if base_url is None:
+        server = FakeLLMServer(latency=latency, error_rate=error_rate, seed=seed).start()
+        base_url = server.base_url
+
+    scripts = build_scripts(conversations, hot_slots=hot_slots, seed=seed)
+    stats = LoadTestStats()
+
+    with tempfile.TemporaryDirectory() as shard_dir:
+        router = create_router(shard_dir)
+        previous = reservations_db.set_router(router)
+        previous_scheduler = set_scheduler(scheduler) if scheduler else None
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [pool.submit(run_conversation, s, base_url, model, api_key, stats) for s in scripts]
+                for f in futures:
+                    f.result()
+            elapsed = time.perf_counter() - start
+            overbooked = count_overbooked_slots(stats.bookings)
+        finally:
+            reservations_db.set_router(previous)
+            router.close()
+            if scheduler:
+                set_scheduler(previous_scheduler)
+            if server:
+                server.stop()
+
+    turns = len(stats.turn_latencies)
+    return {
+        "conversations": conversations,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "turns": turns,
+        "turns_per_s": round(turns / elapsed, 2) if elapsed else 0.0,
+        "bookings_per_s": round(len(stats.bookings) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(stats.turn_latencies, 50) * 1000, 1),
+            "p95": round(percentile(stats.turn_latencies, 95) * 1000, 1),
+            "p99": round(percentile(stats.turn_latencies, 99) * 1000, 1),
+        },
+        "llm_time_per_turn_ms": round(stats.llm_time / turns * 1000, 1) if turns else 0.0,
+        "tool_time_per_turn_ms": round(stats.tool_time / turns * 1000, 1) if turns else 0.0,
+        "prompt_tokens": stats.prompt_tokens,
+        "tool_tokens_saved_per_turn": round(stats.tool_tokens_saved / turns, 1) if turns else 0.0,
+        "cached_prompt_ratio": round(stats.cached_tokens / stats.prompt_tokens, 3) if stats.prompt_tokens else 0.0,
+        "turn_errors": stats.turn_errors,
+        "busy_turns": stats.busy_turns,
+        "bookings": len(stats.bookings),
+        "booking_errors": stats.booking_errors,
+        "overbooked_slots": overbooked,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print("=" * 70)
+    print("GOODFOODS LOAD TEST")
+    print("=" * 70)
+    print(f"🧵 {report['conversations']} conversations, {report['concurrency']} concurrent, {report['elapsed_s']}s")
+    print(f"⚡ Throughput: {report['turns_per_s']} turns/s | {report['bookings_per_s']} bookings/s")
+    lat = report['latency_ms']
+    print(f"⏱️  Turn latency: p50 {lat['p50']} ms | p95 {lat['p95']} ms | p99 {lat['p99']} ms")
+    print(f"🧠 LLM time/turn: {report['llm_time_per_turn_ms']} ms | 🔧 Tool time/turn: {report['tool_time_per_turn_ms']} ms")
+    print(f"🧾 Prompt tokens: {report['prompt_tokens']} | served from prefix cache: {report['cached_prompt_ratio']:.1%}"
+          f" | tool schema tokens saved/turn: {report['tool_tokens_saved_per_turn']}")
+    print(f"❌ Turn errors: {report['turn_errors']} | Busy (shed) turns: {report['busy_turns']} | Booking errors: {report['booking_errors']}")
+    print(f"🪑 Bookings: {report['bookings']} | Overbooked slots: {report['overbooked_slots']}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="GoodFoods end-to-end load test")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--base-url", default=None, help="Use an existing endpoint instead of the fake server")
+    parser.add_argument("--latency", default="fixed:0.05", help="Fake server latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hot-slots", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-concurrency", type=int, help="Scheduler in-flight cap")
+    parser.add_argument("--llm-rpm", type=float, help="Scheduler requests/minute")
+    parser.add_argument("--llm-tpm", type=float, help="Scheduler tokens/minute")
+    parser.add_argument("--llm-max-wait", type=float, help="Scheduler max queue wait (s)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    scheduler = None
+    if any(v is not None for v in (args.llm_concurrency, args.llm_rpm, args.llm_tpm, args.llm_max_wait)):
+        scheduler = LLMScheduler(
+            max_concurrency=args.llm_concurrency if args.llm_concurrency is not None else 8,
+            rpm=args.llm_rpm or 0,
+            tpm=args.llm_tpm or 0,
+            max_wait=args.llm_max_wait if args.llm_max_wait is not None else 10
+        )
+
+    report = run_load_test(
+        conversations=args.conversations,
+        concurrency=args.concurrency,
+        base_url=args.base_url,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        hot_slots=args.hot_slots,
+        seed=args.seed,
+        scheduler=scheduler
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -9,9 +9,37 @@ Reference: https://spec.modelcontextprotocol.io/
 """
 
 import json
+import os
+import time
 from typing import Any, Dict, List, Optional
 from dataclasses import dataclass, asdict, field
 
+from metrics import REGISTRY
+from profiling import profile
+from single_flight import SingleFlight, make_key
+from tracing import span
+
+TOOL_CALL_SECONDS = REGISTRY.histogram("goodfoods_tool_call_seconds", "Tool execution latency", ["tool"])
+TOOL_CALLS = REGISTRY.counter("goodfoods_tool_calls_total", "Tool calls by tool and status", ["tool", "status"])
+
+# Read-only tools whose concurrent identical calls share one execution
+COALESCED_TOOLS = {"search_branches", "get_recommendations"}
+SINGLEFLIGHT = os.environ.get("GOODFOODS_SINGLEFLIGHT", "1") == "1"
+
+
+def _normalize_argument(value: Any) -> Any:
+    """Case- and whitespace-insensitive form of an argument (the read-only tools match case-insensitively)."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, list):
+        return [_normalize_argument(v) for v in value]
+    return value
+
+
+def tool_key(name: str, arguments: Dict[str, Any]) -> str:
+    """Single-flight key for a tool call; null and empty arguments are ignored like in call_tool."""
+    return make_key(name, {k: _normalize_argument(v) for k, v in arguments.items() if v is not None and v != ""})
+
 # MCP Protocol Data Classes
 
 @dataclass
@@ -57,6 +85,8 @@ class MCPServer:
         """
         self.tools_module = tools_module
         self.tools = self._register_tools()
+        self._tool_names = {tool.name for tool in self.tools}
+        self._flight = SingleFlight("tools")
     
     def _register_tools(self) -> List[Tool]:
         """
@@ -154,10 +184,221 @@ class MCPServer:
                         "occasion": {
                             "type": ["string", "null"],
                             "description": "Occasion for the reservation (birthday, anniversary, etc.)"
+                        },
+                        "idempotency_key": {
+                            "type": ["string", "null"],
+                            "description": "Optional client key; repeating a call with the same key returns the original confirmation"
                         }
                     },
                     "required": ["date", "time", "party_size"]
                 }
+            ),
+            Tool(
+                name="make_bulk_reservations",
+                description="Book several tables at once for a group or corporate event (across branches, dates or times). All-or-nothing: if any table can't be booked, none are.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "bookings": {
+                            "type": "array",
+                            "description": "One entry per table",
+                            "maxItems": 100,
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "branch_id": {"type": ["integer", "null"], "description": "Unique branch ID (optional if branch_name is provided)"},
+                                    "branch_name": {"type": ["string", "null"], "description": "Branch name including location"},
+                                    "city": {"type": ["string", "null"], "description": "City name (helpful when using branch_name)"},
+                                    "date": {"type": "string", "description": "Reservation date in YYYY-MM-DD format"},
+                                    "time": {"type": "string", "description": "Reservation time in HH:MM format (24-hour)"},
+                                    "party_size": {"type": "integer", "description": "Number of people at this table", "minimum": 1, "maximum": 20}
+                                },
+                                "required": ["date", "time", "party_size"]
+                            }
+                        },
+                        "customer_name": {
+                            "type": ["string", "null"],
+                            "description": "Organizer's full name"
+                        },
+                        "customer_phone": {
+                            "type": ["string", "null"],
+                            "description": "Organizer's contact phone number"
+                        },
+                        "occasion": {
+                            "type": ["string", "null"],
+                            "description": "Occasion for the group (conference, wedding, team dinner, etc.)"
+                        },
+                        "idempotency_key": {
+                            "type": ["string", "null"],
+                            "description": "Optional client key; repeating a call with the same key returns the original confirmation"
+                        }
+                    },
+                    "required": ["bookings"]
+                }
+            ),
+            Tool(
+                name="cancel_reservation",
+                description="Cancel an existing reservation and release its table. Requires the phone number used for booking.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "reservation_id": {
+                            "type": "string",
+                            "description": "Reservation ID from the confirmation (e.g., 'GF-12345')"
+                        },
+                        "customer_phone": {
+                            "type": ["string", "null"],
+                            "description": "Phone number used when booking (for verification)"
+                        },
+                        "reason": {
+                            "type": ["string", "null"],
+                            "description": "Optional reason for cancelling"
+                        }
+                    },
+                    "required": ["reservation_id"]
+                }
+            ),
+            Tool(
+                name="modify_reservation",
+                description="Change the date, time, party size or occasion of an existing reservation. Pass only the fields that change.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "reservation_id": {
+                            "type": "string",
+                            "description": "Reservation ID from the confirmation (e.g., 'GF-12345')"
+                        },
+                        "customer_phone": {
+                            "type": ["string", "null"],
+                            "description": "Phone number used when booking (for verification)"
+                        },
+                        "date": {
+                            "type": ["string", "null"],
+                            "description": "New date in YYYY-MM-DD format"
+                        },
+                        "time": {
+                            "type": ["string", "null"],
+                            "description": "New time in HH:MM format (24-hour)"
+                        },
+                        "party_size": {
+                            "type": ["integer", "null"],
+                            "description": "New number of people",
+                            "minimum": 1,
+                            "maximum": 20
+                        },
+                        "occasion": {
+                            "type": ["string", "null"],
+                            "description": "New occasion"
+                        }
+                    },
+                    "required": ["reservation_id"]
+                }
+            ),
+            Tool(
+                name="join_waitlist",
+                description="Put a party on the waitlist for a fully booked time slot. They are booked automatically, in order, when seats free up.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "branch_id": {
+                            "type": ["integer", "null"],
+                            "description": "Unique branch ID (optional if branch_name is provided)"
+                        },
+                        "branch_name": {
+                            "type": ["string", "null"],
+                            "description": "Branch name including location (e.g., 'GoodFoods - Koramangala')"
+                        },
+                        "city": {
+                            "type": ["string", "null"],
+                            "description": "City name (helpful when using branch_name)"
+                        },
+                        "date": {
+                            "type": "string",
+                            "description": "Reservation date in YYYY-MM-DD format"
+                        },
+                        "time": {
+                            "type": "string",
+                            "description": "Reservation time in HH:MM format (24-hour)"
+                        },
+                        "party_size": {
+                            "type": "integer",
+                            "description": "Number of people in the party",
+                            "minimum": 1,
+                            "maximum": 20
+                        },
+                        "customer_name": {
+                            "type": ["string", "null"],
+                            "description": "Customer's full name"
+                        },
+                        "customer_phone": {
+                            "type": ["string", "null"],
+                            "description": "Customer's contact phone number"
+                        },
+                        "occasion": {
+                            "type": ["string", "null"],
+                            "description": "Occasion for the reservation (birthday, anniversary, etc.)"
+                        }
+                    },
+                    "required": ["date", "time", "party_size"]
+                }
+            ),
+            Tool(
+                name="waitlist_position",
+                description="Check a party's position on the waitlist, or the reservation it became.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "waitlist_id": {
+                            "type": "string",
+                            "description": "Waitlist ID (e.g., WL-123456)"
+                        },
+                        "customer_phone": {
+                            "type": ["string", "null"],
+                            "description": "Phone number used when joining (for verification)"
+                        }
+                    },
+                    "required": ["waitlist_id"]
+                }
+            ),
+            Tool(
+                name="leave_waitlist",
+                description="Take a party off the waitlist.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "waitlist_id": {
+                            "type": "string",
+                            "description": "Waitlist ID (e.g., WL-123456)"
+                        },
+                        "customer_phone": {
+                            "type": ["string", "null"],
+                            "description": "Phone number used when joining (for verification)"
+                        }
+                    },
+                    "required": ["waitlist_id"]
+                }
+            ),
+            Tool(
+                name="find_my_reservations",
+                description="List a guest's upcoming reservations (soonest first) by the phone number used for booking.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "customer_phone": {
+                            "type": "string",
+                            "description": "Phone number used when booking"
+                        },
+                        "limit": {
+                            "type": ["integer", "null"],
+                            "description": "Reservations per page (default 5, max 20)"
+                        },
+                        "page_token": {
+                            "type": ["string", "null"],
+                            "description": "page_token from the previous result to get the next page"
+                        }
+                    },
+                    "required": ["customer_phone"]
+                }
             )
         ]
     
@@ -183,6 +424,28 @@ class MCPServer:
         Returns:
             ToolResponse with execution result or error
         """
+        start = time.perf_counter()
+        # Names come from the LLM: unregistered ones share one series instead of adding a series each
+        label = name if name in self._tool_names else "unknown"
+        with span("tool.call", tool=label) as call:
+            if SINGLEFLIGHT and name in COALESCED_TOOLS:
+                # Identical concurrent lookups wait for the first one instead of recomputing
+                response, shared = self._flight.do(tool_key(name, arguments), lambda: self._run_tool(name, arguments, label))
+                call.set_attribute("coalesced", shared)
+            else:
+                response = self._run_tool(name, arguments, label)
+            if response.isError:
+                call.set_error(response.content[0]["text"][:200])
+        TOOL_CALL_SECONDS.observe(time.perf_counter() - start, tool=label)
+        TOOL_CALLS.inc(tool=label, status="error" if response.isError else "ok")
+        return response
+
+    def _run_tool(self, name: str, arguments: Dict[str, Any], label: str) -> ToolResponse:
+        with profile(f"tool:{label}"):
+            return self._execute_tool(name, arguments)
+
+    def _execute_tool(self, name: str, arguments: Dict[str, Any]) -> ToolResponse:
+        """Route a tool call to its implementation."""
         # Clean null values from arguments
         cleaned_args = {k: v for k, v in arguments.items() if v is not None and v != ""}
         
@@ -194,6 +457,20 @@ class MCPServer:
                 result = self.tools_module.get_recommendations(**cleaned_args)
             elif name == "make_reservation":
                 result = self.tools_module.make_reservation(**cleaned_args)
+            elif name == "cancel_reservation":
+                result = self.tools_module.cancel_reservation(**cleaned_args)
+            elif name == "modify_reservation":
+                result = self.tools_module.modify_reservation(**cleaned_args)
+            elif name == "make_bulk_reservations":
+                result = self.tools_module.make_bulk_reservations(**cleaned_args)
+            elif name == "join_waitlist":
+                result = self.tools_module.join_waitlist(**cleaned_args)
+            elif name == "waitlist_position":
+                result = self.tools_module.waitlist_position(**cleaned_args)
+            elif name == "leave_waitlist":
+                result = self.tools_module.leave_waitlist(**cleaned_args)
+            elif name == "find_my_reservations":
+                result = self.tools_module.find_my_reservations(**cleaned_args)
             else:
                 raise ValueError(f"Unknown tool: {name}")
             
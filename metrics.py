@@ -0,0 +1,294 @@
+"""
+Metrics for GoodFoods
+
+Low-overhead, thread-safe counters, histograms and rate meters with a
+Prometheus-style text exposition and a programmatic snapshot:
+
+    from metrics import REGISTRY
+    TOOL_SECONDS = REGISTRY.histogram("goodfoods_tool_call_seconds", "Tool latency", ["tool"])
+    TOOL_SECONDS.observe(0.004, tool="search_branches")
+
+    REGISTRY.snapshot()        # nested dict
+    REGISTRY.render_text()     # text exposition format
+    start_metrics_server(9108) # serves /metrics and /metrics.json
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds (1 ms .. 60 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape_label_value(value: str) -> str:
+    """Escape a label value for the text format (backslash, double quote, newline)."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{n}="{escape_label_value(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {",".join(k) or "_": v for k, v in self._values.items()}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution with sum and count"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q: float, **labels) -> float:
+        """Estimate a quantile from the buckets (upper bound of the bucket)."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            counts = list(state[:-1]) if state else []
+        total = sum(counts)
+        if not total:
+            return 0.0
+        target = q * total
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        result = {}
+        for key, state in items:
+            count = sum(state[:-1])
+            result[",".join(key) or "_"] = {
+                "count": count,
+                "sum": round(state[-1], 6),
+                "mean": round(state[-1] / count, 6) if count else 0.0,
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], state[:-1])),
+            }
+        return result
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, state in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                running += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {running}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {running}")
+        return lines
+
+
+class Meter(_Metric):
+    """Events per second over a sliding window, exposed as a gauge"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), window: int = 60):
+        super().__init__(name, help, labelnames)
+        self.window = window
+        # key -> {second: count}
+        self._values: Dict[Tuple[str, ...], Dict[int, int]] = {}
+
+    def mark(self, count: int = 1, **labels):
+        key = self._key(labels)
+        now = int(time.time())
+        with self._lock:
+            seconds = self._values.setdefault(key, {})
+            seconds[now] = seconds.get(now, 0) + count
+            if len(seconds) > self.window * 2:
+                for s in [s for s in seconds if s <= now - self.window]:
+                    del seconds[s]
+
+    def rate(self, **labels) -> float:
+        cutoff = int(time.time()) - self.window
+        with self._lock:
+            seconds = self._values.get(self._key(labels), {})
+            return sum(c for s, c in seconds.items() if s > cutoff) / self.window
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = list(self._values)
+        return {",".join(k) or "_": round(self.rate(**dict(zip(self.labelnames, k))), 4) for k in keys}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            keys = list(self._values)
+        return [f"{self.name}{self._format_labels(k)} {self.rate(**dict(zip(self.labelnames, k)))}" for k in keys]
+
+
+class MetricsRegistry:
+    """Named collection of metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def meter(self, name: str, help: str, labelnames: Sequence[str] = (), window: int = 60) -> Meter:
+        return self._get_or_create(Meter, name, help, labelnames, window)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metric values as a nested dictionary."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: {"type": m.kind, "labels": list(m.labelnames), "values": m.snapshot()} for m in metrics}
+
+    def render_text(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide default registry
+REGISTRY = MetricsRegistry()
+
+
+def snapshot() -> Dict[str, Any]:
+    """Snapshot of the default registry."""
+    return REGISTRY.snapshot()
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve /metrics (text) and /metrics.json (snapshot) in a background thread
+
+    Only one server is started per process; later calls return it.
+
+    Args:
+        port: Port to bind (defaults to GOODFOODS_METRICS_PORT; nothing is started if unset)
+        host: Interface to bind
+        registry: Registry to expose
+
+    Returns:
+        The running server, or None if no port is configured
+    """
+    global _server
+    if _server is not None:
+        return _server
+    if port is None:
+        port = int(os.environ.get("GOODFOODS_METRICS_PORT", "0")) or None
+        if port is None:
+            return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body = json.dumps(registry.snapshot(), indent=2).encode("utf-8")
+                content_type = "application/json"
+            elif self.path.startswith("/metrics"):
+                body = registry.render_text().encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _server = ThreadingHTTPServer((host, port), Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,343 @@
+"""
+Opt-in Profiling for GoodFoods
+
+Wraps sampled turns and tool calls in cProfile (and optionally
+tracemalloc), aggregates the results per name ("tool:get_recommendations",
+"turn") and dumps pstats files plus flamegraph-compatible collapsed
+stacks. Configured from the environment or with `enable_profiling()`:
+
+    GOODFOODS_PROFILE=tools,turn     what to profile (default: off)
+    GOODFOODS_PROFILE_SAMPLE=0.01    fraction of calls profiled (default 0.01)
+    GOODFOODS_PROFILE_MEMORY=1       also track allocations with tracemalloc
+    GOODFOODS_PROFILE_DIR=profiles   where dump() writes (also at exit)
+
+Only one call is profiled at a time per process; calls that arrive while
+another is being profiled run unprofiled. When a turn is being profiled,
+the tool calls inside it show up in the turn's profile, not their own.
+
+    python profiling.py --tool get_recommendations --calls 500
+    flamegraph.pl profiles/tool_get_recommendations.collapsed > recs.svg
+"""
+
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Set
+
+from data_paths import data_path
+
+PROFILE_DIR = data_path("profiles")
+
+# Collapsed stacks deeper than this are truncated (recursion guard)
+MAX_STACK_DEPTH = 64
+
+
+def _frame_name(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # built-in, e.g. "<method 'lower' of 'str' objects>"
+    return f"{os.path.basename(filename)}:{name}:{line}"
+
+
+def collapsed_stacks(stats: pstats.Stats, root: str) -> List[str]:
+    """
+    Approximate collapsed stacks ("a;b;c <microseconds>") from a cProfile call graph
+
+    cProfile records caller -> callee edges rather than full stacks, so
+    each function's own time is split across its callers in proportion to
+    the cumulative time each caller spent in it.
+
+    Args:
+        stats: Aggregated profile
+        root: Name of the synthetic root frame (e.g. "tool:search_branches")
+
+    Returns:
+        Lines in the format consumed by flamegraph.pl / speedscope
+    """
+    raw = stats.stats  # func -> (cc, nc, tt, ct, callers)
+    callees: Dict[tuple, List[tuple]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+
+    totals: Dict[str, float] = {}
+
+    def walk(func: tuple, path: List[str], weight: float, on_path: Set[tuple]):
+        cc, nc, tt, ct, _ = raw[func]
+        frames = path + [_frame_name(func)]
+        if tt * weight > 0:
+            key = ";".join(frames)
+            totals[key] = totals.get(key, 0.0) + tt * weight
+        if len(frames) >= MAX_STACK_DEPTH:
+            return
+        for callee in callees.get(func, []):
+            if callee in on_path or callee not in raw:
+                continue
+            callee_ct = raw[callee][3]
+            edge_ct = raw[callee][4][func][3]
+            if callee_ct > 0 and edge_ct > 0:
+                walk(callee, frames, weight * edge_ct / callee_ct, on_path | {callee})
+
+    for func, (_, _, _, _, callers) in raw.items():
+        if not any(c in raw for c in callers):
+            walk(func, [root], 1.0, {func})
+
+    return [f"{stack} {int(seconds * 1e6)}" for stack, seconds in sorted(totals.items()) if int(seconds * 1e6) > 0]
+
+
+class _Aggregate:
+    """Accumulated profile for one name"""
+
+    def __init__(self):
+        self.samples = 0
+        self.wall_time = 0.0
+        self.stats: Optional[pstats.Stats] = None
+        self.peak_bytes = 0
+        self.net_bytes = 0
+
+
+class Profiler:
+    """
+    Sampled cProfile/tracemalloc wrapper with per-name aggregation
+
+    Args:
+        targets: Which hooks profile ('tools', 'turn')
+        sample_rate: Fraction of calls to profile
+        memory: Track allocations with tracemalloc
+        output_dir: Directory used by dump()
+    """
+
+    def __init__(self, targets: Optional[Set[str]] = None, sample_rate: float = 0.01, memory: bool = False, output_dir: str = PROFILE_DIR):
+        self.targets = set(targets or ())
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self.output_dir = output_dir
+        self._aggregates: Dict[str, _Aggregate] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.targets) and self.sample_rate > 0
+
+    @contextmanager
+    def profile(self, name: str, target: str = "tools"):
+        """
+        Profile the enclosed block if `target` is enabled and the call is sampled
+
+        Args:
+            name: Aggregation key, e.g. "tool:make_reservation"
+            target: Hook category checked against the enabled targets
+        """
+        if target not in self.targets or random.random() >= self.sample_rate or not self._active.acquire(blocking=False):
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            if memory:
+                current, peak = tracemalloc.get_traced_memory()
+            self._active.release()
+
+            stats = pstats.Stats(profiler)
+            with self._lock:
+                agg = self._aggregates.setdefault(name, _Aggregate())
+                agg.samples += 1
+                agg.wall_time += elapsed
+                if agg.stats is None:
+                    agg.stats = stats
+                else:
+                    agg.stats.add(stats)
+                if memory:
+                    agg.peak_bytes = max(agg.peak_bytes, peak - start_bytes)
+                    agg.net_bytes += current - start_bytes
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._aggregates)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per-name sample counts, mean wall time and allocation figures."""
+        with self._lock:
+            return {
+                name: {
+                    "samples": agg.samples,
+                    "mean_ms": round(agg.wall_time / agg.samples * 1000, 3),
+                    "peak_alloc_bytes": agg.peak_bytes,
+                    "mean_net_alloc_bytes": agg.net_bytes // agg.samples
+                }
+                for name, agg in self._aggregates.items()
+            }
+
+    def report(self, name: str, limit: int = 20, sort: str = "tottime") -> str:
+        """Return the top functions for one name as pstats text."""
+        with self._lock:
+            agg = self._aggregates.get(name)
+            if agg is None or agg.stats is None:
+                return f"No profile samples for {name}"
+            out = io.StringIO()
+            agg.stats.stream = out
+            agg.stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump(self, output_dir: Optional[str] = None) -> List[str]:
+        """
+        Write <name>.pstats, <name>.collapsed and summary.json per aggregated name
+
+        Returns:
+            Paths written
+        """
+        output_dir = output_dir or self.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        written = []
+        with self._lock:
+            items = list(self._aggregates.items())
+        for name, agg in items:
+            if agg.stats is None:
+                continue
+            base = os.path.join(output_dir, name.replace(":", "_"))
+            agg.stats.dump_stats(base + ".pstats")
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                f.write("\n".join(collapsed_stacks(agg.stats, name)) + "\n")
+            written += [base + ".pstats", base + ".collapsed"]
+
+        summary_path = os.path.join(output_dir, "summary.json")
+        summary = self.summary()
+        if self.memory and tracemalloc.is_tracing():
+            top = tracemalloc.take_snapshot().statistics("lineno")[:20]
+            summary["_top_allocations"] = [{"site": str(s.traceback), "bytes": s.size, "count": s.count} for s in top]
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        written.append(summary_path)
+        return written
+
+    def reset(self):
+        with self._lock:
+            self._aggregates.clear()
+
+
+_profiler: Optional[Profiler] = None
+
+
+def enable_profiling(targets=("tools",), sample_rate: float = 0.01, memory: bool = False, output_dir: str = PROFILE_DIR) -> Profiler:
+    """Install and return a process-wide profiler."""
+    global _profiler
+    _profiler = Profiler(set(targets), sample_rate, memory, output_dir)
+    return _profiler
+
+
+def disable_profiling():
+    """Stop profiling new calls (aggregated results are discarded)."""
+    global _profiler
+    _profiler = Profiler()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def get_profiler() -> Profiler:
+    """Return the active profiler, configuring it from the environment on first use."""
+    global _profiler
+    if _profiler is None:
+        targets = {t.strip() for t in os.environ.get("GOODFOODS_PROFILE", "").split(",") if t.strip()}
+        _profiler = Profiler(
+            targets,
+            sample_rate=float(os.environ.get("GOODFOODS_PROFILE_SAMPLE", "0.01")),
+            memory=os.environ.get("GOODFOODS_PROFILE_MEMORY", "0") == "1",
+            output_dir=os.environ.get("GOODFOODS_PROFILE_DIR", PROFILE_DIR)
+        )
+        if _profiler.enabled:
+            atexit.register(lambda: _profiler.names() and _profiler.dump())
+    return _profiler
+
+
+def profile(name: str, target: str = "tools"):
+    """Profile a block on the active profiler (context manager)."""
+    return get_profiler().profile(name, target)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile GoodFoods tools with synthetic calls")
+    parser.add_argument("--tool", default="get_recommendations",
+                        choices=["search_branches", "get_recommendations", "make_reservation"])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--replay", action="store_true",
+                        help="make_reservation: repeat one booking (profiles the idempotent replay, not a booking)")
+    parser.add_argument("--memory", action="store_true", help="Also track allocations")
+    parser.add_argument("--output", default="profiles")
+    parser.add_argument("--limit", type=int, default=15)
+    args = parser.parse_args()
+
+    import tempfile
+    from datetime import datetime, timedelta
+
+    import agent_core
+    import reservations_db
+    from reservation_shards import create_router
+
+    # Enable on the imported module: the tool hooks don't see this __main__ copy
+    import profiling
+    profiler = profiling.enable_profiling(targets=("tools",), sample_rate=1.0, memory=args.memory, output_dir=args.output)
+    server = agent_core.create_mcp_server(agent_core)
+    branch = agent_core.BRANCHES[0]
+    date = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    calls = {
+        "search_branches": {"city": branch["city"], "min_rating": 4.0},
+        "get_recommendations": {"preferences": "romantic dinner with rooftop seating and live music"},
+        "make_reservation": {"branch_id": branch["id"], "date": date, "time": "19:00", "party_size": 2,
+                             "customer_name": "Profile Guest", "customer_phone": "9876543210"},
+    }
+
+    def booking_calls():
+        """A new open slot and phone per call, so no booking replays an earlier one"""
+        day, n = datetime.now() + timedelta(days=30), 0
+        while True:
+            for slot in branch["weekly_schedule"].get(day.strftime("%A"), []):
+                yield dict(calls["make_reservation"], date=day.strftime("%Y-%m-%d"), time=slot,
+                           customer_phone=f"98{n:08d}")
+                n += 1
+            day += timedelta(days=1)
+
+    if args.tool == "make_reservation" and not args.replay:
+        arguments = booking_calls()
+    else:
+        arguments = iter(lambda: calls[args.tool], None)
+
+    with tempfile.TemporaryDirectory() as shard_dir:
+        router = create_router(shard_dir)
+        previous = reservations_db.set_router(router)
+        try:
+            for _ in range(args.calls):
+                server.call_tool(args.tool, next(arguments))
+        finally:
+            reservations_db.set_router(previous)
+            router.close()
+
+    name = f"tool:{args.tool}"
+    if args.replay:
+        print("ℹ️  --replay: every call after the first returned the stored booking")
+    print(json.dumps(profiler.summary(), indent=2))
+    print(profiler.report(name, limit=args.limit))
+    for path in profiler.dump():
+        print(f"📁 {path}")
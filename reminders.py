@@ -0,0 +1,337 @@
+"""
+Reservation Reminders for GoodFoods
+
+Sends reminders a fixed time before each booking (by default 24 hours and
+2 hours). Upcoming deadlines are kept in a timer heap instead of polling
+every reservation:
+
+    scheduler = ReminderScheduler(FileSink("reminders.jsonl"), leads=[86400, 7200])
+    scheduler.start()       # rebuild from the store, then follow the change feed
+
+The heap is fed incrementally: each create or change event from the
+reservation change feed (see change_feed.py) pushes that version's
+deadlines. Entries are never searched for or removed; when one comes due
+it is dropped if its reservation has since been changed or cancelled
+(its version is no longer current), so changes cost O(log n). On start the
+heap is rebuilt from the upcoming reservations in the store, then the feed
+is followed from where it stood before the rebuild.
+
+Due reminders go to a sink, any object with `send(reminder)`:
+`FileSink` appends JSON lines, `MemorySink` collects them for tests,
+`LogSink` prints them. Run a single scheduler process:
+
+    python reminders.py --sink file:reminders.jsonl --leads 24h 2h
+
+Configured from the environment:
+
+    GOODFOODS_REMINDER_LEADS=24h,2h     default lead times before each booking
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from metrics import REGISTRY
+
+
+# A failed send is retried this much later, up to MAX_ATTEMPTS times
+RETRY_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+REMINDERS = REGISTRY.counter("goodfoods_reminders_total", "Reminders by outcome", ["outcome"])
+
+
+def parse_lead(value: str) -> int:
+    """Seconds in a lead time such as "24h", "90m" or "3600"."""
+    value = value.strip().lower()
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+DEFAULT_LEADS = [parse_lead(lead) for lead in os.environ.get("GOODFOODS_REMINDER_LEADS", "24h,2h").split(",")]
+
+
+def lead_label(seconds: int) -> str:
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    return f"{seconds // 60}m"
+
+
+def reservation_start(record: Dict[str, Any]) -> Optional[float]:
+    """Epoch seconds of a reservation's date and time (local time), or None."""
+    try:
+        return datetime.strptime(f"{record['date']} {record['time']}", "%Y-%m-%d %H:%M").timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# --- SINKS ---
+
+class FileSink:
+    """Appends each reminder as one JSON line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, reminder: Dict[str, Any]):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(reminder, ensure_ascii=False) + "\n")
+
+
+class MemorySink:
+    """Keeps sent reminders in `sent` (stub sender for tests)"""
+
+    def __init__(self):
+        self.sent: List[Dict[str, Any]] = []
+
+    def send(self, reminder: Dict[str, Any]):
+        self.sent.append(reminder)
+
+
+class LogSink:
+    """Prints reminders"""
+
+    def send(self, reminder: Dict[str, Any]):
+        print(f"🔔 {reminder['customer_phone']}: {reminder['message']}")
+
+
+def create_sink(spec: str):
+    """
+    Build a sink from a spec string
+
+    Args:
+        spec: "file:<path>", "memory" or "log"
+    """
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    if spec == "memory":
+        return MemorySink()
+    if spec == "log":
+        return LogSink()
+    raise ValueError(f"Unknown reminder sink: {spec}. Use file:<path>, memory or log")
+
+
+# --- SCHEDULER ---
+
+class ReminderScheduler:
+    """
+    Timer heap of reminder deadlines for upcoming reservations
+
+    Args:
+        sink: Receives due reminders (object with send(reminder))
+        leads: Seconds before the booking to remind, e.g. [86400, 7200]
+        lookup: Loads the current reservation at fire time (default: reservations_db.get_reservation)
+        clock: Returns the current epoch time
+    """
+
+    def __init__(
+        self,
+        sink: Any,
+        leads: Sequence[int] = DEFAULT_LEADS,
+        lookup: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        self.sink = sink
+        self.leads = sorted(set(int(lead) for lead in leads), reverse=True)
+        self.lookup = lookup
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # (fire_at, reservation_id, version, lead); kept small, there is one per pending reminder
+        self._heap: List[Tuple[float, str, int, int]] = []
+        # Newest version seen per reservation with reminders pending
+        self._versions: Dict[str, int] = {}
+        # (reservation_id, lead) -> failed sends, only for reminders being retried
+        self._attempts: Dict[Tuple[str, int], int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._subscription = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap)
+
+    def schedule(self, record: Dict[str, Any]) -> int:
+        """
+        Push the future deadlines of one reservation version
+
+        Older or repeated versions are ignored; a version that is not
+        confirmed (cancelled) only supersedes earlier ones.
+
+        Returns:
+            Number of reminders scheduled
+        """
+        reservation_id = record["reservation_id"]
+        version = int(record.get("version", 1))
+        start = reservation_start(record)
+        now = self.clock()
+        with self._lock:
+            if version <= self._versions.get(reservation_id, 0):
+                return 0
+            if record.get("status", "confirmed") != "confirmed" or start is None:
+                self._versions.pop(reservation_id, None)
+                return 0
+            due = [(start - lead, lead) for lead in self.leads if start - lead > now]
+            if not due:
+                self._versions.pop(reservation_id, None)
+                return 0
+            self._versions[reservation_id] = version
+            for fire_at, lead in due:
+                heapq.heappush(self._heap, (fire_at, reservation_id, version, lead))
+            # The firing thread may be sleeping until a later deadline
+            self._wakeup.notify()
+            return len(due)
+
+    def apply(self, event: Dict[str, Any]):
+        """Feed one change-feed event (create, update or cancel)."""
+        self.schedule(event["record"])
+
+    def poll(self, now: Optional[float] = None) -> int:
+        """
+        Send every reminder due at `now` (default: the clock)
+
+        Returns:
+            Number of reminders sent
+        """
+        now = self.clock() if now is None else now
+        sent = 0
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    return sent
+                fire_at, reservation_id, version, lead = heapq.heappop(self._heap)
+                if self._versions.get(reservation_id) != version:
+                    REMINDERS.inc(outcome="stale")
+                    continue
+                if lead == self.leads[-1]:
+                    # Last reminder for this version
+                    del self._versions[reservation_id]
+            if self._fire(reservation_id, version, lead, fire_at):
+                sent += 1
+
+    def _fire(self, reservation_id: str, version: int, lead: int, fire_at: float) -> bool:
+        """Send one due reminder after checking it against the store."""
+        lookup = self.lookup
+        if lookup is None:
+            from reservations_db import get_reservation as lookup
+        record = lookup(reservation_id)
+        if record is None or int(record.get("version", 1)) != version or record.get("status", "confirmed") != "confirmed":
+            REMINDERS.inc(outcome="stale")
+            return False
+        try:
+            self.sink.send(self._reminder(record, lead, fire_at))
+        except Exception as e:
+            print(f"Warning: Could not send reminder for {reservation_id}: {e}")
+            REMINDERS.inc(outcome="failed")
+            with self._lock:
+                attempts = self._attempts.pop((reservation_id, lead), 0) + 1
+                if attempts < MAX_ATTEMPTS:
+                    self._attempts[(reservation_id, lead)] = attempts
+                    self._versions.setdefault(reservation_id, version)
+                    heapq.heappush(self._heap, (self.clock() + RETRY_SECONDS, reservation_id, version, lead))
+            return False
+        if self._attempts:
+            with self._lock:
+                self._attempts.pop((reservation_id, lead), None)
+        REMINDERS.inc(outcome="sent")
+        return True
+
+    def _reminder(self, record: Dict[str, Any], lead: int, fire_at: float) -> Dict[str, Any]:
+        start = datetime.strptime(f"{record['date']} {record['time']}", "%Y-%m-%d %H:%M")
+        today = datetime.fromtimestamp(self.clock()).date()
+        if start.date() == today:
+            day = "today"
+        elif start.date() == today + timedelta(days=1):
+            day = "tomorrow"
+        else:
+            day = start.strftime("on %A, %B %d")
+        message = (f"Reminder: your table for {record.get('party_size')} at {record.get('branch_name')} is {day} "
+                   f"at {record['time']} (reservation {record['reservation_id']}).")
+        return {
+            "reservation_id": record["reservation_id"],
+            "kind": lead_label(lead),
+            "due_at": datetime.fromtimestamp(fire_at).isoformat(timespec="seconds"),
+            "sent_at": datetime.fromtimestamp(self.clock()).isoformat(timespec="seconds"),
+            "customer_name": record.get("customer_name"),
+            "customer_phone": record.get("customer_phone"),
+            "branch_name": record.get("branch_name"),
+            "date": record["date"],
+            "time": record["time"],
+            "party_size": record.get("party_size"),
+            "message": message
+        }
+
+    def rebuild(self, records: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        """
+        Schedule reminders for every upcoming reservation
+
+        Args:
+            records: Reservations to load (default: the store's current and upcoming ones)
+
+        Returns:
+            Number of reminders scheduled
+        """
+        if records is None:
+            from reservations_db import load_active_reservations
+            records = load_active_reservations()
+        return sum(self.schedule(record) for record in records)
+
+    def start(self):
+        """Rebuild from the store, follow the change feed and send reminders in a background thread."""
+        import reservations_db
+
+        feed = reservations_db.get_change_feed()
+        # Remember the feed position first: changes made during the rebuild are replayed, not lost
+        offset = feed.end_offset if feed is not None else None
+        scheduled = self.rebuild()
+        print(f"⏰ Reminder scheduler: {scheduled:,} reminders pending for the next {lead_label(self.leads[0])}+")
+        if feed is not None:
+            self._subscription = feed.subscribe(self.apply, offset)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            with self._lock:
+                delay = self._heap[0][0] - self.clock() if self._heap else 60.0
+                if delay > 0 and not self._stop.is_set():
+                    # New earlier deadlines notify the condition
+                    self._wakeup.wait(min(delay, 60.0))
+
+    def stop(self, timeout: float = 5.0):
+        """Stop following the feed and sending reminders."""
+        self._stop.set()
+        if self._subscription is not None:
+            self._subscription.stop(timeout)
+            self._subscription = None
+        with self._lock:
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Send reservation reminders")
+    parser.add_argument("--sink", default="log", help="file:<path>, memory or log")
+    parser.add_argument("--leads", nargs="+", help="Lead times, e.g. 24h 2h 30m (default: GOODFOODS_REMINDER_LEADS)")
+    args = parser.parse_args()
+
+    scheduler = ReminderScheduler(create_sink(args.sink), leads=[parse_lead(lead) for lead in args.leads] if args.leads else DEFAULT_LEADS)
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
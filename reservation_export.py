@@ -0,0 +1,299 @@
+"""
+Reservation Export for GoodFoods Reporting
+
+Streams reservations for a date range (optionally a set of branches) to
+CSV or Parquet in fixed-size chunks, so memory stays bounded however long
+the history is:
+
+    export_reservations("q3.csv", "2025-07-01", "2025-09-30", branch_ids=[3, 7])
+    export_partitioned("exports/", "2025-01-01", "2025-12-31", fmt="parquet", workers=4)
+
+Reservations are read month by month straight from the shard files
+(archived months are streamed from their gzip archives), never through the
+live store, so an export does not hold up bookings. `export_partitioned`
+writes one file per month in parallel worker processes.
+
+Parquet output needs pyarrow (`pip install pyarrow`); CSV has no extra
+dependencies.
+
+    python reservation_export.py --from 2025-07-01 --to 2025-09-30 --output q3.csv
+    python reservation_export.py --from 2025-01-01 --to 2025-12-31 --format parquet --partitioned exports/ --workers 4
+"""
+
+import csv
+import heapq
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from reservation_shards import list_partitions, phone_key, read_partition
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only Parquet output needs it
+    pa = None
+    pq = None
+
+DEFAULT_CHUNK_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    "reservation_id", "status", "branch_id", "branch_name", "city", "date", "day_of_week", "time",
+    "party_size", "table_number", "customer_name", "customer_phone", "occasion", "group_id",
+    "waitlist_id", "version", "created_at", "updated_at"
+]
+INTEGER_COLUMNS = {"branch_id", "party_size", "table_number", "version"}
+
+FORMATS = ("csv", "parquet")
+
+
+def _shard_paths(branch_ids: Optional[Sequence[int]] = None) -> List[str]:
+    """Paths of the active store's shards, narrowed to the owners of `branch_ids` when sharded by branch."""
+    from reservations_db import get_router
+
+    router = get_router()
+    shards = router.shards
+    if branch_ids and router.shard_map.key == "branch_id":
+        owners = {router.shard_map.shard_for_key(int(b)) for b in branch_ids}
+        shards = [shard for index, shard in enumerate(shards) if index in owners]
+    return [shard.path for shard in shards]
+
+
+def _months(shard_paths: Sequence[str], start_date: str, end_date: str) -> List[str]:
+    """Months between the dates that have data in any shard."""
+    found = set()
+    for path in shard_paths:
+        found.update(p for p in list_partitions(path) if start_date[:7] <= p <= end_date[:7])
+    return sorted(found)
+
+
+def iter_reservations(
+    start_date: str,
+    end_date: str,
+    branch_ids: Optional[Sequence[int]] = None,
+    shard_paths: Optional[Sequence[str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream reservations dated `start_date`..`end_date` in (date, time, id) order
+
+    Args:
+        start_date: First date (YYYY-MM-DD)
+        end_date: Last date (YYYY-MM-DD), inclusive
+        branch_ids: Only these branches (default: all)
+        shard_paths: Shards to read (default: the active store's)
+
+    Yields:
+        Newest version of each matching reservation
+    """
+    if shard_paths is None:
+        shard_paths = _shard_paths(branch_ids)
+    branches = {int(b) for b in branch_ids} if branch_ids else None
+    for month in _months(shard_paths, start_date, end_date):
+        # Each shard's month is sorted; merge them without loading more than one month per shard
+        for record in heapq.merge(*(read_partition(path, month) for path in shard_paths), key=phone_key):
+            if not start_date <= record.get("date", "") <= end_date:
+                continue
+            if branches is not None and int(record.get("branch_id", -1)) not in branches:
+                continue
+            yield record
+
+
+def iter_chunks(
+    start_date: str,
+    end_date: str,
+    branch_ids: Optional[Sequence[int]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    shard_paths: Optional[Sequence[str]] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """Like iter_reservations(), but yields lists of up to `chunk_size` reservations."""
+    records = iter_reservations(start_date, end_date, branch_ids, shard_paths)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# --- WRITERS ---
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return None
+    return value
+
+
+class _CsvWriter:
+    def __init__(self, path: str, columns: Sequence[str]):
+        self.columns = columns
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, chunk: List[Dict[str, Any]]):
+        self._writer.writerows([_cell(record.get(column)) for column in self.columns] for record in chunk)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    """Writes each chunk as one row group"""
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        self.columns = columns
+        self.schema = pa.schema([(c, pa.int64() if c in INTEGER_COLUMNS else pa.string()) for c in columns])
+        self._writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, chunk: List[Dict[str, Any]]):
+        arrays = {}
+        for column in self.columns:
+            values = [_cell(record.get(column)) for record in chunk]
+            if column in INTEGER_COLUMNS:
+                arrays[column] = [int(v) if v not in (None, "") else None for v in values]
+            else:
+                arrays[column] = [str(v) if v is not None else None for v in values]
+        self._writer.write_table(pa.Table.from_pydict(arrays, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def _open_writer(path: str, fmt: str, columns: Sequence[str]):
+    if fmt == "parquet":
+        if pa is None:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+        return _ParquetWriter(path, columns)
+    if fmt == "csv":
+        return _CsvWriter(path, columns)
+    raise ValueError(f"Unknown export format: {fmt}. Use one of {FORMATS}")
+
+
+def _format_for(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return "parquet" if path.endswith(".parquet") else "csv"
+
+
+# --- EXPORT ---
+
+def export_reservations(
+    path: str,
+    start_date: str,
+    end_date: str,
+    branch_ids: Optional[Sequence[int]] = None,
+    fmt: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    columns: Sequence[str] = EXPORT_COLUMNS,
+    shard_paths: Optional[Sequence[str]] = None
+) -> int:
+    """
+    Export reservations for a date range to one CSV or Parquet file
+
+    The file is written under a temporary name and renamed when complete.
+
+    Args:
+        path: Output file
+        start_date: First date (YYYY-MM-DD)
+        end_date: Last date (YYYY-MM-DD), inclusive
+        branch_ids: Only these branches (default: all)
+        fmt: "csv" or "parquet" (default: from the file extension)
+        chunk_size: Reservations held in memory at a time
+        columns: Reservation fields to export, in order
+        shard_paths: Shards to read (default: the active store's)
+
+    Returns:
+        Number of reservations exported
+    """
+    fmt = _format_for(path, fmt)
+    temp = f"{path}.{os.getpid()}.tmp"
+    writer = _open_writer(temp, fmt, columns)
+    exported = 0
+    try:
+        for chunk in iter_chunks(start_date, end_date, branch_ids, chunk_size, shard_paths):
+            writer.write(chunk)
+            exported += len(chunk)
+    except BaseException:
+        writer.close()
+        os.remove(temp)
+        raise
+    writer.close()
+    os.replace(temp, path)
+    return exported
+
+
+def export_partitioned(
+    directory: str,
+    start_date: str,
+    end_date: str,
+    branch_ids: Optional[Sequence[int]] = None,
+    fmt: str = "csv",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    columns: Sequence[str] = EXPORT_COLUMNS,
+    workers: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    Export one file per month (reservations-YYYY-MM.csv|parquet), months in parallel
+
+    Args:
+        directory: Output directory (created if missing)
+        start_date: First date (YYYY-MM-DD)
+        end_date: Last date (YYYY-MM-DD), inclusive
+        branch_ids: Only these branches (default: all)
+        fmt: "csv" or "parquet"
+        chunk_size: Reservations held in memory at a time, per worker
+        columns: Reservation fields to export, in order
+        workers: Worker processes (default: CPU count)
+
+    Returns:
+        Reservations exported per month
+    """
+    os.makedirs(directory, exist_ok=True)
+    shard_paths = _shard_paths(branch_ids)
+    jobs = {}
+    for month in _months(shard_paths, start_date, end_date):
+        jobs[month] = (
+            os.path.join(directory, f"reservations-{month}.{fmt}"),
+            max(start_date, f"{month}-01"), min(end_date, f"{month}-31"),
+            branch_ids, fmt, chunk_size, columns, shard_paths
+        )
+    if not jobs:
+        return {}
+    workers = min(len(jobs), workers or os.cpu_count() or 1)
+    if workers == 1:
+        return {month: export_reservations(*job) for month, job in jobs.items()}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {month: pool.submit(export_reservations, *job) for month, job in jobs.items()}
+        return {month: future.result() for month, future in futures.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export reservations to CSV or Parquet")
+    parser.add_argument("--from", dest="start", required=True, help="First date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", required=True, help="Last date (YYYY-MM-DD), inclusive")
+    parser.add_argument("--branch", type=int, action="append", help="Branch ID (repeat for several)")
+    parser.add_argument("--format", choices=FORMATS, help="Output format (default: from --output extension)")
+    parser.add_argument("--output", help="Output file")
+    parser.add_argument("--partitioned", metavar="DIR", help="Write one file per month into DIR instead")
+    parser.add_argument("--workers", type=int, help="Parallel workers for --partitioned (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if not args.output and not args.partitioned:
+        parser.error("give --output FILE or --partitioned DIR")
+
+    start = time.perf_counter()
+    if args.partitioned:
+        counts = export_partitioned(args.partitioned, args.start, args.end, args.branch, args.format or "csv",
+                                    args.chunk_size, workers=args.workers)
+        for month, count in counts.items():
+            print(f"📤 {month}: {count:,} reservations")
+        total, target = sum(counts.values()), args.partitioned
+    else:
+        total = export_reservations(args.output, args.start, args.end, args.branch, args.format, args.chunk_size)
+        target = args.output
+    print(f"✅ Exported {total:,} reservations to {target} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,1337 @@
+"""
+Sharded Reservation Storage for GoodFoods
+
+Splits reservations across independent shards so that bookings for
+different branches (or cities) never contend on the same file. Each shard
+is an append-only JSON-lines file; a shard can be accessed in-process or
+owned by a dedicated worker process that serializes all of its writes.
+
+    shard_map = ShardMap(num_shards=4, key="branch_id")
+    router = ShardRouter(shard_map, [FileShard(p) for p in paths])
+    router.save(reservation)
+
+Changes to a reservation (cancel, new time, party size) append a new
+version of the record; the newest line for a reservation ID wins. Each
+shard also keeps the seats and tables held per (branch, date, time), so
+`reserve()` and `update()` check and take inventory under the shard lock.
+All reservations of a slot live in the same shard. The shard lock is a
+thread lock plus an OS file lock (`FileLock`), held from catching up on
+other writers' appends through the check to the append, so the check is
+atomic across threads and across every process sharing the shard files.
+
+Group bookings use `prepare()`/`commit()`: each involved shard is locked
+(in shard order, so concurrent batches can't deadlock), checks its part of
+the batch and stages it; only when every shard accepted does each write
+its part as a single append. Any failure aborts all shards and nothing is
+written.
+
+A secondary index maps each guest phone (E.164) to that guest's confirmed
+reservations sorted by (date, time, reservation_id), so "my upcoming
+bookings" is a binary search plus a slice no matter how much history the
+shard holds.
+
+Each shard is partitioned by reservation month (`PartitionedShard`). Only
+the current and future months are held in memory; ended months are
+compacted into gzip archives that `scan()` reads by date range, so the
+working set stays the same size as history grows.
+"""
+
+import bisect
+import gzip
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from change_feed import ChangeFeed, change_event
+from file_lock import FileLock
+from slot_parser import normalize_phone
+
+SHARD_KEYS = ("branch_id", "city")
+
+# Segment of reservations without a date; always hot
+UNDATED = "undated"
+ARCHIVE_DIR = "archive"
+CHANGE_FEED_FILE = "changes.jsonl"
+ID_SEQUENCE_FILE = "ids.seq"
+
+# Sequence IDs start above every random 5-digit ID issued before there was a sequence
+FIRST_SEQUENCE_ID = 100000
+
+
+class SlotUnavailable(Exception):
+    """A booking or change does not fit the seats or tables left in its slot"""
+
+    def __init__(self, message: str, seats_left: int = 0):
+        super().__init__(message, seats_left)
+        self.seats_left = seats_left
+
+    def __str__(self) -> str:
+        return self.args[0]
+
+
+def slot_key(record: Dict[str, Any]) -> Optional[Tuple[int, str, str]]:
+    """(branch_id, date, time) of a reservation, or None for records without a slot."""
+    if record.get("date") is None or record.get("time") is None:
+        return None
+    return int(record["branch_id"]), record["date"], record["time"]
+
+
+def phone_key(record: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Sort key of a reservation in the phone index"""
+    return record.get("date") or "", record.get("time") or "", record["reservation_id"]
+
+
+def holds_inventory(record: Dict[str, Any]) -> bool:
+    """Whether a reservation occupies seats (older records have no status)."""
+    return record.get("status", "confirmed") == "confirmed"
+
+
+class IdSequence:
+    """
+    Unique, increasing reservation numbers shared by every process using a store
+
+    The next free number is kept in a file. Each process reserves a block
+    of `block` numbers at a time under a file lock and hands them out from
+    memory, so IDs never collide (with each other or with archived
+    reservations) and allocating one needs no store lookup. Numbers left
+    in a block when a process exits are skipped.
+
+    Args:
+        path: Sequence file (created on first use)
+        block: Numbers reserved per file access
+    """
+
+    def __init__(self, path: str, block: int = 100):
+        self.path = path
+        self.block = block
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock")
+        self._next = 0
+        self._end = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve_block()
+            number = self._next
+            self._next += 1
+            return number
+
+    def _reserve_block(self) -> Tuple[int, int]:
+        with self._file_lock:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    start = int(f.read().strip() or FIRST_SEQUENCE_ID)
+            except FileNotFoundError:
+                start = FIRST_SEQUENCE_ID
+            temp = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                f.write(str(start + self.block))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        return start, start + self.block
+
+
+class ShardMap:
+    """
+    Maps a reservation to the shard that owns it
+
+    Placement is `branch_id % num_shards` or a CRC32 of the city name.
+    Individual keys can be pinned to a shard with `overrides`
+    (e.g., to give a very busy flagship branch its own shard).
+    """
+
+    def __init__(self, num_shards: int, key: str = "branch_id", overrides: Optional[Dict[Any, int]] = None):
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        if key not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key: {key}. Use one of {SHARD_KEYS}")
+        self.num_shards = num_shards
+        self.key = key
+        self.overrides = overrides or {}
+
+    def key_for(self, reservation: Dict[str, Any]) -> Any:
+        """Extract the shard key value from a reservation record."""
+        if self.key == "branch_id":
+            return int(reservation["branch_id"])
+        city = reservation.get("city")
+        if not city:
+            # Older records only carry "Locality, City"
+            city = reservation.get("branch_location", "").split(",")[-1]
+        return city.strip().lower()
+
+    def shard_for_key(self, value: Any) -> int:
+        if value in self.overrides:
+            return self.overrides[value]
+        if isinstance(value, int):
+            return value % self.num_shards
+        return zlib.crc32(str(value).encode("utf-8")) % self.num_shards
+
+    def shard_for(self, reservation: Dict[str, Any]) -> int:
+        return self.shard_for_key(self.key_for(reservation))
+
+
+class FileShard:
+    """
+    Append-only JSON-lines shard
+
+    Writes append a single line instead of rewriting the file. Reads keep
+    an in-memory index that is caught up incrementally from the last read
+    offset, so appends made by other processes become visible without a
+    full reload. Writes hold `<path>.lock` while they catch up, check and
+    append, so processes sharing the file can't both take the last seats.
+
+    Args:
+        path: JSON-lines file
+        process_lock: Lock against other processes (off for segments of a
+            PartitionedShard, which holds one lock for all its segments)
+    """
+
+    def __init__(self, path: str, process_lock: bool = True):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock" if process_lock else None)
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._seats: Dict[Tuple[int, str, str], int] = {}
+        self._tables: Dict[Tuple[int, str, str], Set[int]] = {}
+        self._by_phone: Dict[str, List[Tuple[str, str, str]]] = {}
+        self._staged: Optional[List[Dict[str, Any]]] = None
+        self._offset = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _catch_up(self):
+        """Read lines appended since the last call (caller holds the lock)."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size <= self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+        # Ignore a trailing partial line that is still being written
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+        self._offset += end
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the shard against other threads and processes, caught up with their appends."""
+        with self._lock, self._file_lock:
+            self._catch_up()
+            yield
+
+    def _apply(self, record: Dict[str, Any]):
+        # A newer version replaces the old one (and its seats) in O(1)
+        previous = self._records.get(record["reservation_id"])
+        if previous is not None:
+            self._hold(previous, -1)
+        if record.get("moved_to"):
+            # Tombstone: the reservation continues in another segment
+            self._records.pop(record["reservation_id"], None)
+            return
+        self._records[record["reservation_id"]] = record
+        self._hold(record, 1)
+
+    def _hold(self, record: Dict[str, Any], sign: int):
+        """Add (sign=1) or remove (sign=-1) a reservation's seats, table and phone index entry."""
+        slot = slot_key(record)
+        if slot is None or not holds_inventory(record):
+            return
+        phone = normalize_phone(record.get("customer_phone"))
+        if phone:
+            entries = self._by_phone.setdefault(phone, [])
+            key = phone_key(record)
+            if sign > 0:
+                bisect.insort(entries, key)
+            else:
+                index = bisect.bisect_left(entries, key)
+                if index < len(entries) and entries[index] == key:
+                    del entries[index]
+        self._seats[slot] = self._seats.get(slot, 0) + sign * int(record.get("party_size") or 0)
+        table = record.get("table_number")
+        if table is not None:
+            tables = self._tables.setdefault(slot, set())
+            if sign > 0:
+                tables.add(table)
+            else:
+                tables.discard(table)
+
+    def _write(self, record: Dict[str, Any]):
+        """Append one line and index it (caller holds the lock and has caught up)."""
+        self._write_many([record])
+
+    def _write_many(self, records: List[Dict[str, Any]]):
+        """Append several lines in one write and index them (caller holds the lock)."""
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(data)
+            end = f.tell()
+        if end == self._offset + len(data):
+            # No other writer got in between: index the records directly
+            for record in records:
+                self._apply(record)
+            self._offset = end
+        else:
+            self._catch_up()
+
+    def _take_table(
+        self,
+        record: Dict[str, Any],
+        capacity: Optional[int],
+        tables: Optional[int],
+        current: Optional[Dict[str, Any]] = None
+    ) -> Optional[int]:
+        """
+        Check that `record` fits its slot and pick its table
+
+        Args:
+            record: Reservation to place
+            capacity: Seats per slot (None = unchecked)
+            tables: Tables per slot, numbered 1..tables (None = unassigned)
+            current: Version being replaced; its seats and table count as free
+
+        Returns:
+            Table number for the record (None when tables are not tracked)
+
+        Raises:
+            SlotUnavailable: Not enough seats or no free table
+        """
+        slot = slot_key(record)
+        seats = self._seats.get(slot, 0)
+        taken = set(self._tables.get(slot, ()))
+        keep = None
+        if current is not None and holds_inventory(current) and slot_key(current) == slot:
+            seats -= int(current.get("party_size") or 0)
+            taken.discard(current.get("table_number"))
+            keep = current.get("table_number")
+
+        party_size = int(record.get("party_size") or 0)
+        if capacity is not None and seats + party_size > capacity:
+            left = max(0, capacity - seats)
+            raise SlotUnavailable(f"only {left} seat{'s' if left != 1 else ''} left", seats_left=left)
+        if not tables:
+            return record.get("table_number")
+        if keep is not None:
+            return keep
+        for table in range(1, tables + 1):
+            if table not in taken:
+                return table
+        raise SlotUnavailable("no free tables left", seats_left=max(0, (capacity or 0) - seats))
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """Append one reservation to the shard."""
+        with self._exclusive():
+            self._write(record)
+        return True
+
+    def reserve(self, record: Dict[str, Any], capacity: Optional[int] = None, tables: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Append a new reservation if its slot has room
+
+        Args:
+            record: New reservation (its table_number is assigned here when `tables` is set)
+            capacity: Seats per (branch, date, time) slot
+            tables: Tables per slot
+
+        Returns:
+            The saved record
+
+        Raises:
+            SlotUnavailable: The slot is full
+            ValueError: The reservation ID already exists
+        """
+        with self._exclusive():
+            if record["reservation_id"] in self._records:
+                raise ValueError(f"Duplicate reservation ID {record['reservation_id']}")
+            record = dict(record)
+            record["table_number"] = self._take_table(record, capacity, tables)
+            record.setdefault("version", 1)
+            record.setdefault("status_history", [{"status": record.get("status", "confirmed"), "at": record.get("created_at")}])
+            self._write(record)
+            return record
+
+    def prepare(self, entries: List[Tuple[Dict[str, Any], Optional[int], Optional[int]]]) -> List[Dict[str, Any]]:
+        """
+        Lock the shard, check a batch of new reservations and stage them
+
+        Reservations in the batch count against each other (two bookings
+        for the same slot need room for both). On success the shard stays
+        locked until commit() or abort().
+
+        Args:
+            entries: (record, capacity, tables) per reservation, as for reserve()
+
+        Returns:
+            The staged records (with table numbers)
+
+        Raises:
+            SlotUnavailable: A reservation does not fit (the shard is unlocked)
+            ValueError: Duplicate reservation ID (the shard is unlocked)
+        """
+        self._lock.acquire()
+        staged: List[Dict[str, Any]] = []
+        try:
+            self._file_lock.acquire()
+        except BaseException:
+            self._lock.release()
+            raise
+        try:
+            self._catch_up()
+            for record, capacity, tables in entries:
+                if record["reservation_id"] in self._records or any(r["reservation_id"] == record["reservation_id"] for r in staged):
+                    raise ValueError(f"Duplicate reservation ID {record['reservation_id']}")
+                record = dict(record)
+                try:
+                    record["table_number"] = self._take_table(record, capacity, tables)
+                except SlotUnavailable as e:
+                    raise SlotUnavailable(f"branch {record['branch_id']} on {record['date']} at {record['time']}: {e}", e.seats_left)
+                record.setdefault("version", 1)
+                record.setdefault("status_history", [{"status": record.get("status", "confirmed"), "at": record.get("created_at")}])
+                # Hold its seats so the rest of the batch sees them
+                self._hold(record, 1)
+                staged.append(record)
+        except BaseException:
+            for record in staged:
+                self._hold(record, -1)
+            self._unlock()
+            raise
+        self._staged = staged
+        return staged
+
+    def commit(self):
+        """Write the staged batch as one append and unlock the shard."""
+        try:
+            staged, self._staged = self._staged, None
+            # The records take their seats again when applied
+            for record in staged:
+                self._hold(record, -1)
+            self._write_many(staged)
+        finally:
+            self._unlock()
+
+    def abort(self):
+        """Drop the staged batch and unlock the shard."""
+        staged, self._staged = self._staged, None
+        for record in staged or ():
+            self._hold(record, -1)
+        self._unlock()
+
+    def _unlock(self):
+        """Release the locks taken by prepare()."""
+        try:
+            self._file_lock.release()
+        finally:
+            self._lock.release()
+
+    def update(
+        self,
+        reservation_id: str,
+        changes: Dict[str, Any],
+        capacity: Optional[int] = None,
+        tables: Optional[int] = None,
+        note: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Append a new version of a reservation
+
+        Seats and the table of the old version are released and those of the
+        new version taken in the same step; a status history entry is added.
+
+        Args:
+            reservation_id: Reservation to change
+            changes: Fields to overwrite (e.g. {"status": "cancelled"}, {"time": "20:00"})
+            capacity: Seats per slot, checked when the new version holds seats
+            tables: Tables per slot
+            note: Text stored with the status history entry
+
+        Returns:
+            The new version, or None if the reservation does not exist
+
+        Raises:
+            SlotUnavailable: The changed booking does not fit its slot
+        """
+        with self._exclusive():
+            current = self._records.get(reservation_id)
+            if current is None:
+                return None
+            return self._write_version(current, changes, capacity, tables, note)
+
+    def adopt(
+        self,
+        current: Dict[str, Any],
+        changes: Dict[str, Any],
+        capacity: Optional[int] = None,
+        tables: Optional[int] = None,
+        note: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Append the next version of a reservation moving in from another segment
+
+        Used when a change moves a reservation to another month; the old
+        segment then gets a tombstone (see retire()).
+
+        Raises:
+            SlotUnavailable: The changed booking does not fit its slot
+            ValueError: The reservation already exists in this segment
+        """
+        with self._exclusive():
+            if current["reservation_id"] in self._records:
+                raise ValueError(f"Duplicate reservation ID {current['reservation_id']}")
+            return self._write_version(current, changes, capacity, tables, note)
+
+    def retire(self, reservation_id: str, moved_to: str):
+        """Append a tombstone: the reservation now lives in segment `moved_to`."""
+        with self._exclusive():
+            self._write({"reservation_id": reservation_id, "moved_to": moved_to, "updated_at": datetime.now().isoformat()})
+
+    def _write_version(
+        self,
+        current: Dict[str, Any],
+        changes: Dict[str, Any],
+        capacity: Optional[int],
+        tables: Optional[int],
+        note: Optional[str]
+    ) -> Dict[str, Any]:
+        """Check, stamp and append the next version of `current` (caller holds the shard exclusively)."""
+        updated = dict(current)
+        updated.update(changes)
+        if holds_inventory(updated) and (capacity is not None or tables):
+            updated["table_number"] = self._take_table(updated, capacity, tables, current=current)
+
+        now = datetime.now().isoformat()
+        entry = {"status": updated.get("status", "confirmed"), "at": now}
+        if note:
+            entry["note"] = note
+        history = current.get("status_history") or [{"status": current.get("status", "confirmed"), "at": current.get("created_at")}]
+        updated["status_history"] = history + [entry]
+        updated["version"] = current.get("version", 1) + 1
+        updated["updated_at"] = now
+        self._write(updated)
+        return updated
+
+    def find_by_phone(self, phone: str, after: Tuple[str, str, str], limit: int) -> List[Dict[str, Any]]:
+        """
+        Confirmed reservations for a phone, in (date, time, id) order
+
+        Args:
+            phone: E.164 phone number
+            after: Exclusive start key (date, time, reservation_id)
+            limit: Maximum number of reservations
+
+        Returns:
+            Up to `limit` reservations sorting after `after`
+        """
+        with self._lock:
+            self._catch_up()
+            entries = self._by_phone.get(phone, [])
+            start = bisect.bisect_right(entries, tuple(after))
+            return [self._records[key[2]] for key in entries[start:start + limit]]
+
+    def seats_booked(self, branch_id: int, date: str, time: str) -> int:
+        """Seats held by confirmed reservations in one slot."""
+        with self._lock:
+            self._catch_up()
+            return self._seats.get((int(branch_id), date, time), 0)
+
+    def get(self, reservation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._catch_up()
+            return self._records.get(reservation_id)
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Return all reservations in the order they were written."""
+        with self._lock:
+            self._catch_up()
+            return list(self._records.values())
+
+    def history(self) -> List[Dict[str, Any]]:
+        """Every reservation (a FileShard keeps no archive; same as all())."""
+        return self.all()
+
+    def count(self) -> int:
+        with self._lock:
+            self._catch_up()
+            return len(self._records)
+
+    def close(self):
+        pass
+
+
+def partition_for(record: Dict[str, Any]) -> str:
+    """Month partition ("YYYY-MM") of a reservation's date, or UNDATED."""
+    date = record.get("date")
+    if isinstance(date, str) and len(date) >= 7 and date[4] == "-":
+        return date[:7]
+    return UNDATED
+
+
+def segment_dir(path: str) -> str:
+    """Directory holding the monthly segments of the shard at `path`."""
+    return os.path.splitext(path)[0]
+
+
+def _read_archive_file(path: str) -> Iterator[Dict[str, Any]]:
+    try:
+        f = gzip.open(path, "rt", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            yield json.loads(line)
+
+
+def list_partitions(path: str) -> List[str]:
+    """Months with a segment or an archive in the shard at `path`, in order."""
+    directory = segment_dir(path)
+    names = []
+    for folder, suffix in ((directory, ".jsonl"), (os.path.join(directory, ARCHIVE_DIR), ".jsonl.gz")):
+        try:
+            names.extend(name[:-len(suffix)] for name in os.listdir(folder) if name.endswith(suffix))
+        except FileNotFoundError:
+            pass
+    return sorted(set(names))
+
+
+def read_partition(path: str, partition: str) -> Iterator[Dict[str, Any]]:
+    """
+    Newest version of each reservation in one month of a shard, in (date, time, id) order
+
+    Reads the files directly, without the shard lock, so it works for
+    shards owned by any process and never holds up bookings. An archived
+    month is streamed; a month with a live segment is compacted in memory
+    (one month at a time).
+
+    Args:
+        path: Shard path (see shard_path)
+        partition: Month ("YYYY-MM") or UNDATED
+    """
+    directory = segment_dir(path)
+    archived = _read_archive_file(os.path.join(directory, ARCHIVE_DIR, f"{partition}.jsonl.gz"))
+    segment = os.path.join(directory, f"{partition}.jsonl")
+    if not os.path.exists(segment):
+        yield from archived
+        return
+    rows = {record["reservation_id"]: record for record in archived}
+    rows.update((record["reservation_id"], record) for record in FileShard(segment, process_lock=False).all())
+    yield from sorted(rows.values(), key=phone_key)
+
+
+def _current_month() -> str:
+    return datetime.now().strftime("%Y-%m")
+
+
+class PartitionedShard:
+    """
+    Shard split into one FileShard segment per reservation month
+
+    Segments for the current and future months are hot: open, indexed and
+    kept in memory. When a month is over its segment is compacted (newest
+    version of each reservation only, sorted by date and time) into a
+    gzip archive and dropped from memory, so memory and index size depend
+    on upcoming bookings, not on history. Archived months are read on
+    demand with scan().
+
+        shard-000/2025-12.jsonl             hot segment
+        shard-000/archive/2025-09.jsonl.gz  archived month
+
+    Exposes the same interface as FileShard. A change that moves a
+    reservation to another month appends it to the new month's segment and
+    a tombstone to the old one. A single-file shard from before
+    partitioning (`path` itself) is split into segments on first open.
+
+    Writes, moves between months, migration and archiving hold one file
+    lock for the whole shard (`shard-000/.lock`), so several processes can
+    share a shard directory. Each saved version is published to
+    `change_feed` before that lock is released, so the feed has every
+    write, in the order the shard made them.
+
+    Args:
+        path: Shard path (see shard_path)
+        change_feed: Feed the shard's writes are published to
+    """
+
+    def __init__(self, path: str, change_feed: Optional[ChangeFeed] = None):
+        self.path = path
+        self.change_feed = change_feed
+        self.directory = segment_dir(path)
+        self.archive_dir = os.path.join(self.directory, ARCHIVE_DIR)
+        self._lock = threading.Lock()
+        # Hot segments, plus past months written to since the last archive pass
+        self._segments: Dict[str, FileShard] = {}
+        self._prepared: List[FileShard] = []
+        self._staged: List[Dict[str, Any]] = []
+        self._month: Optional[str] = None
+        self._listed: Optional[int] = None
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self._file_lock = FileLock(os.path.join(self.directory, ".lock"))
+        with self._lock, self._file_lock:
+            if os.path.exists(path):
+                self._migrate()
+            self._refresh()
+
+    def _is_hot(self, partition: str) -> bool:
+        return partition == UNDATED or partition >= self._month
+
+    def _refresh(self):
+        """Archive months that have ended and open segments created by other processes (caller holds the lock)."""
+        month = _current_month()
+        if month != self._month:
+            self._month = month
+            with self._file_lock:
+                self._archive_cold()
+        listed = os.stat(self.directory).st_mtime_ns
+        if listed != self._listed:
+            self._listed = listed
+            for name in os.listdir(self.directory):
+                if name.endswith(".jsonl") and self._is_hot(name[:-6]):
+                    self._segment(name[:-6])
+
+    def _segment(self, partition: str) -> FileShard:
+        segment = self._segments.get(partition)
+        if segment is None:
+            segment = self._segments[partition] = FileShard(os.path.join(self.directory, f"{partition}.jsonl"), process_lock=False)
+        return segment
+
+    def _segment_of(self, reservation_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(partition, record) holding a reservation, or (None, None) (caller holds the lock)."""
+        for partition, segment in self._segments.items():
+            record = segment.get(reservation_id)
+            if record is not None:
+                return partition, record
+        return None, None
+
+    def _migrate(self):
+        """Split a pre-partitioning single-file shard into monthly segments (caller holds the lock)."""
+        # A reservation whose date was changed to another month keeps only its final month
+        final: Dict[str, str] = {}
+        with open(self.path, "rb") as f:
+            for line in f:
+                if line.endswith(b"\n") and line.strip():
+                    record = json.loads(line)
+                    final[record["reservation_id"]] = partition_for(record)
+        outputs = {}
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if not (line.endswith(b"\n") and line.strip()):
+                        continue
+                    record = json.loads(line)
+                    partition = partition_for(record)
+                    if final[record["reservation_id"]] != partition:
+                        continue
+                    out = outputs.get(partition)
+                    if out is None:
+                        out = outputs[partition] = open(os.path.join(self.directory, f"{partition}.jsonl"), "ab")
+                    out.write(line)
+        finally:
+            for out in outputs.values():
+                out.close()
+        try:
+            os.replace(self.path, self.path + ".migrated")
+        except FileNotFoundError:
+            pass  # another process migrated it at the same time
+
+    def _archive_path(self, partition: str) -> str:
+        return os.path.join(self.archive_dir, f"{partition}.jsonl.gz")
+
+    def _archive_cold(self) -> int:
+        """Archive every segment of a month that has ended (caller holds both locks)."""
+        archived = 0
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".jsonl") and not self._is_hot(name[:-6]):
+                archived += self._archive(name[:-6])
+        return archived
+
+    def _archive(self, partition: str) -> int:
+        """Compact one month's segment into its archive and delete the segment."""
+        source = os.path.join(self.directory, f"{partition}.jsonl")
+        segment = self._segments.pop(partition, None)
+        if not os.path.exists(source):
+            return 0  # another process archived it; its copy in memory may be stale
+        segment = segment or FileShard(source, process_lock=False)
+        records = segment.all()
+        rows = {r["reservation_id"]: r for r in self._read_archive(partition)}
+        rows.update((r["reservation_id"], r) for r in records)
+
+        target = self._archive_path(partition)
+        temp = f"{target}.{os.getpid()}.tmp"
+        with gzip.open(temp, "wt", encoding="utf-8") as f:
+            for record in sorted(rows.values(), key=phone_key):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(temp, target)
+        try:
+            os.remove(source)
+        except FileNotFoundError:
+            pass
+        print(f"🗄️  Archived {len(records):,} reservations from {partition} ({os.path.basename(self.directory)})")
+        return len(records)
+
+    def _read_archive(self, partition: str) -> Iterator[Dict[str, Any]]:
+        """Stream an archived month in (date, time, id) order."""
+        return _read_archive_file(self._archive_path(partition))
+
+    def archive(self) -> int:
+        """Archive segments of months that have ended; return the number of reservations moved."""
+        with self._lock, self._file_lock:
+            self._month = _current_month()
+            return self._archive_cold()
+
+    def scan(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """
+        Reservations dated from `start_date` to `end_date` (inclusive), hot or archived
+
+        Only the months in the range are read; archives are streamed and
+        stop at the end date.
+
+        Returns:
+            Reservations in (date, time, reservation_id) order
+        """
+        first, last = start_date[:7], end_date[:7]
+        with self._lock:
+            self._refresh()
+            hot = [
+                record
+                for partition, segment in self._segments.items() if first <= partition <= last
+                for record in segment.all() if start_date <= record.get("date", "") <= end_date
+            ]
+        archived = []
+        for name in sorted(os.listdir(self.archive_dir)):
+            partition = name[:-len(".jsonl.gz")]
+            if name.endswith(".jsonl.gz") and first <= partition <= last:
+                for record in self._read_archive(partition):
+                    if record.get("date", "") > end_date:
+                        break
+                    if record.get("date", "") >= start_date:
+                        archived.append(record)
+        return list(heapq.merge(archived, sorted(hot, key=phone_key), key=phone_key))
+
+    def _publish(self, op: str, records: List[Dict[str, Any]]):
+        """Publish saved versions to the change feed (caller holds both locks)."""
+        if self.change_feed is not None and records:
+            self.change_feed.publish([change_event(op, record) for record in records])
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        with self._lock, self._file_lock:
+            self._refresh()
+            saved = self._segment(partition_for(record)).append(record)
+            self._publish("create", [record])
+            return saved
+
+    def reserve(self, record: Dict[str, Any], capacity: Optional[int] = None, tables: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock, self._file_lock:
+            self._refresh()
+            if self._segment_of(record["reservation_id"])[0] is not None:
+                raise ValueError(f"Duplicate reservation ID {record['reservation_id']}")
+            saved = self._segment(partition_for(record)).reserve(record, capacity, tables)
+            self._publish("create", [saved])
+            return saved
+
+    def prepare(self, entries: List[Tuple[Dict[str, Any], Optional[int], Optional[int]]]) -> List[Dict[str, Any]]:
+        """Lock the shard and stage a batch in each month's segment (see FileShard.prepare)."""
+        self._lock.acquire()
+        try:
+            self._file_lock.acquire()
+        except BaseException:
+            self._lock.release()
+            raise
+        try:
+            self._refresh()
+            groups: Dict[str, list] = {}
+            for entry in entries:
+                groups.setdefault(partition_for(entry[0]), []).append(entry)
+            staged = []
+            for partition in sorted(groups):
+                segment = self._segment(partition)
+                staged.extend(segment.prepare(groups[partition]))
+                self._prepared.append(segment)
+            self._staged = staged
+            return staged
+        except BaseException:
+            self._release_prepared(commit=False)
+            raise
+
+    def commit(self):
+        self._release_prepared(commit=True)
+
+    def abort(self):
+        self._release_prepared(commit=False)
+
+    def _release_prepared(self, commit: bool):
+        """Commit or abort every staged segment, then unlock the shard."""
+        prepared, self._prepared = self._prepared, []
+        staged, self._staged = self._staged, []
+        try:
+            for segment in prepared:
+                if commit:
+                    segment.commit()
+                else:
+                    segment.abort()
+            if commit:
+                self._publish("create", staged)
+        finally:
+            try:
+                self._file_lock.release()
+            finally:
+                self._lock.release()
+
+    def update(
+        self,
+        reservation_id: str,
+        changes: Dict[str, Any],
+        capacity: Optional[int] = None,
+        tables: Optional[int] = None,
+        note: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Append a new version of a hot reservation, moving it if its month changes (see FileShard.update)."""
+        with self._lock, self._file_lock:
+            self._refresh()
+            partition, current = self._segment_of(reservation_id)
+            if current is None:
+                return None
+            target = partition_for(dict(current, **changes))
+            if target == partition:
+                updated = self._segments[partition].update(reservation_id, changes, capacity, tables, note)
+            else:
+                # New version first: a crash in between leaves a duplicate, never a lost booking
+                updated = self._segment(target).adopt(current, changes, capacity, tables, note)
+                self._segments[partition].retire(reservation_id, target)
+            self._publish("update", [updated])
+            return updated
+
+    def find_by_phone(self, phone: str, after: Tuple[str, str, str], limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            streams = [segment.find_by_phone(phone, after, limit) for segment in self._segments.values()]
+        return list(islice(heapq.merge(*streams, key=phone_key), limit))
+
+    def seats_booked(self, branch_id: int, date: str, time: str) -> int:
+        with self._lock:
+            self._refresh()
+            segment = self._segments.get(partition_for({"date": date}))
+            return segment.seats_booked(branch_id, date, time) if segment is not None else 0
+
+    def get(self, reservation_id: str) -> Optional[Dict[str, Any]]:
+        """A hot reservation by ID (archived months are read with scan())."""
+        with self._lock:
+            self._refresh()
+            return self._segment_of(reservation_id)[1]
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Hot reservations in the order they were created."""
+        with self._lock:
+            self._refresh()
+            records = [record for segment in self._segments.values() for record in segment.all()]
+        return sorted(records, key=lambda r: r.get("created_at", ""))
+
+    def history(self) -> List[Dict[str, Any]]:
+        """Every reservation, archived months included, in the order they were created."""
+        with self._lock:
+            self._refresh()
+            rows = {}
+            for name in sorted(os.listdir(self.archive_dir)):
+                if name.endswith(".jsonl.gz"):
+                    rows.update((r["reservation_id"], r) for r in self._read_archive(name[:-len(".jsonl.gz")]))
+            # A segment holds newer versions than its month's archive
+            rows.update((r["reservation_id"], r) for segment in self._segments.values() for r in segment.all())
+        return sorted(rows.values(), key=lambda r: r.get("created_at", ""))
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return sum(segment.count() for segment in self._segments.values())
+
+    def close(self):
+        pass
+
+
+def _serve_shard(path: str, conn, change_feed_path: Optional[str] = None):
+    """Worker process loop that owns a single PartitionedShard."""
+    shard = PartitionedShard(path, ChangeFeed(change_feed_path) if change_feed_path else None)
+    while True:
+        try:
+            op, arg = conn.recv()
+        except EOFError:
+            break
+        if op == "close":
+            conn.send(True)
+            break
+        try:
+            if op == "append":
+                result = shard.append(arg)
+            elif op == "reserve":
+                result = shard.reserve(*arg)
+            elif op == "update":
+                result = shard.update(*arg)
+            elif op == "seats_booked":
+                result = shard.seats_booked(*arg)
+            elif op == "find_by_phone":
+                result = shard.find_by_phone(*arg)
+            elif op == "prepare":
+                result = shard.prepare(arg)
+            elif op == "commit":
+                result = shard.commit()
+            elif op == "abort":
+                result = shard.abort()
+            elif op == "scan":
+                result = shard.scan(*arg)
+            elif op == "archive":
+                result = shard.archive()
+            elif op == "get":
+                result = shard.get(arg)
+            elif op == "all":
+                result = shard.all()
+            elif op == "history":
+                result = shard.history()
+            elif op == "count":
+                result = shard.count()
+            else:
+                raise ValueError(f"Unknown shard operation: {op}")
+            conn.send((True, result))
+        except SlotUnavailable as e:
+            conn.send((False, e))
+        except Exception as e:
+            conn.send((False, str(e)))
+    conn.close()
+
+
+class ProcessShard:
+    """
+    Shard served by a dedicated local worker process
+
+    Exposes the same interface as PartitionedShard. Requests are sent over a pipe
+    so the app's threads never contend on the shard lock, and different
+    shards write in parallel. Workers of other app processes serving the
+    same shard are kept out by the shard's file lock. The worker publishes
+    the shard's writes to the change feed at `change_feed_path`.
+    """
+
+    def __init__(self, path: str, change_feed_path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(target=_serve_shard, args=(path, child_conn, change_feed_path), daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def _request(self, op: str, arg: Any = None) -> Any:
+        with self._lock:
+            return self._exchange(op, arg)
+
+    def _exchange(self, op: str, arg: Any = None) -> Any:
+        """Send one request and wait for its reply (caller holds the lock)."""
+        self._conn.send((op, arg))
+        ok, result = self._conn.recv()
+        if not ok:
+            if isinstance(result, SlotUnavailable):
+                raise result
+            raise RuntimeError(f"Shard {self.path}: {result}")
+        return result
+
+    def prepare(self, entries: List[Tuple[Dict[str, Any], Optional[int], Optional[int]]]) -> List[Dict[str, Any]]:
+        # The pipe stays ours until commit/abort, so the worker's shard lock is never contended
+        self._lock.acquire()
+        try:
+            return self._exchange("prepare", entries)
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def commit(self):
+        try:
+            self._exchange("commit")
+        finally:
+            self._lock.release()
+
+    def abort(self):
+        try:
+            self._exchange("abort")
+        finally:
+            self._lock.release()
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        return self._request("append", record)
+
+    def reserve(self, record: Dict[str, Any], capacity: Optional[int] = None, tables: Optional[int] = None) -> Dict[str, Any]:
+        return self._request("reserve", (record, capacity, tables))
+
+    def update(self, reservation_id: str, changes: Dict[str, Any], capacity: Optional[int] = None,
+               tables: Optional[int] = None, note: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return self._request("update", (reservation_id, changes, capacity, tables, note))
+
+    def seats_booked(self, branch_id: int, date: str, time: str) -> int:
+        return self._request("seats_booked", (branch_id, date, time))
+
+    def find_by_phone(self, phone: str, after: Tuple[str, str, str], limit: int) -> List[Dict[str, Any]]:
+        return self._request("find_by_phone", (phone, tuple(after), limit))
+
+    def scan(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        return self._request("scan", (start_date, end_date))
+
+    def archive(self) -> int:
+        return self._request("archive")
+
+    def get(self, reservation_id: str) -> Optional[Dict[str, Any]]:
+        return self._request("get", reservation_id)
+
+    def all(self) -> List[Dict[str, Any]]:
+        return self._request("all")
+
+    def history(self) -> List[Dict[str, Any]]:
+        return self._request("history")
+
+    def count(self) -> int:
+        return self._request("count")
+
+    def close(self):
+        if self._process.is_alive():
+            with self._lock:
+                self._conn.send(("close", None))
+                self._conn.recv()
+            self._process.join(timeout=5)
+        self._conn.close()
+
+
+class ShardRouter:
+    """
+    Routes reservation reads and writes to the owning shard
+
+    Point lookups by reservation ID fan out to every shard (IDs do not
+    encode placement); "list all" merges the per-shard streams by
+    `created_at` so callers see one time-ordered sequence. The shards
+    publish every saved version to the store's change feed; `change_feed`
+    is that feed, for readers. New reservation numbers come from
+    `id_sequence`.
+    """
+
+    def __init__(
+        self,
+        shard_map: ShardMap,
+        shards: List[Any],
+        change_feed: Optional[ChangeFeed] = None,
+        id_sequence: Optional[IdSequence] = None
+    ):
+        if len(shards) != shard_map.num_shards:
+            raise ValueError("Number of shards does not match the shard map")
+        self.shard_map = shard_map
+        self.shards = shards
+        self.change_feed = change_feed
+        self.id_sequence = id_sequence
+
+    def next_id(self) -> int:
+        """Next unused reservation number of this store."""
+        if self.id_sequence is None:
+            raise RuntimeError("This router has no ID sequence; create it with create_router()")
+        return self.id_sequence.next()
+
+    def shard_for(self, reservation: Dict[str, Any]):
+        return self.shards[self.shard_map.shard_for(reservation)]
+
+    def save(self, reservation: Dict[str, Any]) -> bool:
+        return self.shard_for(reservation).append(reservation)
+
+    def reserve(self, reservation: Dict[str, Any], capacity: Optional[int] = None, tables: Optional[int] = None) -> Dict[str, Any]:
+        """Save a new reservation if its slot has room (see FileShard.reserve)."""
+        return self.shard_for(reservation).reserve(reservation, capacity, tables)
+
+    def reserve_many(self, entries: List[Tuple[Dict[str, Any], Optional[int], Optional[int]]]) -> List[Dict[str, Any]]:
+        """
+        Save a batch of new reservations all-or-nothing
+
+        Each involved shard checks and stages its part while locked; the
+        batch is written (one append per shard) only if every shard
+        accepted it.
+
+        Args:
+            entries: (record, capacity, tables) per reservation
+
+        Returns:
+            The saved records, in the order given
+
+        Raises:
+            SlotUnavailable: Some reservation does not fit; nothing was saved
+        """
+        groups: Dict[int, list] = {}
+        for entry in entries:
+            groups.setdefault(self.shard_map.shard_for(entry[0]), []).append(entry)
+
+        prepared = []
+        saved: Dict[str, Dict[str, Any]] = {}
+        try:
+            # Fixed lock order: concurrent batches can't deadlock
+            for index in sorted(groups):
+                staged = self.shards[index].prepare(groups[index])
+                prepared.append(index)
+                saved.update((r["reservation_id"], r) for r in staged)
+        except BaseException:
+            for index in prepared:
+                self.shards[index].abort()
+            raise
+        for index in prepared:
+            self.shards[index].commit()
+        return [saved[record["reservation_id"]] for record, _, _ in entries]
+
+    def update(
+        self,
+        reservation_id: str,
+        changes: Dict[str, Any],
+        capacity: Optional[int] = None,
+        tables: Optional[int] = None,
+        note: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Append a new version of a reservation in its shard (see FileShard.update)."""
+        if "branch_id" in changes or "city" in changes:
+            raise ValueError("A reservation cannot move to another branch; cancel it and book again")
+        for shard in self.shards:
+            updated = shard.update(reservation_id, changes, capacity, tables, note)
+            if updated is not None:
+                return updated
+        return None
+
+    def find_by_phone(self, phone: str, after: Tuple[str, str, str] = ("", "", ""), limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        A guest's confirmed reservations across shards, in time order
+
+        Each shard returns at most `limit` entries after the cursor, so a
+        page costs O(shards * limit) regardless of history size.
+        """
+        streams = [shard.find_by_phone(phone, after, limit) for shard in self.shards]
+        return list(islice(heapq.merge(*streams, key=phone_key), limit))
+
+    def seats_booked(self, branch_id: int, date: str, time: str) -> int:
+        """Seats held in one slot (only its owning shard has any)."""
+        return sum(shard.seats_booked(branch_id, date, time) for shard in self.shards)
+
+    def get(self, reservation_id: str) -> Optional[Dict[str, Any]]:
+        for shard in self.shards:
+            record = shard.get(reservation_id)
+            if record is not None:
+                return record
+        return None
+
+    def scan(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """Reservations dated `start_date`..`end_date` across shards, hot or archived, in time order."""
+        streams = [shard.scan(start_date, end_date) for shard in self.shards]
+        return list(heapq.merge(*streams, key=phone_key))
+
+    def archive(self) -> int:
+        """Archive months that have ended in every shard; return the number of reservations moved."""
+        return sum(shard.archive() for shard in self.shards)
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        """Merge the hot reservations of all shards into a single stream ordered by creation time."""
+        streams = [shard.all() for shard in self.shards]
+        return heapq.merge(*streams, key=lambda r: r.get("created_at", ""))
+
+    def all(self) -> List[Dict[str, Any]]:
+        return list(self.iter_all())
+
+    def history(self) -> List[Dict[str, Any]]:
+        """Every reservation of all shards, archived months included, ordered by creation time."""
+        streams = [shard.history() for shard in self.shards]
+        return list(heapq.merge(*streams, key=lambda r: r.get("created_at", "")))
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+def shard_path(shard_dir: str, index: int) -> str:
+    """Path for shard `index` inside `shard_dir` (its segments live in segment_dir() of it)."""
+    return os.path.join(shard_dir, f"shard-{index:03d}.jsonl")
+
+
+def change_feed_path(shard_dir: str) -> str:
+    """Change log of the store in `shard_dir`."""
+    return os.path.join(shard_dir, CHANGE_FEED_FILE)
+
+
+def create_router(
+    shard_dir: str,
+    num_shards: int = 1,
+    key: str = "branch_id",
+    use_processes: bool = False,
+    overrides: Optional[Dict[Any, int]] = None,
+    change_feed: bool = True
+) -> ShardRouter:
+    """
+    Factory function to create a shard router
+
+    Args:
+        shard_dir: Directory holding the shard files
+        num_shards: Number of shards
+        key: Shard key ('branch_id' or 'city')
+        use_processes: Serve each shard from its own worker process
+        overrides: Optional explicit key -> shard placements
+        change_feed: Publish changes to the store's change log (see change_feed.py)
+
+    Returns:
+        Configured ShardRouter instance
+    """
+    feed = ChangeFeed(change_feed_path(shard_dir)) if change_feed else None
+    if use_processes:
+        shards = [ProcessShard(shard_path(shard_dir, i), feed.path if feed else None) for i in range(num_shards)]
+    else:
+        shards = [PartitionedShard(shard_path(shard_dir, i), feed) for i in range(num_shards)]
+    ids = IdSequence(os.path.join(shard_dir, ID_SEQUENCE_FILE))
+    return ShardRouter(ShardMap(num_shards, key=key, overrides=overrides), shards, change_feed=feed, id_sequence=ids)
+
+
+# --- THROUGHPUT CHECK ---
+
+def _benchmark(shard_dir: str, num_shards: int, bookings: int, writers: int) -> float:
+    """Write `bookings` records from `writers` threads; return bookings/sec."""
+    router = create_router(shard_dir, num_shards=num_shards, use_processes=True)
+    per_writer = bookings // writers
+
+    def writer(w: int):
+        for i in range(per_writer):
+            router.save({
+                "reservation_id": f"GF-B{w:03d}{i:06d}",
+                "branch_id": w * per_writer + i,
+                "created_at": f"{time.time():.6f}",
+                "party_size": 2,
+            })
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    router.close()
+    return per_writer * writers / elapsed
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Measure booking throughput per shard count")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--bookings", type=int, default=4000)
+    parser.add_argument("--writers", type=int, default=8)
+    args = parser.parse_args()
+
+    for n in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            rate = _benchmark(tmp, n, args.bookings, args.writers)
+        print(f"🗄️  {n} shard(s): {rate:,.0f} bookings/sec")
@@ -2,45 +2,385 @@
 Reservations Database Manager
 
 Handles storing and retrieving reservation data for GoodFoods.
+
+Reservations are stored in shards (see reservation_shards.py). The shard
+layout is configured from the environment or with `configure_shards()`:
+
+    GOODFOODS_SHARDS=4              number of shards (default 1)
+    GOODFOODS_SHARD_KEY=city        'branch_id' (default) or 'city'
+    GOODFOODS_SHARD_PROCESSES=1     serve each shard from a worker process
+    GOODFOODS_CHANGE_FEED=0         don't write the change feed (default on)
+
+Bookings made through `book_reservation()` and changes made through
+`update_reservation()` check the seats and tables left in the
+(branch, date, time) slot atomically in the owning shard.
+`book_reservations()` saves a group of bookings all-or-nothing.
+`find_reservations_by_phone()` reads the shards' phone index.
+`new_reservation_id()` hands out IDs from the store's sequence file, so
+they are unique across processes and never reuse an archived ID.
+
+Shards keep the current and future months in memory and archive the
+rest. `load_reservations()` returns every reservation, archive included;
+`load_active_reservations()` returns only the in-memory (current and
+upcoming) ones, and `find_reservations_in_range()` reads any date range.
+
+Every create, change and cancellation is also published to an ordered
+change feed with monotonically increasing offsets (see change_feed.py);
+`read_changes()` and `subscribe_changes()` let derived views follow it
+incrementally instead of reloading reservations.
 """
 
 import json
 import os
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-RESERVATIONS_FILE = "d:/assign/reservations.json"
+from data_paths import data_path
+from metrics import REGISTRY
+from tracing import span
+from change_feed import ChangeFeed, Subscription
+from reservation_shards import ShardRouter, SlotUnavailable, create_router, segment_dir, shard_path
+from slot_parser import normalize_phone
 
-def load_reservations() -> List[Dict]:
-    """Load all reservations from the database file."""
+RESERVATIONS_FILE = data_path("reservations.json")
+SHARD_DIR = data_path("reservation_shards")
+
+STORE_OP_SECONDS = REGISTRY.histogram("goodfoods_store_op_seconds", "Reservation store operation latency", ["op"])
+STORE_ERRORS = REGISTRY.counter("goodfoods_store_errors_total", "Failed reservation store operations", ["op"])
+BOOKINGS = REGISTRY.counter("goodfoods_bookings_total", "Reservations saved")
+BOOKING_RATE = REGISTRY.meter("goodfoods_bookings_per_second", "Reservations saved per second over the last minute")
+SLOT_REJECTIONS = REGISTRY.counter("goodfoods_slot_full_total", "Bookings and changes refused because the slot was full", ["op"])
+RESERVATION_UPDATES = REGISTRY.counter("goodfoods_reservation_updates_total", "Reservation changes by resulting status", ["status"])
+
+_router: Optional[ShardRouter] = None
+_router_lock = threading.Lock()
+
+def _load_legacy_reservations() -> List[Dict]:
+    """Load reservations from the original single-file JSON database."""
     if not os.path.exists(RESERVATIONS_FILE):
         return []
-    
+
     try:
         with open(RESERVATIONS_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
     except:
         return []
 
+def configure_shards(
+    num_shards: Optional[int] = None,
+    shard_dir: Optional[str] = None,
+    key: Optional[str] = None,
+    use_processes: Optional[bool] = None
+) -> ShardRouter:
+    """
+    Configure the shard layout used by this module
+
+    Arguments left as None fall back to the GOODFOODS_SHARD* environment
+    variables. The first time a shard directory is used, reservations from
+    the legacy reservations.json file are imported into their owning shards.
+
+    Args:
+        num_shards: Number of shards
+        shard_dir: Directory holding the shard files
+        key: Shard key ('branch_id' or 'city')
+        use_processes: Serve each shard from its own local worker process
+
+    Returns:
+        The active ShardRouter
+    """
+    global _router
+
+    if num_shards is None:
+        num_shards = int(os.environ.get("GOODFOODS_SHARDS", "1"))
+    if shard_dir is None:
+        shard_dir = SHARD_DIR
+    if key is None:
+        key = os.environ.get("GOODFOODS_SHARD_KEY", "branch_id")
+    if use_processes is None:
+        use_processes = os.environ.get("GOODFOODS_SHARD_PROCESSES", "0") == "1"
+
+    with _router_lock:
+        if _router is not None:
+            _router.close()
+
+        is_new = not any(
+            os.path.exists(shard_path(shard_dir, i)) or os.path.isdir(segment_dir(shard_path(shard_dir, i)))
+            for i in range(num_shards)
+        )
+        _router = create_router(
+            shard_dir, num_shards=num_shards, key=key, use_processes=use_processes,
+            change_feed=os.environ.get("GOODFOODS_CHANGE_FEED", "1") == "1"
+        )
+
+        if is_new:
+            for reservation in _load_legacy_reservations():
+                _router.save(reservation)
+            # Past bookings from the legacy file go straight to the archive
+            _router.archive()
+
+        return _router
+
+def get_router() -> ShardRouter:
+    """Return the active shard router, configuring it on first use."""
+    if _router is None:
+        return configure_shards()
+    return _router
+
+def set_router(router: Optional[ShardRouter]) -> Optional[ShardRouter]:
+    """
+    Swap the active router without closing the current one
+
+    Used to point the store at a temporary location (load tests,
+    benchmarks) and restore it afterwards.
+
+    Returns:
+        The previously active router (may be None)
+    """
+    global _router
+    with _router_lock:
+        previous, _router = _router, router
+        return previous
+
+def load_reservations() -> List[Dict]:
+    """
+    Load all reservations across shards, archived months included, ordered by creation time
+
+    Reads every archive; use load_active_reservations() when only current
+    and upcoming bookings are needed.
+    """
+    try:
+        with span("store.load"), STORE_OP_SECONDS.time(op="load"):
+            return get_router().history()
+    except Exception as e:
+        STORE_ERRORS.inc(op="load")
+        print(f"Error loading reservations: {e}")
+        return []
+
+def load_active_reservations() -> List[Dict]:
+    """Load current and upcoming reservations (the shards' in-memory months), ordered by creation time."""
+    try:
+        with span("store.load_active"), STORE_OP_SECONDS.time(op="load_active"):
+            return get_router().all()
+    except Exception as e:
+        STORE_ERRORS.inc(op="load_active")
+        print(f"Error loading reservations: {e}")
+        return []
+
 def save_reservation(reservation: Dict) -> bool:
-    """Save a new reservation to the database."""
+    """Save a new reservation to its owning shard."""
+    start = time.perf_counter()
     try:
-        reservations = load_reservations()
-        reservations.append(reservation)
-        
-        with open(RESERVATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(reservations, f, indent=2, ensure_ascii=False)
-        
-        return True
+        with span("store.save", reservation_id=reservation.get("reservation_id")):
+            saved = get_router().save(reservation)
     except Exception as e:
+        STORE_ERRORS.inc(op="save")
         print(f"Error saving reservation: {e}")
         return False
+    STORE_OP_SECONDS.observe(time.perf_counter() - start, op="save")
+    if saved:
+        BOOKINGS.inc()
+        BOOKING_RATE.mark()
+    return saved
+
+def book_reservation(reservation: Dict, capacity: Optional[int] = None, tables: Optional[int] = None) -> Dict:
+    """
+    Save a new reservation if its slot still has room
+
+    Args:
+        reservation: New reservation record
+        capacity: Seats per (branch, date, time) slot
+        tables: Tables per slot; a free table number is assigned
+
+    Returns:
+        The saved record (with its table number)
+
+    Raises:
+        SlotUnavailable: Not enough seats or tables left
+    """
+    start = time.perf_counter()
+    try:
+        with span("store.reserve", reservation_id=reservation.get("reservation_id")):
+            saved = get_router().reserve(reservation, capacity, tables)
+    except SlotUnavailable:
+        SLOT_REJECTIONS.inc(op="reserve")
+        raise
+    except Exception:
+        STORE_ERRORS.inc(op="reserve")
+        raise
+    STORE_OP_SECONDS.observe(time.perf_counter() - start, op="reserve")
+    BOOKINGS.inc()
+    BOOKING_RATE.mark()
+    return saved
+
+def book_reservations(entries: List[Tuple[Dict, Optional[int], Optional[int]]]) -> List[Dict]:
+    """
+    Save a batch of new reservations all-or-nothing
+
+    The whole batch is checked against seats and tables first (bookings in
+    the batch count against each other), then written with one append per
+    involved shard.
+
+    Args:
+        entries: (reservation, capacity, tables) per booking
+
+    Returns:
+        The saved records, in the order given
+
+    Raises:
+        SlotUnavailable: Some booking does not fit; nothing was saved
+    """
+    start = time.perf_counter()
+    try:
+        with span("store.reserve_many", count=len(entries)):
+            saved = get_router().reserve_many(entries)
+    except SlotUnavailable:
+        SLOT_REJECTIONS.inc(op="reserve_many")
+        raise
+    except Exception:
+        STORE_ERRORS.inc(op="reserve_many")
+        raise
+    STORE_OP_SECONDS.observe(time.perf_counter() - start, op="reserve_many")
+    BOOKINGS.inc(len(saved))
+    BOOKING_RATE.mark(len(saved))
+    return saved
+
+def update_reservation(
+    reservation_id: str,
+    changes: Dict[str, Any],
+    capacity: Optional[int] = None,
+    tables: Optional[int] = None,
+    note: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    Change a reservation by appending its new version
+
+    The old version's seats and table are released and the new version's
+    taken in one step, and a status history entry is recorded.
+
+    Args:
+        reservation_id: Reservation to change
+        changes: Fields to overwrite, e.g. {"status": "cancelled"}
+        capacity: Seats per slot, checked if the reservation stays confirmed
+        tables: Tables per slot
+        note: Reason stored in the status history
+
+    Returns:
+        The updated reservation, or None if it does not exist
+
+    Raises:
+        SlotUnavailable: The changed booking does not fit its slot
+    """
+    start = time.perf_counter()
+    try:
+        with span("store.update", reservation_id=reservation_id):
+            updated = get_router().update(reservation_id, changes, capacity, tables, note)
+    except SlotUnavailable:
+        SLOT_REJECTIONS.inc(op="update")
+        raise
+    except Exception:
+        STORE_ERRORS.inc(op="update")
+        raise
+    STORE_OP_SECONDS.observe(time.perf_counter() - start, op="update")
+    if updated is not None:
+        RESERVATION_UPDATES.inc(status=updated.get("status", "confirmed"))
+    return updated
 
 def get_reservation(reservation_id: str) -> Optional[Dict]:
     """Retrieve a specific reservation by ID."""
-    reservations = load_reservations()
-    return next((r for r in reservations if r['reservation_id'] == reservation_id), None)
+    with span("store.get", reservation_id=reservation_id), STORE_OP_SECONDS.time(op="get"):
+        return get_router().get(reservation_id)
+
+def new_reservation_id() -> str:
+    """Unused reservation ID (GF-100000 and up), unique across processes and archived months."""
+    return f"GF-{get_router().next_id()}"
+
+def seats_booked(branch_id: int, date: str, time: str) -> int:
+    """Seats held by confirmed reservations in a (branch, date, time) slot."""
+    with span("store.seats_booked", branch_id=branch_id), STORE_OP_SECONDS.time(op="seats_booked"):
+        return get_router().seats_booked(branch_id, date, time)
+
+def find_reservations_by_phone(
+    phone: str,
+    after: Optional[Tuple[str, str, str]] = None,
+    limit: int = 10
+) -> List[Dict]:
+    """
+    A guest's confirmed reservations in time order (phone index lookup)
+
+    Args:
+        phone: Phone number in any common format (normalized to E.164)
+        after: Exclusive cursor (date, time, reservation_id); defaults to
+            now, i.e. upcoming reservations only
+        limit: Page size
+
+    Returns:
+        Up to `limit` reservations
+    """
+    e164 = normalize_phone(phone)
+    if not e164:
+        return []
+    if after is None:
+        now = datetime.now()
+        after = (now.strftime("%Y-%m-%d"), now.strftime("%H:%M"), "")
+    with span("store.find_by_phone", limit=limit), STORE_OP_SECONDS.time(op="find_by_phone"):
+        return get_router().find_by_phone(e164, tuple(after), limit)
+
+def find_reservations_in_range(start_date: str, end_date: str) -> List[Dict]:
+    """
+    Reservations dated from `start_date` to `end_date`, including archived months
+
+    Args:
+        start_date: First date (YYYY-MM-DD)
+        end_date: Last date (YYYY-MM-DD), inclusive
+
+    Returns:
+        Reservations in (date, time, reservation_id) order
+    """
+    with span("store.scan", start=start_date, end=end_date), STORE_OP_SECONDS.time(op="scan"):
+        return get_router().scan(start_date, end_date)
 
 def get_all_reservations() -> List[Dict]:
-    """Get all reservations."""
+    """Get all reservations, archived months included (see load_reservations)."""
     return load_reservations()
+
+def get_change_feed() -> Optional[ChangeFeed]:
+    """Change feed of the active store, or None when disabled."""
+    return get_router().change_feed
+
+def read_changes(offset: int = 0, limit: int = 1000) -> Tuple[List[Dict], int]:
+    """
+    Read reservation change events in order
+
+    Args:
+        offset: 0 for the beginning, or the next_offset from a previous call
+        limit: Maximum number of events
+
+    Returns:
+        (events, next_offset); each event has op ("create", "update" or
+        "cancel"), reservation_id, version, at, record and offset
+    """
+    feed = get_change_feed()
+    if feed is None:
+        return [], offset
+    return feed.read(offset, limit)
+
+def subscribe_changes(callback: Callable[[Dict], None], offset: Optional[int] = None) -> Subscription:
+    """
+    Call `callback` for each change event in a background thread
+
+    Args:
+        callback: Receives one event at a time, in offset order
+        offset: Where to start (default: only new events)
+
+    Returns:
+        Subscription; its `offset` is where to resume after stop()
+
+    Raises:
+        RuntimeError: The change feed is disabled
+    """
+    feed = get_change_feed()
+    if feed is None:
+        raise RuntimeError("The change feed is disabled (GOODFOODS_CHANGE_FEED=0)")
+    return feed.subscribe(callback, offset)
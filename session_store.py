@@ -0,0 +1,334 @@
+"""
+Conversation Session Store for GoodFoods
+
+Keeps agent conversation state outside the Streamlit process so that any
+worker can serve any guest. State is serialized compactly (minified JSON,
+zlib-compressed) and loaded per turn:
+
+    store = create_session_store()
+    agent = store.load_agent(session_id, api_key, model) or Agent(api_key, model, session_id=session_id)
+    reply = agent.chat(prompt)
+    store.save_agent(session_id, agent)
+
+The shared store is SQLite, reachable from every worker. An optional
+bounded in-memory LRU can sit in front of it: the most recent sessions
+stay resident, and idle or overflowing sessions are evicted to disk.
+
+Sessions not updated for GOODFOODS_SESSION_MAX_AGE seconds are deleted by
+a background purger (see start_purger).
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from data_paths import data_path
+from metrics import REGISTRY
+
+SESSION_DB_FILE = data_path("sessions.db")
+
+# Sessions idle longer than this are deleted; the purger runs this often
+SESSION_MAX_AGE = float(os.environ.get("GOODFOODS_SESSION_MAX_AGE", "86400"))
+PURGE_INTERVAL = 3600
+
+CACHE_REQUESTS = REGISTRY.counter("goodfoods_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+
+# --- SERIALIZATION ---
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """Serialize agent state to compact bytes."""
+    raw = json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+
+def decode_state(blob: bytes) -> Dict[str, Any]:
+    """Inverse of `encode_state`."""
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+# --- STORES ---
+
+class SessionStore:
+    """
+    Base session store interface
+
+    Subclasses implement the byte-level `get_blob`/`put_blob`/`delete`.
+    """
+
+    def get_blob(self, session_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def put_blob(self, session_id: str, blob: bytes):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def purge_older_than(self, max_age_seconds: float) -> int:
+        """Delete sessions not updated within `max_age_seconds`; return count."""
+        return 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the decoded state for a session, or None."""
+        blob = self.get_blob(session_id)
+        return decode_state(blob) if blob is not None else None
+
+    def put(self, session_id: str, state: Dict[str, Any]):
+        self.put_blob(session_id, encode_state(state))
+
+    def load_agent(self, session_id: str, api_key: str, model: Optional[str] = None):
+        """
+        Restore an Agent for this session
+
+        Args:
+            session_id: Session identifier
+            api_key: Groq API key for the restored agent
+            model: If given, a stored session for a different model is ignored
+
+        Returns:
+            Agent instance, or None if no usable session is stored
+        """
+        from agent_core import Agent
+
+        state = self.get(session_id)
+        if state is None or (model and state.get("model") != model):
+            return None
+        return Agent.from_state(state, api_key=api_key, session_id=session_id)
+
+    def save_agent(self, session_id: str, agent):
+        self.put(session_id, agent.to_state())
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    File-backed session store shared by all worker processes
+
+    Uses SQLite in WAL mode so readers in other processes do not block the
+    writer.
+    """
+
+    def __init__(self, path: str = SESSION_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " state BLOB NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def get_blob(self, session_id: str) -> Optional[bytes]:
+        row = self._conn().execute(
+            "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_blob(self, session_id: str, blob: bytes):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+            (session_id, blob, time.time())
+        )
+        conn.commit()
+
+    def delete(self, session_id: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    def purge_older_than(self, max_age_seconds: float) -> int:
+        """Delete sessions not updated within `max_age_seconds`; return count."""
+        conn = self._conn()
+        cur = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age_seconds,))
+        conn.commit()
+        return cur.rowcount
+
+
+class LRUSessionStore(SessionStore):
+    """
+    Bounded in-memory session cache with optional spill to a backing store
+
+    At most `max_sessions` encoded sessions are kept resident. Sessions
+    pushed out by the LRU bound, or idle longer than `idle_seconds`, are
+    written to `backing` (if set) and dropped from memory. Reads that miss
+    memory fall through to `backing`.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 256,
+        idle_seconds: float = 900,
+        backing: Optional[SessionStore] = None
+    ):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.backing = backing
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (blob, last_used, dirty)
+
+    def get_blob(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries[session_id] = (entry[0], time.time(), entry[2])
+                self._entries.move_to_end(session_id)
+                CACHE_REQUESTS.inc(cache="session", result="hit")
+                return entry[0]
+        CACHE_REQUESTS.inc(cache="session", result="miss")
+        if self.backing is None:
+            return None
+        blob = self.backing.get_blob(session_id)
+        if blob is not None:
+            self._insert(session_id, blob, dirty=False)
+        return blob
+
+    def put_blob(self, session_id: str, blob: bytes):
+        self._insert(session_id, blob, dirty=True)
+
+    def _insert(self, session_id: str, blob: bytes, dirty: bool):
+        with self._lock:
+            self._entries[session_id] = (blob, time.time(), dirty)
+            self._entries.move_to_end(session_id)
+            evicted = self._collect_evictions()
+        self._spill(evicted)
+
+    def _collect_evictions(self) -> list:
+        """Pop overflowing and idle entries (caller holds the lock)."""
+        evicted = []
+        while len(self._entries) > self.max_sessions:
+            evicted.append(self._entries.popitem(last=False))
+        cutoff = time.time() - self.idle_seconds
+        # Entries are in LRU order, so idle ones are at the front
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if entry[1] >= cutoff:
+                break
+            evicted.append(self._entries.popitem(last=False))
+        return evicted
+
+    def _spill(self, evicted: list):
+        if self.backing is None:
+            return
+        for session_id, (blob, _, dirty) in evicted:
+            if dirty:
+                self.backing.put_blob(session_id, blob)
+
+    def evict_idle(self) -> int:
+        """Evict idle sessions now; return the number evicted."""
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._spill(evicted)
+        return len(evicted)
+
+    def flush(self):
+        """Write every dirty resident session to the backing store."""
+        if self.backing is None:
+            return
+        with self._lock:
+            dirty = [(sid, e) for sid, e in self._entries.items() if e[2]]
+            for sid, (blob, last_used, _) in dirty:
+                self._entries[sid] = (blob, last_used, False)
+        for sid, (blob, _, _) in dirty:
+            self.backing.put_blob(sid, blob)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+        if self.backing is not None:
+            self.backing.delete(session_id)
+
+    def purge_older_than(self, max_age_seconds: float) -> int:
+        """Drop resident sessions unused within `max_age_seconds`, then purge the backing store."""
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            stale = [sid for sid, entry in self._entries.items() if entry[1] < cutoff]
+            for sid in stale:
+                del self._entries[sid]
+        if self.backing is None:
+            return len(stale)
+        return self.backing.purge_older_than(max_age_seconds)
+
+    def resident_bytes(self) -> int:
+        """Total size of the encoded sessions held in memory."""
+        with self._lock:
+            return sum(len(e[0]) for e in self._entries.values())
+
+
+def create_session_store(db_path: Optional[str] = None, max_sessions: Optional[int] = None) -> SessionStore:
+    """
+    Factory function to create the default session store
+
+    Arguments left as None fall back to GOODFOODS_SESSION_DB and
+    GOODFOODS_SESSION_CACHE. With a cache size of 0 (the default) every
+    turn reads and writes SQLite directly, so any worker can serve the next
+    turn. A positive cache size keeps that many sessions resident in front
+    of SQLite; use it only with sticky sessions, since another worker would
+    not see turns still held in this process's memory.
+
+    Args:
+        db_path: SQLite database file
+        max_sessions: Maximum sessions resident in memory (0 disables the cache)
+
+    Returns:
+        Configured SessionStore instance
+    """
+    if db_path is None:
+        db_path = os.environ.get("GOODFOODS_SESSION_DB", SESSION_DB_FILE)
+    if max_sessions is None:
+        max_sessions = int(os.environ.get("GOODFOODS_SESSION_CACHE", "0"))
+
+    backing = SQLiteSessionStore(db_path)
+    if max_sessions <= 0:
+        return backing
+    return LRUSessionStore(max_sessions=max_sessions, backing=backing)
+
+
+def new_session_id() -> str:
+    """Unguessable session ID (256 random bits, URL-safe)."""
+    return secrets.token_urlsafe(32)
+
+
+def start_purger(
+    store: SessionStore,
+    max_age_seconds: float = SESSION_MAX_AGE,
+    interval: float = PURGE_INTERVAL
+) -> threading.Thread:
+    """
+    Delete sessions idle longer than `max_age_seconds` now and every `interval` seconds
+
+    Runs in a daemon thread; every worker may run one, purges are idempotent.
+
+    Returns:
+        The purger thread
+    """
+    def run():
+        while True:
+            try:
+                purged = store.purge_older_than(max_age_seconds)
+                if purged:
+                    print(f"🧹 Purged {purged:,} sessions idle for over {max_age_seconds / 3600:g}h")
+            except Exception as e:
+                print(f"Warning: Could not purge sessions: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="session-purge", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,143 @@
+"""
+Single-Flight Request Coalescing for GoodFoods
+
+When many sessions ask for the same thing at the same moment (every
+guest at dinner rush searching Bangalore), only the first caller runs the
+work; concurrent callers with the same key wait for it and share its
+result (or its exception):
+
+    flight = SingleFlight("tools")
+    result, shared = flight.do(key, lambda: search_branches(city="Bangalore"))
+
+Works from threads (`do`) and asyncio coroutines (`do_async`), and the
+two can join each other's flights: each in-flight call is backed by a
+`concurrent.futures.Future`. Nothing is cached — once the leader
+finishes, the next caller starts a fresh call.
+
+Duplicate work absorbed is exported as metrics:
+
+    goodfoods_singleflight_calls_total{flight, role="leader"|"follower"}
+    goodfoods_singleflight_saved_seconds_total{flight}
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from metrics import REGISTRY
+
+SINGLEFLIGHT_CALLS = REGISTRY.counter(
+    "goodfoods_singleflight_calls_total", "Coalesced calls by role (followers are absorbed duplicates)", ["flight", "role"]
+)
+SINGLEFLIGHT_SAVED_SECONDS = REGISTRY.counter(
+    "goodfoods_singleflight_saved_seconds_total", "Work time followers did not spend (leader time per follower)", ["flight"]
+)
+
+
+def make_key(*parts: Any) -> str:
+    """
+    Build a compact key from JSON-serializable parts
+
+    Dict keys are sorted, so argument order does not matter.
+    """
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """One in-flight computation and the number of callers sharing it"""
+    __slots__ = ("future", "followers", "started")
+
+    def __init__(self):
+        self.future: Future = Future()
+        self.followers = 0
+        self.started = time.perf_counter()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution
+
+    Args:
+        name: Label used in metrics (e.g. "tools", "llm")
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: str) -> Tuple[_Call, bool]:
+        """Return the call for `key` and whether the caller leads it."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                SINGLEFLIGHT_CALLS.inc(flight=self.name, role="follower")
+                return call, False
+            call = self._calls[key] = _Call()
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="leader")
+            return call, True
+
+    def _finish(self, key: str, call: _Call, result: Any = None, error: BaseException = None):
+        # Unpublish first: callers arriving from now on start a fresh call
+        with self._lock:
+            self._calls.pop(key, None)
+            followers = call.followers
+        if followers:
+            SINGLEFLIGHT_SAVED_SECONDS.inc((time.perf_counter() - call.started) * followers, flight=self.name)
+        if error is not None:
+            call.future.set_exception(error)
+        else:
+            call.future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run `fn` unless a call with the same key is in flight, then share its outcome
+
+        Args:
+            key: Normalized request key (see make_key)
+            fn: Zero-argument callable doing the work
+
+        Returns:
+            (result, shared) — shared is True when another caller's result was reused
+
+        Raises:
+            Whatever `fn` raised, for the leader and every follower
+        """
+        call, leader = self._join(key)
+        if not leader:
+            return call.future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result)
+        return result, False
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Async variant of do(): `fn` returns an awaitable; waiting never blocks the loop
+
+        Followers may be waiting on a leader in another thread or event loop.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(call.future), True
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result)
+        return result, False
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,348 @@
+"""
+Booking Slot Parser for GoodFoods
+
+Deterministic, local extraction of reservation dates, times and party
+sizes from guest messages ("tomorrow at 7:30pm for four" ->
+2025-11-28 / 19:30 / 4), so the model doesn't have to do calendar
+arithmetic or format conversion:
+
+- `annotate()` appends a normalized note to user messages before they are
+  sent to the LLM
+- `normalize_date()`, `normalize_time()` and `normalize_party_size()`
+  clean up tool arguments before `make_reservation` validates them
+- `normalize_phone()` turns phone numbers into E.164 ("+919876543210")
+  for matching and the store's phone index
+
+Clock times without am/pm are read in restaurant hours: 1-9 are
+afternoon/evening, 10-12 are taken as written.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date as Date, datetime, timedelta
+from typing import Any, Optional
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+MONTHS = {
+    "jan": 1, "january": 1, "feb": 2, "february": 2, "mar": 3, "march": 3,
+    "apr": 4, "april": 4, "may": 5, "jun": 6, "june": 6, "jul": 7, "july": 7,
+    "aug": 8, "august": 8, "sep": 9, "sept": 9, "september": 9, "oct": 10, "october": 10,
+    "nov": 11, "november": 11, "dec": 12, "december": 12,
+}
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18,
+    "nineteen": 19, "twenty": 20, "a couple": 2, "couple": 2,
+}
+
+# Country code assumed for numbers written without one
+DEFAULT_COUNTRY_CODE = "91"
+
+# Marker wrapping the note added by annotate(); stripped again for display
+NOTE_PREFIX = "\n\n[[parsed: "
+NOTE_SUFFIX = "]]"
+
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_WEEKDAY = "|".join(WEEKDAYS)
+_NUMBER = r"\d{1,2}|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True))
+# Not followed by a time ("for 7:30", "for 8pm") or the rest of a date ("for 25/12", "for 12-01", "for 25.12")
+_NOT_A_TIME = r"(?!\s*(?::|[./-]\d|am\b|pm\b|a\.m|p\.m|o'?clock))"
+
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+NUMERIC_DATE = re.compile(r"\b(\d{1,2})[/-](\d{1,2})(?:[/-](\d{2}|\d{4}))?\b")
+DAY_MONTH = re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({_MONTH})\b\.?(?:,?\s*(\d{{4}}))?")
+MONTH_DAY = re.compile(rf"\b({_MONTH})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s*(\d{{4}}))?")
+RELATIVE_DAY = re.compile(r"\b(day after tomorrow|tomorrow|tmrw|tonight|today|this evening)\b")
+IN_DAYS = re.compile(rf"\bin\s+({_NUMBER}|a)\s+(days?|weeks?)\b")
+WEEKDAY = re.compile(rf"\b(next|this|coming)?\s*({_WEEKDAY})\b")
+
+TIME_MERIDIEM = re.compile(r"\b(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.?|p\.m\.?)(?![a-z])")
+TIME_24H = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)(?::\d{2})?\b")
+TIME_HALF_PAST = re.compile(r"\bhalf past\s+(\d{1,2}|" + "|".join(w for w in NUMBER_WORDS if " " not in w) + r")\b")
+TIME_AT_HOUR = re.compile(r"\bat\s+(\d{1,2})(?:\s*o'?clock)?\b(?!\s*(?:people|persons?|guests?|pax|of us|[:/-]))")
+TIME_WORDS = {"noon": "12:00", "midday": "12:00", "midnight": "00:00"}
+
+PARTY_FOR = re.compile(rf"\b(?:table for|party of|group of|for)\s+({_NUMBER})\b{_NOT_A_TIME}")
+PARTY_COUNT = re.compile(rf"\b({_NUMBER})\s+(?:people|persons?|guests?|pax|adults|diners|of us)\b")
+PARTY_SOLO = re.compile(r"\b(just me|only me|myself|table for one)\b")
+
+
+@dataclass
+class ParsedSlots:
+    """Normalized values found in a message (None when absent)"""
+    date: Optional[str] = None
+    time: Optional[str] = None
+    party_size: Optional[int] = None
+
+    def is_empty(self) -> bool:
+        return self.date is None and self.time is None and self.party_size is None
+
+
+def _number(token: str) -> Optional[int]:
+    token = token.strip().lower()
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+def _make_date(year: Optional[int], month: int, day: int, today: Date) -> Optional[Date]:
+    """Build a date; without a year, pick the next occurrence on or after today."""
+    try:
+        if year is not None:
+            return Date(year + 2000 if year < 100 else year, month, day)
+        candidate = Date(today.year, month, day)
+        if candidate < today:
+            candidate = Date(today.year + 1, month, day)
+        return candidate
+    except ValueError:
+        return None
+
+
+def _weekday_date(qualifier: Optional[str], weekday: str, today: Date) -> Date:
+    ahead = (WEEKDAYS.index(weekday) - today.weekday()) % 7
+    if qualifier == "next":
+        # "next friday" is the one in the following week
+        ahead = ahead or 7
+        candidate = today + timedelta(days=ahead)
+        if candidate.isocalendar()[1] == today.isocalendar()[1]:
+            candidate += timedelta(days=7)
+        return candidate
+    return today + timedelta(days=ahead)
+
+
+def parse_date(text: str, today: Optional[Date] = None) -> Optional[str]:
+    """
+    Extract a reservation date
+
+    Understands ISO dates, DD/MM[/YYYY], "25th December", "Dec 25",
+    today/tonight/tomorrow/day after tomorrow, "in 3 days", "in a week"
+    and weekday names ("friday", "next saturday").
+
+    Args:
+        text: Free text or a tool argument
+        today: Reference date (defaults to today)
+
+    Returns:
+        Date as YYYY-MM-DD, or None if no date was found
+    """
+    today = today or datetime.now().date()
+    lowered = text.lower()
+
+    match = ISO_DATE.search(lowered)
+    if match:
+        found = _make_date(int(match.group(1)), int(match.group(2)), int(match.group(3)), today)
+        return found.isoformat() if found else None
+
+    match = DAY_MONTH.search(lowered)
+    if match:
+        found = _make_date(int(match.group(3)) if match.group(3) else None, MONTHS[match.group(2)], int(match.group(1)), today)
+        if found:
+            return found.isoformat()
+
+    match = MONTH_DAY.search(lowered)
+    if match:
+        found = _make_date(int(match.group(3)) if match.group(3) else None, MONTHS[match.group(1)], int(match.group(2)), today)
+        if found:
+            return found.isoformat()
+
+    match = NUMERIC_DATE.search(lowered)
+    if match:
+        # Day first, as written in India
+        found = _make_date(int(match.group(3)) if match.group(3) else None, int(match.group(2)), int(match.group(1)), today)
+        if found:
+            return found.isoformat()
+
+    match = RELATIVE_DAY.search(lowered)
+    if match:
+        offset = {"day after tomorrow": 2, "tomorrow": 1, "tmrw": 1}.get(match.group(1), 0)
+        return (today + timedelta(days=offset)).isoformat()
+
+    match = IN_DAYS.search(lowered)
+    if match:
+        count = 1 if match.group(1) == "a" else _number(match.group(1))
+        if count is not None:
+            days = count * 7 if match.group(2).startswith("week") else count
+            return (today + timedelta(days=days)).isoformat()
+
+    match = WEEKDAY.search(lowered)
+    if match:
+        return _weekday_date(match.group(1), match.group(2), today).isoformat()
+
+    return None
+
+
+def _restaurant_hour(hour: int) -> int:
+    """Read a bare clock hour in restaurant hours (1-9 -> pm)."""
+    return hour + 12 if 1 <= hour <= 9 else hour
+
+
+def parse_time(text: str) -> Optional[str]:
+    """
+    Extract a reservation time
+
+    Understands "7pm", "7:30 pm", "7.30pm", "19:30", "noon", "half past 7"
+    and "at 8".
+
+    Returns:
+        Time as HH:MM (24-hour), or None if no time was found
+    """
+    lowered = text.lower()
+
+    match = TIME_MERIDIEM.search(lowered)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        if 1 <= hour <= 12 and minute < 60:
+            if match.group(3).startswith("p") and hour != 12:
+                hour += 12
+            elif match.group(3).startswith("a") and hour == 12:
+                hour = 0
+            return f"{hour:02d}:{minute:02d}"
+
+    match = TIME_24H.search(lowered)
+    if match:
+        hour = int(match.group(1))
+        if not match.group(1).startswith("0"):
+            hour = _restaurant_hour(hour)
+        return f"{hour:02d}:{match.group(2)}"
+
+    for word, value in TIME_WORDS.items():
+        if re.search(rf"\b{word}\b", lowered):
+            return value
+
+    match = TIME_HALF_PAST.search(lowered)
+    if match:
+        hour = _number(match.group(1))
+        if hour is not None and 1 <= hour <= 12:
+            return f"{_restaurant_hour(hour):02d}:30"
+
+    match = TIME_AT_HOUR.search(lowered)
+    if match:
+        hour = int(match.group(1))
+        if 1 <= hour <= 12:
+            return f"{_restaurant_hour(hour):02d}:00"
+
+    return None
+
+
+def parse_party_size(text: str) -> Optional[int]:
+    """
+    Extract a party size ("for 4", "party of six", "4 people", "a couple of us")
+
+    Returns:
+        Number of guests, or None if no party size was found
+    """
+    lowered = text.lower()
+
+    if PARTY_SOLO.search(lowered):
+        return 1
+    for pattern in (PARTY_COUNT, PARTY_FOR):
+        match = pattern.search(lowered)
+        if match:
+            size = _number(match.group(1))
+            if size:
+                return size
+    return None
+
+
+def parse_slots(text: str, today: Optional[Date] = None) -> ParsedSlots:
+    """Extract date, time and party size from a message."""
+    return ParsedSlots(
+        date=parse_date(text, today),
+        time=parse_time(text),
+        party_size=parse_party_size(text)
+    )
+
+
+def annotate(text: str, today: Optional[Date] = None) -> str:
+    """
+    Append a normalized note to a user message
+
+    "Table for 4 tomorrow at 2pm" becomes
+    "Table for 4 tomorrow at 2pm\\n\\n[[parsed: date=2025-11-28 (Friday), time=14:00, party_size=4]]".
+    Messages without any date, time or party size are returned unchanged.
+    """
+    slots = parse_slots(text, today)
+    if slots.is_empty():
+        return text
+
+    parts = []
+    if slots.date:
+        parts.append(f"date={slots.date} ({datetime.strptime(slots.date, '%Y-%m-%d').strftime('%A')})")
+    if slots.time:
+        parts.append(f"time={slots.time}")
+    if slots.party_size:
+        parts.append(f"party_size={slots.party_size}")
+    return f"{text}{NOTE_PREFIX}{', '.join(parts)}{NOTE_SUFFIX}"
+
+
+def strip_annotation(text: str) -> str:
+    """Remove the note added by annotate() (for display)."""
+    index = text.find(NOTE_PREFIX)
+    return text[:index] if index != -1 and text.endswith(NOTE_SUFFIX) else text
+
+
+# --- TOOL ARGUMENT NORMALIZATION ---
+
+def normalize_date(value: Any, today: Optional[Date] = None) -> Any:
+    """Return `value` as YYYY-MM-DD when it can be parsed, else unchanged."""
+    if not isinstance(value, str):
+        return value
+    return parse_date(value, today) or value
+
+
+def normalize_time(value: Any) -> Any:
+    """Return `value` as HH:MM when it can be parsed, else unchanged."""
+    if not isinstance(value, str):
+        return value
+    return parse_time(value) or value
+
+
+def normalize_party_size(value: Any) -> Any:
+    """
+    Return `value` as an int when it is a number or number phrase, else unchanged
+
+    Anything else ("-3", "2.5", a date) is returned as given so that
+    validation rejects it, rather than guessing a size from its digits.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        size = _number(value)
+        if size is None:
+            size = parse_party_size(value)
+        return size if size is not None else value
+    return value
+
+
+def normalize_phone(value: Any, country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """
+    Normalize a phone number to E.164
+
+    "98765 43210", "098765-43210", "+91 98765 43210" and "919876543210"
+    all become "+919876543210". Numbers written with a leading + or 00
+    keep their own country code.
+
+    Returns:
+        "+<country code><number>", or None if it isn't a plausible phone number
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    text = str(value).strip()
+    digits = "".join(ch for ch in text if ch.isdigit())
+    if text.startswith("00"):
+        digits = digits[2:]
+    elif not text.startswith("+"):
+        if len(digits) == 11 and digits.startswith("0"):
+            digits = country_code + digits[1:]
+        elif len(digits) == 10:
+            digits = country_code + digits
+    if not 8 <= len(digits) <= 15:
+        return None
+    return "+" + digits
@@ -5,10 +5,17 @@ Tests the MCP protocol, agent functionality, and core tools.
 """
 
 import json
-from agent_core import Agent, search_branches, get_recommendations, make_reservation, BRANCHES
+import os
+from agent_core import Agent, search_branches, get_recommendations, make_reservation, set_branches
 from mcp_server import create_mcp_server
 import agent_core as tools_module
 
+# Test against the catalog shipped with the repository, wherever the data directory is
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "goodfoods_branches.json")
+with open(CATALOG_FILE, 'r', encoding='utf-8') as f:
+    set_branches(json.load(f))
+BRANCHES = tools_module.BRANCHES
+
 print("=" * 70)
 print("GOODFOODS RESERVATION SYSTEM - TEST SUITE")
 print("=" * 70)
@@ -120,15 +127,335 @@ else:
 print("\n  [6.2] Invalid date format")
 response = mcp_server.call_tool("make_reservation", {
     "branch_id": 1,
-    "date": "25-12-2025",  # Wrong format
+    "date": "25/13/2025",  # No month 13, in either order
     "time": "19:00",
     "party_size": 4
 })
 result_text = response.content[0]['text']
-if "invalid" in result_text.lower() or "format" in result_text.lower():
+if "invalid date format" in result_text.lower():
     print(f"  ✅ Correctly handled invalid date")
 else:
-    print(f"  ⚠️ Result: {result_text[:100]}...")
+    print(f"  ❌ Result: {result_text[:100]}...")
+
+print("\n  [6.3] Day-first date accepted")
+from datetime import datetime, timedelta
+day_first = datetime.now() + timedelta(days=30)
+response = mcp_server.call_tool("make_reservation", {
+    "branch_id": 1,
+    "date": day_first.strftime("%d-%m-%Y"),
+    "time": "19:00",
+    "party_size": 4
+})
+result_text = response.content[0]['text']
+if tools_module.normalize_date(day_first.strftime("%d-%m-%Y")) == day_first.strftime("%Y-%m-%d") and "invalid date" not in result_text.lower():
+    print(f"  ✅ {day_first.strftime('%d-%m-%Y')} read as {day_first.strftime('%Y-%m-%d')}")
+else:
+    print(f"  ❌ Day-first date rejected: {result_text[:100]}...")
+
+# Test 7: Fuzzy Branch Resolution
+print("\n[TEST 7] Fuzzy Branch Resolution")
+BRANCH_RESOLVER = tools_module.BRANCH_RESOLVER
+
+for query, city, expected in [
+    ("Koramangla", None, "GoodFoods - Koramangala"),
+    ("Bandra West", None, "GoodFoods - Bandra"),
+    ("CP", "New Delhi", "GoodFoods - Connaught Place"),
+    ("MG Road", "Bengaluru", "GoodFoods - MG Road"),
+]:
+    resolution = BRANCH_RESOLVER.resolve(query, city=city)
+    if resolution.best and resolution.best['branch_name'] == expected:
+        print(f"  ✅ '{query}' -> {expected}")
+    else:
+        print(f"  ❌ '{query}' did not resolve to {expected}")
+
+resolution = BRANCH_RESOLVER.resolve("MG Road")
+if resolution.is_ambiguous:
+    print(f"  ✅ 'MG Road' without city returns a shortlist of {len(resolution.candidates)}")
+else:
+    print(f"  ❌ 'MG Road' without city should be ambiguous")
+
+# Test 8: Cross-Process Slot Capacity
+print("\n[TEST 8] Cross-Process Slot Capacity")
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SLOT_DATE = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d")
+SLOT_TIMES = [f"{hour}:{minute:02d}" for hour in range(12, 22) for minute in (0, 15, 30, 45)]
+# Each process tries to book 15 parties of 2 into every 20-seat, 10-table slot, starting together
+BOOKER = f"""
+import sys, time
+from reservation_shards import PartitionedShard, SlotUnavailable
+shard = PartitionedShard(sys.argv[1])
+time.sleep(max(0.0, float(sys.argv[3]) - time.time()))
+booked = 0
+for slot in {SLOT_TIMES!r}:
+    for i in range(15):
+        record = {{"reservation_id": f"{{sys.argv[2]}}-{{slot}}-{{i}}", "branch_id": 1, "date": "{SLOT_DATE}",
+                  "time": slot, "party_size": 2, "status": "confirmed"}}
+        try:
+            shard.reserve(record, capacity=20, tables=10)
+            booked += 1
+        except SlotUnavailable:
+            pass
+print(booked)
+"""
+
+with tempfile.TemporaryDirectory() as shard_dir:
+    shard_file = os.path.join(shard_dir, "shard-000.jsonl")
+    start_at = str(time.time() + 2)
+    workers = [
+        subprocess.Popen([sys.executable, "-c", BOOKER, shard_file, name, start_at], stdout=subprocess.PIPE, text=True,
+                         cwd=os.path.dirname(CATALOG_FILE))
+        for name in ("A", "B")
+    ]
+    booked = sum(int(worker.communicate()[0].strip() or 0) for worker in workers)
+    from reservation_shards import PartitionedShard
+    shard = PartitionedShard(shard_file)
+    overbooked = [slot for slot in SLOT_TIMES if shard.seats_booked(1, SLOT_DATE, slot) > 20]
+    tables = [(r["time"], r["table_number"]) for r in shard.all()]
+    if booked == 10 * len(SLOT_TIMES) and not overbooked and len(set(tables)) == len(tables):
+        print(f"  ✅ Two processes booked {booked} parties into {len(SLOT_TIMES)} 20-seat slots, none overbooked")
+    else:
+        print(f"  ❌ Two processes booked {booked} parties (slots hold {10 * len(SLOT_TIMES)}); overbooked: {overbooked}")
+
+# Test 9: Slot Parser
+print("\n[TEST 9] Slot Parser")
+from datetime import date
+from slot_parser import normalize_party_size, parse_slots
+
+PARSE_TODAY = date(2026, 10, 19)
+for message, expected in [
+    ("book for 25/12 at 8", ("2026-12-25", "20:00", None)),
+    ("book for 12/01 at noon", ("2027-01-12", "12:00", None)),
+    ("book for 12-01 at 7", ("2027-01-12", "19:00", None)),
+    ("table for 4 on 25/12 at 8", ("2026-12-25", "20:00", 4)),
+    ("for 4 at 7:30", (None, "19:30", 4)),
+    ("party of six tomorrow", ("2026-10-20", None, 6)),
+]:
+    slots = parse_slots(message, PARSE_TODAY)
+    parsed = (slots.date, slots.time, slots.party_size)
+    if parsed == expected:
+        print(f"  ✅ '{message}' -> {parsed}")
+    else:
+        print(f"  ❌ '{message}' -> {parsed}, expected {expected}")
+
+for value, expected in [("four", 4), ("6 people", 6), (" 4 ", 4), (3.0, 3),
+                        ("-3", "-3"), ("2.5", "2.5"), ("2026-13-01", "2026-13-01")]:
+    size = normalize_party_size(value)
+    if size == expected and type(size) is type(expected):
+        print(f"  ✅ normalize_party_size({value!r}) -> {size!r}")
+    else:
+        print(f"  ❌ normalize_party_size({value!r}) -> {size!r}, expected {expected!r}")
+
+# Tests 10+ book into a temporary store
+import reservations_db
+from reservation_shards import create_router
+
+test_store = tempfile.TemporaryDirectory()
+previous_router = reservations_db.set_router(create_router(test_store.name, change_feed=False))
+
+
+def open_slot(branch_id, days_ahead=7, hour="19"):
+    """(branch, date, time) of the first slot in the given hour on an open day at least `days_ahead` away."""
+    branch = tools_module.BRANCH_RESOLVER.get_branch(branch_id)
+    for offset in range(days_ahead, days_ahead + 7):
+        day = datetime.now() + timedelta(days=offset)
+        slots = [s for s in branch['weekly_schedule'].get(day.strftime("%A"), []) if s.startswith(hour)]
+        if slots:
+            return branch, day.strftime("%Y-%m-%d"), slots[0]
+    raise RuntimeError(f"Branch {branch_id} has no {hour}:xx slot")
+
+
+# Test 10: Group Booking Is All-Or-Nothing
+print("\n[TEST 10] Group Booking Is All-Or-Nothing")
+from agent_core import make_bulk_reservations
+
+full_branch, full_date, full_time = open_slot(2)
+free_branch, free_date, free_time = open_slot(3)
+make_reservation(branch_id=full_branch['id'], date=full_date, time=full_time, party_size=full_branch['capacity'],
+                 customer_name="Full House", customer_phone="9800000010")
+before = reservations_db.get_router().count()
+result = make_bulk_reservations([
+    {"branch_id": free_branch['id'], "date": free_date, "time": free_time, "party_size": 2},
+    {"branch_id": full_branch['id'], "date": full_date, "time": full_time, "party_size": 2},
+], customer_name="Group Test", customer_phone="9800000011")
+held = reservations_db.seats_booked(free_branch['id'], free_date, free_time)
+grouped = [r for r in reservations_db.load_reservations() if r.get("group_id")]
+if "Not enough room" in result and reservations_db.get_router().count() == before and held == 0 and not grouped:
+    print("  ✅ One full slot rejects the whole group; nothing saved, no seats held")
+else:
+    print(f"  ❌ Group with a full slot saved {reservations_db.get_router().count() - before} reservations, holds {held} seats")
+
+result = make_bulk_reservations([
+    {"branch_id": free_branch['id'], "date": free_date, "time": free_time, "party_size": 2},
+    {"branch_id": free_branch['id'], "date": free_date, "time": free_time, "party_size": 4},
+], customer_name="Group Test", customer_phone="9800000011")
+if "❌" not in result and reservations_db.seats_booked(free_branch['id'], free_date, free_time) == 6:
+    print("  ✅ A group that fits is saved in full")
+else:
+    print(f"  ❌ Group that fits was not saved: {result[:100]}")
+
+# Test 11: Repeated Booking Replays the Original
+print("\n[TEST 11] Repeated Booking Replays the Original")
+from agent_core import CURRENT_SESSION
+
+replay_branch, replay_date, replay_time = open_slot(4)
+session = CURRENT_SESSION.set("test-session-idempotency")
+try:
+    replies = [
+        make_reservation(branch_id=replay_branch['id'], date=replay_date, time=replay_time, party_size=2,
+                         customer_name="Retry Test", customer_phone=phone)
+        for phone in ("9800000020", "+91 98000 00020")
+    ]
+finally:
+    CURRENT_SESSION.reset(session)
+first_id = replies[0].split("Reservation ID:** ")[1].split()[0]
+stored = [r for r in reservations_db.load_reservations() if r.get("customer_name") == "Retry Test"]
+if first_id in replies[1] and len(stored) == 1 and stored[0]["reservation_id"] == first_id:
+    print(f"  ✅ Same session, slot and phone returns {first_id} again; one reservation stored")
+else:
+    print(f"  ❌ Repeated booking stored {len(stored)} reservations; second reply: {replies[1][:80]}")
+
+# Test 12: Cancel and Modify Move Inventory
+print("\n[TEST 12] Cancel and Modify Move Inventory")
+from agent_core import cancel_reservation, modify_reservation
+
+move_branch, move_date, move_time = open_slot(5)
+_, _, later_time = open_slot(5, hour="20")
+reply = make_reservation(branch_id=move_branch['id'], date=move_date, time=move_time, party_size=4,
+                         customer_name="Move Test", customer_phone="9800000030")
+moved_id = reply.split("Reservation ID:** ")[1].split()[0]
+first_table = reservations_db.get_reservation(moved_id)["table_number"]
+
+modify_reservation(moved_id, customer_phone="9800000030", time=later_time, party_size=6)
+seats = (reservations_db.seats_booked(move_branch['id'], move_date, move_time),
+         reservations_db.seats_booked(move_branch['id'], move_date, later_time))
+if seats == (0, 6):
+    print(f"  ✅ Modify moved the seats from {move_time} to {later_time} and resized them to 6")
+else:
+    print(f"  ❌ After modify the slots hold {seats} seats, expected (0, 6)")
+
+reply = make_reservation(branch_id=move_branch['id'], date=move_date, time=move_time, party_size=2,
+                         customer_name="Table Test", customer_phone="9800000031")
+next_table = reservations_db.get_reservation(reply.split("Reservation ID:** ")[1].split()[0])["table_number"]
+if next_table == first_table:
+    print(f"  ✅ Table {first_table} at {move_time} was released by the modify and reused")
+else:
+    print(f"  ❌ New booking at {move_time} got table {next_table}, expected released table {first_table}")
+
+cancel_reservation(moved_id, customer_phone="9800000030")
+if reservations_db.seats_booked(move_branch['id'], move_date, later_time) == 0:
+    print(f"  ✅ Cancel released the seats at {later_time}")
+else:
+    print(f"  ❌ Cancelled reservation still holds {reservations_db.seats_booked(move_branch['id'], move_date, later_time)} seats")
+
+# Test 13: Archiving an Ended Month
+print("\n[TEST 13] Archiving an Ended Month")
+import reservation_shards
+
+this_month = datetime.now().date().replace(day=1)
+ended_month = (this_month - timedelta(days=1)).replace(day=1)
+next_month = (this_month + timedelta(days=32)).replace(day=1)
+month_clock = [ended_month.strftime("%Y-%m")]
+real_current_month = reservation_shards._current_month
+reservation_shards._current_month = lambda: month_clock[0]
+archive_dir = tempfile.TemporaryDirectory()
+try:
+    def archive_record(reservation_id, day):
+        return {"reservation_id": reservation_id, "branch_id": 1, "date": day.isoformat(), "time": "19:00",
+                "party_size": 2, "customer_phone": "+919800000040", "status": "confirmed"}
+
+    # While the ended month is still current: one booking stays, one moves to next month
+    shard = PartitionedShard(os.path.join(archive_dir.name, "shard-000.jsonl"))
+    shard.append(archive_record("GF-1", ended_month + timedelta(days=9)))
+    shard.append(archive_record("GF-2", ended_month + timedelta(days=19)))
+    shard.append(archive_record("GF-3", this_month + timedelta(days=4)))
+    shard.update("GF-2", {"date": (next_month + timedelta(days=2)).isoformat()})
+
+    # The month changes: the next call archives the ended month
+    month_clock[0] = this_month.strftime("%Y-%m")
+    scanned = [r["reservation_id"] for r in shard.scan(ended_month.isoformat(), (next_month + timedelta(days=27)).isoformat())]
+    archived = os.path.exists(os.path.join(archive_dir.name, "shard-000", "archive", f"{ended_month:%Y-%m}.jsonl.gz"))
+    if archived and scanned == ["GF-1", "GF-3", "GF-2"]:
+        print("  ✅ Ended month archived; scan returns archived and hot bookings once each, in date order")
+    else:
+        print(f"  ❌ Archived: {archived}, scan returned {scanned}, expected ['GF-1', 'GF-3', 'GF-2']")
+
+    by_phone = [r["reservation_id"] for r in shard.find_by_phone("+919800000040", ("", "", ""), 10)]
+    if by_phone == ["GF-3", "GF-2"] and shard.get("GF-1") is None:
+        print("  ✅ Phone lookup returns only the upcoming bookings after archiving")
+    else:
+        print(f"  ❌ Phone lookup returned {by_phone}, expected ['GF-3', 'GF-2']")
+
+    # Move the reservation back into the current month, then reopen the shard as another process would
+    moved = shard.update("GF-2", {"date": (this_month + timedelta(days=6)).isoformat()})
+    reopened = PartitionedShard(os.path.join(archive_dir.name, "shard-000.jsonl"))
+    rows = [(r["reservation_id"], r["date"]) for r in reopened.scan(ended_month.isoformat(), (next_month + timedelta(days=27)).isoformat())]
+    expected = [("GF-1", (ended_month + timedelta(days=9)).isoformat()),
+                ("GF-3", (this_month + timedelta(days=4)).isoformat()),
+                ("GF-2", (this_month + timedelta(days=6)).isoformat())]
+    if moved is not None and moved["version"] == 3 and rows == expected and shard.update("GF-1", {"time": "20:00"}) is None:
+        print("  ✅ Update across months after archiving keeps one current version; archived bookings are read-only")
+    else:
+        print(f"  ❌ After moving GF-2 back the shard holds {rows}, expected {expected}")
+finally:
+    reservation_shards._current_month = real_current_month
+    archive_dir.cleanup()
+
+# Test 14: Cancellation Promotes the Waitlist
+print("\n[TEST 14] Cancellation Promotes the Waitlist")
+import waitlist as waitlist_module
+from agent_core import join_waitlist
+
+previous_waitlist = waitlist_module._waitlist
+waitlist_module._waitlist = test_waitlist = waitlist_module.Waitlist(os.path.join(test_store.name, "waitlist.db"))
+try:
+    wait_branch, wait_date, wait_time = open_slot(6)
+    make_reservation(branch_id=wait_branch['id'], date=wait_date, time=wait_time, party_size=wait_branch['capacity'] - 6,
+                     customer_name="Full House", customer_phone="9800000050")
+    reply = make_reservation(branch_id=wait_branch['id'], date=wait_date, time=wait_time, party_size=6,
+                             customer_name="Leaving Party", customer_phone="9800000051")
+    leaving_id = reply.split("Reservation ID:** ")[1].split()[0]
+
+    # Queue: 8 (too big for the 6 seats freed), 4 and 2 (fit), 3 (no seats left after them)
+    queue = {}
+    for name, size, phone in (("Big", 8, "9800000052"), ("Four", 4, "9800000053"),
+                              ("Two", 2, "9800000054"), ("Three", 3, "9800000055")):
+        reply = join_waitlist(wait_date, wait_time, size, branch_id=wait_branch['id'], customer_name=name, customer_phone=phone)
+        queue[name] = reply.split("Waitlist ID:** ")[1].split()[0] if "Waitlist ID:** " in reply else None
+    if all(queue.values()) and [test_waitlist.position(queue[n]) for n in ("Big", "Four", "Two", "Three")] == [1, 2, 3, 4]:
+        print("  ✅ Parties joining a full slot are queued in order")
+    else:
+        print(f"  ❌ Waitlist entries not queued in order: {queue}")
+
+    cancel_reservation(leaving_id, customer_phone="9800000051")
+    entries = {name: test_waitlist.get(waitlist_id) for name, waitlist_id in queue.items() if waitlist_id}
+    statuses = {name: entry['status'] for name, entry in entries.items()}
+    if statuses == {"Big": "waiting", "Four": "promoted", "Two": "promoted", "Three": "waiting"}:
+        print("  ✅ Freed seats go to the first parties that fit; the larger party keeps its place")
+    else:
+        print(f"  ❌ After the cancellation the waitlist is {statuses}")
+
+    promoted = [reservations_db.get_reservation(entries[n]['reservation_id']) for n in ("Four", "Two") if entries.get(n, {}).get('reservation_id')]
+    booked = reservations_db.seats_booked(wait_branch['id'], wait_date, wait_time)
+    if len(promoted) == 2 and all(r and r['status'] == 'confirmed' for r in promoted) and booked == wait_branch['capacity']:
+        print(f"  ✅ Promoted parties hold confirmed reservations; the slot is full again ({booked} seats)")
+    else:
+        print(f"  ❌ Promoted reservations: {promoted}, slot holds {booked}/{wait_branch['capacity']} seats")
+
+    positions = (test_waitlist.position(queue["Big"]), test_waitlist.position(queue["Three"]))
+    if positions == (1, 2) and test_waitlist.waiting(wait_branch['id'], wait_date, wait_time) == 2:
+        print("  ✅ Positions of the parties still waiting are updated")
+    else:
+        print(f"  ❌ Remaining positions are {positions}, expected (1, 2)")
+finally:
+    waitlist_module._waitlist = previous_waitlist
+
+reservations_db.set_router(previous_router).close()
+test_store.cleanup()
 
 print("\n" + "=" * 70)
 print("TEST SUITE COMPLETE")
@@ -0,0 +1,174 @@
+"""
+Per-Turn Tool Selection for GoodFoods
+
+Infers where a conversation is in the booking flow and offers the LLM
+only the tools that make sense at that point, instead of every schema on
+every turn:
+
+    exploring           -> search_branches, get_recommendations
+    selecting_branch    -> + make_reservation, make_bulk_reservations
+    collecting_details  -> make_reservation, make_bulk_reservations, join_waitlist,
+                           search_branches
+    confirming          -> make_reservation, make_bulk_reservations, search_branches,
+                           get_recommendations, cancel_reservation, modify_reservation
+    managing            -> find_my_reservations, cancel_reservation,
+                           modify_reservation, join_waitlist,
+                           waitlist_position, leave_waitlist, search_branches
+
+Each state always maps to the same subset in the same canonical order, so
+every state has its own byte-stable request prefix for provider prompt
+caching.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+EXPLORING = "exploring"
+SELECTING_BRANCH = "selecting_branch"
+COLLECTING_DETAILS = "collecting_details"
+CONFIRMING = "confirming"
+MANAGING = "managing"
+
+STATE_TOOLS = {
+    EXPLORING: ("search_branches", "get_recommendations"),
+    SELECTING_BRANCH: ("search_branches", "get_recommendations", "make_reservation", "make_bulk_reservations"),
+    COLLECTING_DETAILS: ("make_reservation", "make_bulk_reservations", "join_waitlist", "search_branches"),
+    CONFIRMING: ("make_reservation", "make_bulk_reservations", "search_branches", "get_recommendations", "cancel_reservation", "modify_reservation"),
+    MANAGING: ("find_my_reservations", "cancel_reservation", "modify_reservation", "join_waitlist", "waitlist_position", "leave_waitlist", "search_branches"),
+}
+
+# Tools whose results put branches in front of the guest
+BROWSE_TOOLS = {"search_branches", "get_recommendations"}
+
+# Tools that create new reservations
+BOOKING_TOOLS = {"make_reservation", "make_bulk_reservations"}
+
+# Tools that look up or change existing reservations and waitlist entries
+MANAGE_TOOLS = {"find_my_reservations", "cancel_reservation", "modify_reservation", "join_waitlist", "waitlist_position", "leave_waitlist"}
+
+# Words and patterns that signal the guest wants to book now
+BOOKING_PATTERN = re.compile(
+    r"\b(book|booking|reserve|reservation|table for|party of|seats?|guests?|people|persons?|pax)\b"
+    r"|\b\d{1,2}(:\d{2})?\s*(am|pm)\b|\b\d{1,2}:\d{2}\b"
+    r"|\b(today|tonight|tomorrow|this evening)\b"
+    r"|\b\d{10}\b|\+\d{10,13}\b",
+    re.IGNORECASE
+)
+
+# A reservation or waitlist ID, a question about existing bookings or a request to cancel/change one or wait
+MANAGE_PATTERN = re.compile(
+    r"\bGF-?\d{5,}\b|\bWL-?\d{6}\b|\b(cancel\w*|reschedul\w*|postpone|modify|wait-?list\w*)\b"
+    r"|\bmy (upcoming |existing )?(reservations?|bookings?)\b|\b(what|when|where) did i book\b"
+    r"|\b(change|move|update|shift)\b.{0,40}\b(booking|reservation|table)\b",
+    re.IGNORECASE
+)
+
+# A reference to a specific branch ("branch 9", "id 12", "the first one")
+BRANCH_REFERENCE_PATTERN = re.compile(
+    r"\b(branch|id)\s*#?\s*\d+\b|\b(first|second|third|last|that|this) (one|branch|location)\b",
+    re.IGNORECASE
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+@dataclass
+class ToolSelection:
+    """Tools chosen for one turn and the schema tokens saved"""
+    state: str
+    names: Tuple[str, ...]
+    tools: List[Dict[str, Any]]
+    tokens_sent: int
+    tokens_saved: int
+
+
+def _tool_calls(history: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Return (tool name, result text) for each tool call in the history."""
+    names = {}
+    calls = []
+    for message in history:
+        for tc in message.get("tool_calls") or []:
+            names[tc["id"]] = tc["function"]["name"]
+        if message.get("role") == "tool":
+            calls.append((names.get(message.get("tool_call_id"), ""), message.get("content") or ""))
+    return calls
+
+
+def infer_state(history: List[Dict[str, Any]], user_input: str) -> str:
+    """
+    Infer the booking-flow state from the history and the new user message
+
+    Args:
+        history: Conversation so far (before `user_input` is appended)
+        user_input: The guest's new message
+
+    Returns:
+        One of EXPLORING, SELECTING_BRANCH, COLLECTING_DETAILS, CONFIRMING, MANAGING
+    """
+    calls = _tool_calls(history)
+    if MANAGE_PATTERN.search(user_input):
+        return MANAGING
+    # Still answering a cancel/modify follow-up (e.g. the phone number for verification)
+    if calls and calls[-1][0] in MANAGE_TOOLS and not calls[-1][1].startswith("✅"):
+        return MANAGING
+    wants_booking = bool(BOOKING_PATTERN.search(user_input))
+    names_branch = bool(BRANCH_REFERENCE_PATTERN.search(user_input))
+
+    reservation_results = [text for name, text in calls if name in BOOKING_TOOLS]
+    if reservation_results:
+        if reservation_results[-1].startswith("✅"):
+            return CONFIRMING
+        return COLLECTING_DETAILS
+
+    browsed = any(name in BROWSE_TOOLS for name, _ in calls)
+    if browsed and (wants_booking or names_branch):
+        return COLLECTING_DETAILS
+    if browsed or wants_booking or names_branch:
+        return SELECTING_BRANCH
+    return EXPLORING
+
+
+def _encoded_tokens(tools: List[Dict[str, Any]]) -> int:
+    return estimate_tokens(json.dumps(tools, sort_keys=True, separators=(",", ":")))
+
+
+class ToolSelector:
+    """
+    Picks the tool subset for each turn
+
+    Args:
+        all_tools: Every tool in OpenAI format (canonical order)
+        state_tools: Mapping of state -> tool names to offer; tools not
+            listed for any state are always offered
+    """
+
+    def __init__(self, all_tools: List[Dict[str, Any]], state_tools: Optional[Dict[str, Tuple[str, ...]]] = None):
+        self.all_tools = all_tools
+        self.state_tools = state_tools or STATE_TOOLS
+        self.all_tokens = _encoded_tokens(all_tools)
+
+        # Tools not assigned to any state (e.g. newly added ones) are always offered
+        known = {name for names in self.state_tools.values() for name in names}
+        always = {t["function"]["name"] for t in all_tools} - known
+
+        # Subsets are sliced from the shared list, so their dicts (and bytes) never vary
+        self._by_state: Dict[str, ToolSelection] = {}
+        for state, names in self.state_tools.items():
+            tools = [t for t in all_tools if t["function"]["name"] in names or t["function"]["name"] in always]
+            tokens = _encoded_tokens(tools)
+            self._by_state[state] = ToolSelection(
+                state=state,
+                names=tuple(t["function"]["name"] for t in tools),
+                tools=tools,
+                tokens_sent=tokens,
+                tokens_saved=self.all_tokens - tokens
+            )
+
+    def select(self, history: List[Dict[str, Any]], user_input: str) -> ToolSelection:
+        """Return the precomputed selection for the inferred state."""
+        return self._by_state[infer_state(history, user_input)]
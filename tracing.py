@@ -0,0 +1,454 @@
+"""
+Tracing for GoodFoods
+
+Lightweight spans propagated through contextvars, so a booking turn can be
+reconstructed as a tree: chat -> llm.request -> tool.call -> tool.* ->
+store.*. Configured from the environment or with `configure_tracing()`:
+
+    GOODFOODS_TRACE_SAMPLE=0.1          keep 10% of turns (default 0 = off)
+    GOODFOODS_TRACE_SLOW_MS=2000        also keep any turn slower than this
+    GOODFOODS_TRACE_FILE=traces.jsonl   JSON-lines span file
+    GOODFOODS_TRACE_OTLP=http://127.0.0.1:4318/v1/traces
+                                        send OTLP/JSON to a collector instead
+
+Usage:
+
+    from tracing import span, traced
+
+    with span("store.save", reservation_id=rid):
+        ...
+
+    @traced("tool.search_branches")
+    def search_branches(...): ...
+
+The module also runs as a collector stand-in and a trace viewer:
+
+    python tracing.py serve --port 4318 --output traces.jsonl
+    python tracing.py show traces.jsonl --slowest 5
+"""
+
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from data_paths import data_path
+
+TRACE_FILE = data_path("traces.jsonl")
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "status", "_buffer")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], buffer: List["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.status = "ok"
+        self._buffer = buffer
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status = "error"
+        self.attributes["error"] = message
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """Stand-in yielded when tracing is off; accepts and drops everything"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("goodfoods_span", default=None)
+
+
+# --- EXPORTERS ---
+
+class JsonlExporter:
+    """Append finished spans to a JSON-lines file"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(s, default=str) + "\n" for s in spans)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    def close(self):
+        pass
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Dict[str, Any]], service: str = "goodfoods") -> Dict[str, Any]:
+    """Convert span dictionaries to an OTLP/JSON ExportTraceServiceRequest."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+            "scopeSpans": [{
+                "scope": {"name": "goodfoods.tracing"},
+                "spans": [{
+                    "traceId": s["trace_id"],
+                    "spanId": s["span_id"],
+                    "parentSpanId": s["parent_id"] or "",
+                    "name": s["name"],
+                    "kind": 1,
+                    "startTimeUnixNano": str(int(s["start"] * 1e9)),
+                    "endTimeUnixNano": str(int((s["start"] + s["duration_ms"] / 1000) * 1e9)),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()],
+                    "status": {"code": 2 if s["status"] == "error" else 1}
+                } for s in spans]
+            }]
+        }]
+    }
+
+
+def from_otlp(document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Convert an OTLP/JSON request back into span dictionaries."""
+    spans = []
+    for resource in document.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            for s in scope.get("spans", []):
+                start = int(s["startTimeUnixNano"]) / 1e9
+                attributes = {}
+                for a in s.get("attributes", []):
+                    value = next(iter(a["value"].values()), None)
+                    attributes[a["key"]] = int(value) if "intValue" in a["value"] else value
+                spans.append({
+                    "trace_id": s["traceId"],
+                    "span_id": s["spanId"],
+                    "parent_id": s.get("parentSpanId") or None,
+                    "name": s["name"],
+                    "start": start,
+                    "duration_ms": round((int(s["endTimeUnixNano"]) / 1e9 - start) * 1000, 3),
+                    "status": "error" if s.get("status", {}).get("code") == 2 else "ok",
+                    "attributes": attributes
+                })
+    return spans
+
+
+class OTLPExporter:
+    """
+    Batch spans and POST them as OTLP/JSON from a background thread
+
+    Export never blocks a request: spans are queued and dropped if the
+    queue is full or the collector is unreachable.
+    """
+
+    def __init__(self, endpoint: str, batch_size: int = 256, interval: float = 1.0, max_queue: int = 10000):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def export(self, spans: List[Dict[str, Any]]):
+        for s in spans:
+            try:
+                self._queue.put_nowait(s)
+            except queue.Full:
+                self.dropped += 1
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch: List[Dict[str, Any]]):
+        body = json.dumps(to_otlp(batch), default=str).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception:
+            self.dropped += len(batch)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            batch = self._drain()
+            while batch:
+                self._send(batch)
+                batch = self._drain()
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join(timeout=5)
+        batch = self._drain()
+        while batch:
+            self._send(batch)
+            batch = self._drain()
+
+
+# --- TRACER ---
+
+class Tracer:
+    """
+    Creates spans and decides which traces to export
+
+    A trace is kept if its root span was head-sampled (`sample_rate`) or if
+    the root took at least `slow_ms`. Spans are buffered per trace until the
+    root finishes, then exported together.
+    """
+
+    def __init__(self, exporter=None, sample_rate: float = 0.0, slow_ms: Optional[float] = None):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.enabled = exporter is not None and (sample_rate > 0 or slow_ms is not None)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Open a span as a child of the current one (or a new root)."""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        if parent is None:
+            trace_id = os.urandom(16).hex()
+            current = Span(name, trace_id, None, [], attributes)
+            current.attributes["sampled"] = random.random() < self.sample_rate
+        else:
+            current = Span(name, parent.trace_id, parent.span_id, parent._buffer, attributes)
+
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            current.end = time.time()
+            current._buffer.append(current)
+            if parent is None:
+                self._finish_trace(current)
+
+    def _finish_trace(self, root: Span):
+        keep = root.attributes["sampled"] or (self.slow_ms is not None and root.duration_ms >= self.slow_ms)
+        if keep:
+            try:
+                self.exporter.export([s.to_dict() for s in root._buffer])
+            except Exception as e:
+                print(f"⚠️ Trace export failed: {e}")
+        root._buffer.clear()
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+def _tracer_from_env() -> Tracer:
+    sample_rate = float(os.environ.get("GOODFOODS_TRACE_SAMPLE", "0"))
+    slow_ms = os.environ.get("GOODFOODS_TRACE_SLOW_MS")
+    return configure_tracing(sample_rate, float(slow_ms) if slow_ms else None)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure_tracing(
+    sample_rate: float = 0.0,
+    slow_ms: Optional[float] = None,
+    path: Optional[str] = None,
+    otlp_endpoint: Optional[str] = None
+) -> Tracer:
+    """
+    Install the process-wide tracer
+
+    Args:
+        sample_rate: Fraction of root spans (turns) to keep
+        slow_ms: Also keep any trace whose root took at least this long
+        path: JSON-lines output file (defaults to GOODFOODS_TRACE_FILE)
+        otlp_endpoint: Collector URL; overrides the file exporter
+            (defaults to GOODFOODS_TRACE_OTLP)
+
+    Returns:
+        The active Tracer
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+
+    otlp_endpoint = otlp_endpoint or os.environ.get("GOODFOODS_TRACE_OTLP")
+    if otlp_endpoint:
+        exporter = OTLPExporter(otlp_endpoint)
+    else:
+        exporter = JsonlExporter(path or os.environ.get("GOODFOODS_TRACE_FILE", TRACE_FILE))
+
+    _tracer = Tracer(exporter, sample_rate=sample_rate, slow_ms=slow_ms)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    """Return the active tracer, configuring it from the environment on first use."""
+    if _tracer is None:
+        return _tracer_from_env()
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """Open a span on the active tracer (context manager)."""
+    return get_tracer().span(name, **attributes)
+
+
+def current_span():
+    """The span active in this context, or a no-op span."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def traced(name: str) -> Callable:
+    """Decorator that wraps each call of a function in a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- OFFLINE VIEWER / COLLECTOR STAND-IN ---
+
+def load_traces(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Group the spans in a JSON-lines file by trace ID."""
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                s = json.loads(line)
+                traces.setdefault(s["trace_id"], []).append(s)
+    return traces
+
+
+def format_trace(spans: List[Dict[str, Any]]) -> str:
+    """Render one trace as an indented tree with durations."""
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for s in sorted(spans, key=lambda s: s["start"]):
+        children.setdefault(s["parent_id"], []).append(s)
+    t0 = min(s["start"] for s in spans)
+
+    lines = []
+
+    def walk(parent_id, depth):
+        for s in children.get(parent_id, []):
+            attrs = {k: v for k, v in s["attributes"].items() if k != "sampled"}
+            flag = " ❌" if s["status"] == "error" else ""
+            offset = (s["start"] - t0) * 1000
+            lines.append(f"{'  ' * depth}{s['name']:<{40 - 2 * depth}} +{offset:8.1f}ms {s['duration_ms']:9.1f}ms{flag} {attrs if attrs else ''}")
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def serve_collector(port: int = 4318, output: str = TRACE_FILE, host: str = "127.0.0.1"):
+    """Accept OTLP/JSON posts on /v1/traces and append the spans to `output`."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    exporter = JsonlExporter(output)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.startswith("/v1/traces"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            exporter.export(from_otlp(json.loads(body)))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"📡 Collecting traces on http://{host}:{port}/v1/traces -> {output}")
+    ThreadingHTTPServer((host, port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="GoodFoods trace collector and viewer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run an OTLP/JSON collector stand-in")
+    serve.add_argument("--port", type=int, default=4318)
+    serve.add_argument("--output", default=TRACE_FILE)
+
+    show = commands.add_parser("show", help="Print traces from a JSON-lines file")
+    show.add_argument("path", nargs="?", default=TRACE_FILE)
+    show.add_argument("--slowest", type=int, default=5, help="Number of slowest traces to print")
+    show.add_argument("--trace", help="Print a single trace by ID")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve_collector(args.port, args.output)
+    else:
+        traces = load_traces(args.path)
+        if args.trace:
+            selected = [traces[args.trace]]
+        else:
+            def root_ms(spans):
+                return max(s["duration_ms"] for s in spans if s["parent_id"] is None) if any(s["parent_id"] is None for s in spans) else 0
+            selected = sorted(traces.values(), key=root_ms, reverse=True)[:args.slowest]
+        print(f"🔍 {len(traces)} traces in {args.path}")
+        for spans in selected:
+            print(f"\n--- trace {spans[0]['trace_id']} ---")
+            print(format_trace(spans))
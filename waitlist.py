@@ -0,0 +1,335 @@
+"""
+Waitlist for Fully Booked GoodFoods Slots
+
+Guests who find a slot full can queue for it instead of retrying. Each
+(branch, date, time) slot has its own queue ordered by priority, then
+join time; when seats free up (a cancellation or a change) the first
+parties that fit are booked automatically:
+
+    waitlist = Waitlist("waitlist.db")
+    entry = waitlist.join(12, "2025-12-24", "19:30", 4, "Asha Rao", "+919876543210")
+    waitlist.position(entry["waitlist_id"])     # -> 1
+    waitlist.promote(12, "2025-12-24", "19:30", seats_left=6, book=book_entry)
+
+Entries are kept in SQLite (WAL mode, like the session store), so they
+survive restarts and every worker process shares the same queues: a
+guest queued through one worker is promoted when another worker handles
+the cancellation. Queues are read through an index on (slot, status,
+priority, join order), so a party's position is one indexed count.
+Promotion claims the next party in a short transaction and books it
+outside of it; entries for slots that have passed are purged.
+Configured from the environment:
+
+    GOODFOODS_WAITLIST_DB=waitlist.db   SQLite file (default: in the data directory)
+    GOODFOODS_WAITLIST_MAX=1000         parties queued per slot
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time as time_module
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from data_paths import data_path
+from metrics import REGISTRY
+
+WAITLIST_DB_FILE = data_path("waitlist.db")
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+# A party claimed for booking by a process that died returns to the queue after this long
+CLAIM_TIMEOUT = 60.0
+# Past slots are purged at most this often
+PURGE_INTERVAL = 3600.0
+
+# "booking" is a claimed party still in the queue; guests see it as waiting
+QUEUED = ("waiting", "booking")
+
+WAITLIST_EVENTS = REGISTRY.counter("goodfoods_waitlist_events_total", "Waitlist joins, departures and promotions", ["event"])
+
+
+class WaitlistFull(Exception):
+    """The slot's queue has reached its size limit"""
+
+
+class Waitlist:
+    """
+    Per-slot queues of parties waiting for seats, shared by all worker processes
+
+    Args:
+        path: SQLite database file
+        max_per_slot: Parties queued per (branch, date, time) before join() refuses
+    """
+
+    def __init__(self, path: str = WAITLIST_DB_FILE, max_per_slot: int = 1000):
+        self.path = path
+        self.max_per_slot = max_per_slot
+        self._local = threading.local()
+        self._purged_at = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS waitlist ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " waitlist_id TEXT NOT NULL UNIQUE,"
+            " branch_id INTEGER NOT NULL,"
+            " date TEXT NOT NULL,"
+            " time TEXT NOT NULL,"
+            " party_size INTEGER NOT NULL,"
+            " customer_name TEXT,"
+            " customer_phone TEXT,"
+            " occasion TEXT,"
+            " priority INTEGER NOT NULL,"
+            " joined_at TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " claimed_at REAL,"
+            " reservation_id TEXT,"
+            " promoted_at TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS waitlist_queue ON waitlist (branch_id, date, time, status, priority, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS waitlist_date ON waitlist (date)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the write lock first, so check-then-write is atomic across processes."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def join(
+        self,
+        branch_id: int,
+        date: str,
+        time: str,
+        party_size: int,
+        customer_name: str,
+        customer_phone: str,
+        priority: int = PRIORITY_NORMAL,
+        occasion: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue a party for a slot
+
+        A phone already waiting for the slot gets its existing entry back.
+
+        Args:
+            branch_id: Branch ID
+            date: Slot date (YYYY-MM-DD)
+            time: Slot time (HH:MM)
+            party_size: Number of people
+            customer_name: Guest's full name
+            customer_phone: Guest's phone (E.164)
+            priority: PRIORITY_HIGH or PRIORITY_NORMAL (lower is served first)
+            occasion: Occasion carried over to the booking
+
+        Returns:
+            A copy of the entry, including its current `position`
+
+        Raises:
+            WaitlistFull: The slot already has max_per_slot parties waiting
+        """
+        self._purge_if_due()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT waitlist_id FROM waitlist WHERE branch_id = ? AND date = ? AND time = ?"
+                " AND customer_phone = ? AND status IN (?, ?)",
+                (branch_id, date, time, customer_phone, *QUEUED)
+            ).fetchone()
+            if row is not None:
+                waitlist_id = row["waitlist_id"]
+            else:
+                queued = self._count_queued(conn, branch_id, date, time)
+                if queued >= self.max_per_slot:
+                    raise WaitlistFull(f"{queued} parties are already waiting for this time")
+                waitlist_id = f"WL-{random.randint(100000, 999999)}"
+                while conn.execute("SELECT 1 FROM waitlist WHERE waitlist_id = ?", (waitlist_id,)).fetchone():
+                    waitlist_id = f"WL-{random.randint(100000, 999999)}"
+                conn.execute(
+                    "INSERT INTO waitlist (waitlist_id, branch_id, date, time, party_size, customer_name,"
+                    " customer_phone, occasion, priority, joined_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'waiting')",
+                    (waitlist_id, branch_id, date, time, party_size, customer_name, customer_phone, occasion,
+                     priority, datetime.now().isoformat())
+                )
+                WAITLIST_EVENTS.inc(event="join")
+        return self.get(waitlist_id)
+
+    def get(self, waitlist_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of an entry (with `position` while waiting), or None."""
+        row = self._conn().execute("SELECT * FROM waitlist WHERE waitlist_id = ?", (waitlist_id,)).fetchone()
+        if row is None:
+            return None
+        return self._snapshot(row)
+
+    def position(self, waitlist_id: str) -> Optional[int]:
+        """1-based place in the slot's queue, or None if not waiting."""
+        row = self._conn().execute("SELECT * FROM waitlist WHERE waitlist_id = ?", (waitlist_id,)).fetchone()
+        if row is None or row["status"] not in QUEUED:
+            return None
+        return self._position(row)
+
+    def leave(self, waitlist_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Take a party off the waitlist
+
+        Returns:
+            A copy of the entry, or None if it is not waiting
+        """
+        with self._transaction() as conn:
+            left = conn.execute(
+                "UPDATE waitlist SET status = 'left' WHERE waitlist_id = ? AND status = 'waiting'", (waitlist_id,)
+            ).rowcount
+        if not left:
+            return None
+        WAITLIST_EVENTS.inc(event="leave")
+        return self.get(waitlist_id)
+
+    def promote(
+        self,
+        branch_id: int,
+        date: str,
+        time: str,
+        seats_left: int,
+        book: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Book waiting parties into freed seats, in queue order
+
+        Parties larger than the seats left are skipped (they keep their
+        place); smaller ones behind them can still be seated. Stops when
+        the seats run out or `book` can't seat a party. Each party is
+        claimed in its own short transaction and booked outside it, so
+        other workers can keep reading and joining the queue meanwhile.
+
+        Args:
+            branch_id: Branch ID
+            date: Slot date (YYYY-MM-DD)
+            time: Slot time (HH:MM)
+            seats_left: Seats currently free in the slot
+            book: Books an entry; returns the saved reservation, or None if it no longer fits
+
+        Returns:
+            Copies of the promoted entries
+        """
+        promoted = []
+        while seats_left > 0:
+            entry = self._claim(branch_id, date, time, seats_left)
+            if entry is None:
+                break
+            try:
+                reservation = book(entry)
+            except BaseException:
+                self._unclaim(entry["waitlist_id"])
+                raise
+            if reservation is None:
+                self._unclaim(entry["waitlist_id"])
+                break
+            with self._transaction() as conn:
+                conn.execute(
+                    "UPDATE waitlist SET status = 'promoted', reservation_id = ?, promoted_at = ?, claimed_at = NULL"
+                    " WHERE waitlist_id = ?",
+                    (reservation["reservation_id"], datetime.now().isoformat(), entry["waitlist_id"])
+                )
+            seats_left -= entry["party_size"]
+            WAITLIST_EVENTS.inc(event="promote")
+            promoted.append(self.get(entry["waitlist_id"]))
+        return promoted
+
+    def _claim(self, branch_id: int, date: str, time: str, seats_left: int) -> Optional[Dict[str, Any]]:
+        """Mark the first waiting party that fits as being booked; return it, or None."""
+        now = time_module.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM waitlist WHERE branch_id = ? AND date = ? AND time = ? AND status IN (?, ?)"
+                " AND party_size <= ? AND (status = 'waiting' OR claimed_at < ?)"
+                " ORDER BY priority, seq LIMIT 1",
+                (branch_id, date, time, *QUEUED, seats_left, now - CLAIM_TIMEOUT)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE waitlist SET status = 'booking', claimed_at = ? WHERE seq = ?", (now, row["seq"]))
+        return {k: row[k] for k in row.keys() if k not in ("seq", "claimed_at")}
+
+    def _unclaim(self, waitlist_id: str):
+        """Put a claimed party back in the queue, in its old place."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE waitlist SET status = 'waiting', claimed_at = NULL WHERE waitlist_id = ? AND status = 'booking'",
+                (waitlist_id,)
+            )
+
+    def waiting(self, branch_id: int, date: str, time: str) -> int:
+        """Number of parties waiting for a slot."""
+        return self._count_queued(self._conn(), branch_id, date, time)
+
+    def purge(self, before_date: Optional[str] = None) -> int:
+        """
+        Delete every entry for slots dated before `before_date` (default: today)
+
+        Returns:
+            Number of entries deleted
+        """
+        before_date = before_date or datetime.now().strftime("%Y-%m-%d")
+        with self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM waitlist WHERE date < ?", (before_date,)).rowcount
+        self._purged_at = time_module.time()
+        return deleted
+
+    def _purge_if_due(self):
+        if time_module.time() - self._purged_at >= PURGE_INTERVAL:
+            self.purge()
+
+    def _count_queued(self, conn: sqlite3.Connection, branch_id: int, date: str, time: str) -> int:
+        return conn.execute(
+            "SELECT COUNT(*) FROM waitlist WHERE branch_id = ? AND date = ? AND time = ? AND status IN (?, ?)",
+            (branch_id, date, time, *QUEUED)
+        ).fetchone()[0]
+
+    def _position(self, row: sqlite3.Row) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM waitlist WHERE branch_id = ? AND date = ? AND time = ? AND status IN (?, ?)"
+            " AND (priority < ? OR (priority = ? AND seq <= ?))",
+            (row["branch_id"], row["date"], row["time"], *QUEUED, row["priority"], row["priority"], row["seq"])
+        ).fetchone()[0]
+
+    def _snapshot(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Public copy of an entry."""
+        snapshot = {k: row[k] for k in row.keys() if k not in ("seq", "claimed_at")}
+        if snapshot["status"] == "booking":
+            snapshot["status"] = "waiting"
+        snapshot["position"] = self._position(row) if row["status"] in QUEUED else None
+        return snapshot
+
+
+_waitlist: Optional[Waitlist] = None
+_waitlist_lock = threading.Lock()
+
+
+def get_waitlist() -> Waitlist:
+    """Return the process-wide waitlist, configuring it from the environment on first use."""
+    global _waitlist
+    with _waitlist_lock:
+        if _waitlist is None:
+            _waitlist = Waitlist(
+                path=os.environ.get("GOODFOODS_WAITLIST_DB", WAITLIST_DB_FILE),
+                max_per_slot=int(os.environ.get("GOODFOODS_WAITLIST_MAX", "1000"))
+            )
+        return _waitlist